@@ -1,15 +1,21 @@
 from django.contrib import admin
 from .models import Book, Volume, Chapter, Genre, Status, Comment, Reply
 from .models import Report
-from .forms import ChapterAdminForm
-from django.urls import path
+from .forms import ChapterAdminForm, ChapterBrowseForm
+from .services.chapters import browse_book_chapters, delete_chapters
+from .services.comments import (
+    clear_reports, delete_comment, delete_reply, get_comment, get_reply, get_reports, most_reported, parse_report_ref,
+)
+from django.urls import path, reverse
 from django.http import JsonResponse, HttpResponseRedirect
 from django import forms
 from django.conf import settings
 import os
+import uuid
 from django.utils import timezone
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
+from django.core.exceptions import PermissionDenied
 from django.template.response import TemplateResponse
 
 class VolumeInline(admin.TabularInline):
@@ -31,6 +37,14 @@ class ChapterAdmin(admin.ModelAdmin):
     search_fields = ('name', 'content')
 
     actions = ['delete_selected']
+    list_per_page = 50
+
+    def get_object(self, request, object_id, from_field=None):
+        # The default queryset.get() overwrites book_id with the chapter id (see api.views.Book.find_chapter)
+        try:
+            return Chapter.objects.filter(id=uuid.UUID(str(object_id))).first()
+        except ValueError:
+            return None
 
     def get_urls(self):
         urls = super().get_urls()
@@ -40,16 +54,39 @@ class ChapterAdmin(admin.ModelAdmin):
             path('change/<uuid:chapter_id>/', self.admin_site.admin_view(self.chapter_change_view), name='chapter_change'),
             path('delete/', self.admin_site.admin_view(self.chapter_delete_selected), name='chapter_delete_selected'),
             path('ajax/load-volumes/', self.admin_site.admin_view(self.load_volumes), name='ajax_load_volumes'),
+            path('ajax/search-books/', self.admin_site.admin_view(self.search_books), name='ajax_search_books'),
         ]
         return custom_urls + urls
 
     def chapter_list_view(self, request):
+        form = ChapterBrowseForm(request.GET)
+        book = None
+        if form.is_valid() and form.cleaned_data['book_id']:
+            book = Book.objects.filter(id=form.cleaned_data['book_id']).first()
+        if book is None:
+            # Never browse the whole chapter table: fall back to the latest updated book
+            book = Book.objects.order_by('-date_updated').first()
+            form = ChapterBrowseForm(initial={'book_id': book.id if book else None, 'q': request.GET.get('q', '')})
+
         search_query = request.GET.get('q', '')
-        chapters = Chapter.objects.all()
-        if search_query:
-            chapters = chapters.filter(name__icontains=search_query)
+        chapters, next_cursor = [], None
+        if book is not None:
+            chapters, next_cursor = browse_book_chapters(
+                book.id, self.list_per_page, cursor=request.GET.get('cursor'), query=search_query)
+
+        next_url = None
+        if next_cursor:
+            params = request.GET.copy()
+            params['book_id'] = str(book.id)
+            params['cursor'] = next_cursor
+            next_url = f"?{params.urlencode()}"
+
         context = {
             'chapters': chapters,
+            'book': book,
+            'form': form,
+            'next_url': next_url,
+            'is_first_page': not request.GET.get('cursor'),
             'opts': self.model._meta,
             'app_label': self.model._meta.app_label,
             'search_query': search_query,
@@ -92,12 +129,24 @@ class ChapterAdmin(admin.ModelAdmin):
 
     def chapter_delete_selected(self, request):
         if request.method == 'POST':
-            selected_ids = request.POST.getlist('_selected_action')
-            for chapter_id in selected_ids:
-                chapter = get_object_or_404(Chapter, id=chapter_id)
-                chapter.delete()
-            messages.success(request, "Successfully deleted selected chapters.")
-            return redirect('admin:chapter_list')
+            book_id = request.POST.get('book_id')
+            keys = []
+            for value in request.POST.getlist('_selected_action'):
+                number, _, chapter_id = value.partition(':')
+                if number.isdigit() and chapter_id:
+                    keys.append((int(number), chapter_id))
+            try:
+                book_id = uuid.UUID(book_id)
+            except (TypeError, ValueError):
+                messages.error(request, "No book selected.")
+                return redirect('admin:chapter_list')
+
+            deleted, failures = delete_chapters(book_id, keys)
+            if failures:
+                messages.warning(request, f"Deleted {len(deleted)} chapters, {len(failures)} could not be deleted.")
+            else:
+                messages.success(request, f"Successfully deleted {len(deleted)} chapters.")
+            return redirect(f"{reverse('admin:chapter_list')}?book_id={book_id}")
         return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
 
     def load_volumes(self, request):
@@ -105,6 +154,16 @@ class ChapterAdmin(admin.ModelAdmin):
         volumes = Volume.objects.filter(book_id=book_id).all()
         return JsonResponse(list(volumes.values('id', 'name')), safe=False)
 
+    def search_books(self, request):
+        query = request.GET.get('q', '').strip()
+        if len(query) < 2:
+            return JsonResponse([], safe=False)
+        try:
+            books = Book.objects.filter(id=uuid.UUID(query))
+        except ValueError:
+            books = Book.objects.filter(title__istartswith=query).order_by('title')
+        return JsonResponse(list(books.values('id', 'title')[:20]), safe=False)
+
 
 
 class VolumeAdmin(admin.ModelAdmin):
@@ -125,11 +184,86 @@ class StatusAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 
+class ReportAdmin(admin.ModelAdmin):
+    # The changelist is the moderation queue: comments and replies by report count, from Redis
+    list_per_page = 50
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('resolve/', self.admin_site.admin_view(self.resolve_reports), name='report_resolve'),
+        ]
+        return custom_urls + urls
+
+    def load_target(self, ref):
+        chapter_id, comment_id, reply_id = parse_report_ref(ref)
+        if reply_id is None:
+            return get_comment(chapter_id, comment_id)
+        reply = get_reply(comment_id, reply_id)
+        return reply if reply is not None and reply['chapter_id'] == chapter_id else None
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        try:
+            offset = max(0, int(request.GET.get('offset', 0)))
+        except ValueError:
+            offset = 0
+        entries = []
+        for ref, count in most_reported(self.list_per_page + 1, offset):
+            target = self.load_target(ref)
+            reasons = [row['reason'] for row in get_reports(target['id'])[:5] if row['reason']] if target else []
+            entries.append({'ref': ref, 'count': count, 'target': target, 'reasons': reasons})
+
+        context = {
+            'entries': entries[:self.list_per_page],
+            'next_offset': offset + self.list_per_page if len(entries) > self.list_per_page else None,
+            'previous_offset': max(0, offset - self.list_per_page) if offset else None,
+            'opts': self.model._meta,
+            'app_label': self.model._meta.app_label,
+            'has_delete_permission': self.has_delete_permission(request),
+            'has_change_permission': self.has_change_permission(request),
+        }
+        return render(request, 'admin/report_list.html', context)
+
+    def resolve_reports(self, request):
+        if request.method != 'POST':
+            return redirect('admin:api_report_changelist')
+        refs = request.POST.getlist('_selected_action')
+        delete = request.POST.get('action') == 'delete'
+        # Deleting removes the comment or reply itself; dismissing only changes the queue
+        if not (self.has_delete_permission(request) if delete else self.has_change_permission(request)):
+            raise PermissionDenied
+        for ref in refs:
+            _, comment_id, reply_id = parse_report_ref(ref)
+            target = self.load_target(ref) if delete else None
+            if target is None:
+                clear_reports(reply_id or comment_id, ref)
+            elif reply_id is None:
+                delete_comment(target)
+            else:
+                delete_reply(target)
+        messages.success(request, f"{'Deleted' if delete else 'Dismissed'} {len(refs)} reported items.")
+        return redirect('admin:api_report_changelist')
+
+
+class CommentAdmin(admin.ModelAdmin):
+    # Comments are partitioned by chapter and time; moderators start from the report queue
+    def has_add_permission(self, request):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        return redirect('admin:api_report_changelist')
+
+
 admin.site.register(Book, BookAdmin)
 admin.site.register(Volume, VolumeAdmin)
 admin.site.register(Chapter, ChapterAdmin)
 admin.site.register(Genre, GenreAdmin)
 admin.site.register(Status, StatusAdmin)
-admin.site.register(Comment)
-admin.site.register(Reply)
-admin.site.register(Report)
+admin.site.register(Comment, CommentAdmin)
+admin.site.register(Reply, CommentAdmin)
+admin.site.register(Report, ReportAdmin)
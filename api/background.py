@@ -0,0 +1,41 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def log_failure(future):
+    error = future.exception()
+    if error is not None:
+        logger.error("Background task failed: %s", error, exc_info=error)
+
+
+def run_closing(fn, args, kwargs):
+    # No request cycle closes the connections these threads open; stale or expired ones would be reused
+    close_old_connections()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def submit(fn, *args, **kwargs):
+    """Run fn after the response path, on a small per-worker thread pool."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'BACKGROUND_WORKERS', 4), thread_name_prefix='api-background')
+    future = _executor.submit(run_closing, fn, args, kwargs)
+    future.add_done_callback(log_failure)
+    return future
+
+
+def reset_after_fork():
+    # The pool's threads were not copied into the child; a new pool starts on the next submit
+    global _executor
+    _executor = None
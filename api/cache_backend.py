@@ -0,0 +1,272 @@
+import fnmatch
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django_redis.cache import RedisCache
+
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = 'cache:stats'
+STATS_FIELDS = ('near_hits', 'near_misses', 'redis_hits', 'redis_misses')
+CLEAR_ALL = '*'
+MISSING = object()
+
+
+class NearCache:
+    """Bounded LRU of encoded values, each kept for at most ttl seconds."""
+
+    def __init__(self, max_entries, ttl):
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Bumped by every invalidation, so a read racing one is not stored
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return MISSING
+            value, expires = item
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, since):
+        with self.lock:
+            if since != self.invalidations:
+                return
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, keys):
+        with self.lock:
+            self.invalidations += 1
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.invalidations += 1
+            self.entries.clear()
+
+
+class TwoTierRedisCache(RedisCache):
+    """
+    django_redis cache with a near cache in each worker for hot keys.
+
+    Keys matching the fnmatch patterns in OPTIONS['NEAR_CACHE']['KEYS'] are
+    kept in a bounded in-process LRU (MAX_ENTRIES) for up to TTL seconds.
+    Writes through this backend drop them locally and publish the keys on
+    CHANNEL, so every other worker drops them too; TTL bounds staleness when
+    a message is lost, and a worker whose subscription drops clears its near
+    cache. Other keys go straight to Redis, as with RedisCache.
+
+    Hits and misses per tier are counted per worker and added to the
+    cache:stats hash every STATS_INTERVAL seconds (see cache_stats).
+    """
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        options = params.get('OPTIONS', {}).get('NEAR_CACHE', {})
+        patterns = options.get('KEYS', ())
+        self.hot_keys = re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns)) if patterns else None
+        self.near = NearCache(options.get('MAX_ENTRIES', 1000), options.get('TTL', 5))
+        self.channel = options.get('CHANNEL', 'cache:invalidate')
+        self.stats_interval = options.get('STATS_INTERVAL', 10)
+        self.stats = dict.fromkeys(STATS_FIELDS, 0)
+        self.next_report = time.monotonic() + self.stats_interval
+        self.origin = None
+        self.pid = None
+        self.fork_lock = threading.Lock()
+
+    def check_process(self):
+        # Near entries, stats and the subscriber thread belong to one process: start over after a fork
+        if self.pid == os.getpid():
+            return
+        with self.fork_lock:
+            if self.pid == os.getpid():
+                return
+            self.near.clear()
+            self.stats = dict.fromkeys(STATS_FIELDS, 0)
+            self.origin = uuid.uuid4().hex
+            self.pid = os.getpid()
+            if self.hot_keys is not None:
+                threading.Thread(target=self.listen, args=(self.pid,), name='near-cache-invalidation',
+                                 daemon=True).start()
+
+    def near_key(self, key, version):
+        if self.hot_keys is None or not self.hot_keys.match(key):
+            return None
+        return f"{self.version if version is None else version}:{key}"
+
+    def count(self, field, amount=1):
+        self.stats[field] += amount
+        if time.monotonic() >= self.next_report:
+            self.next_report = time.monotonic() + self.stats_interval
+            self.report_stats()
+
+    def report_stats(self):
+        stats, self.stats = self.stats, dict.fromkeys(STATS_FIELDS, 0)
+        if not any(stats.values()):
+            return
+        try:
+            pipe = self.client.get_client().pipeline(transaction=False)
+            for field, amount in stats.items():
+                if amount:
+                    pipe.hincrby(STATS_KEY, field, amount)
+            pipe.execute()
+        except Exception as e:
+            logger.warning("Could not report cache stats: %s", e)
+
+    def get(self, key, default=None, version=None, client=None):
+        self.check_process()
+        near_key = self.near_key(key, version) if client is None else None
+        if near_key is not None:
+            value = self.near.get(near_key)
+            if value is not MISSING:
+                self.count('near_hits')
+                return self.client.decode(value)
+            self.count('near_misses')
+            since = self.near.invalidations
+
+        value = super().get(key, MISSING, version, client)
+        if value is MISSING:
+            self.count('redis_misses')
+            return default
+        self.count('redis_hits')
+        if near_key is not None:
+            self.near.set(near_key, self.client.encode(value), since)
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        self.check_process()
+        found, remote = {}, {}
+        since = self.near.invalidations
+        for key in keys:
+            near_key = self.near_key(key, version) if client is None else None
+            value = MISSING if near_key is None else self.near.get(near_key)
+            if value is MISSING:
+                if near_key is not None:
+                    self.count('near_misses')
+                remote[key] = near_key
+            else:
+                self.count('near_hits')
+                found[key] = self.client.decode(value)
+
+        if remote:
+            fetched = super().get_many(list(remote), version=version, client=client)
+            self.count('redis_hits', len(fetched))
+            self.count('redis_misses', len(remote) - len(fetched))
+            for key, value in fetched.items():
+                if remote[key] is not None:
+                    self.near.set(remote[key], self.client.encode(value), since)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None, nx=False, xx=False):
+        result = super().set(key, value, timeout=timeout, version=version, client=client, nx=nx, xx=xx)
+        if result:
+            self.invalidate_near([key], version)
+        return result
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().add(key, value, timeout=timeout, version=version, client=client)
+        if result:
+            self.invalidate_near([key], version)
+        return result
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().set_many(data, timeout=timeout, version=version, client=client)
+        self.invalidate_near(data, version)
+        return result
+
+    def delete(self, key, version=None, prefix=None, client=None):
+        result = super().delete(key, version=version, prefix=prefix, client=client)
+        self.invalidate_near([key], version)
+        return result
+
+    def delete_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        result = super().delete_many(keys, version=version, client=client)
+        self.invalidate_near(keys, version)
+        return result
+
+    def incr(self, key, delta=1, version=None, client=None, ignore_key_check=False):
+        result = super().incr(key, delta=delta, version=version, client=client, ignore_key_check=ignore_key_check)
+        self.invalidate_near([key], version)
+        return result
+
+    def decr(self, key, delta=1, version=None, client=None):
+        result = super().decr(key, delta=delta, version=version, client=client)
+        self.invalidate_near([key], version)
+        return result
+
+    def incr_version(self, key, delta=1, version=None, client=None):
+        result = super().incr_version(key, delta=delta, version=version, client=client)
+        self.invalidate_near([key], version)
+        return result
+
+    def delete_pattern(self, pattern, *args, **kwargs):
+        result = super().delete_pattern(pattern, *args, **kwargs)
+        self.near.clear()
+        self.publish([CLEAR_ALL])
+        return result
+
+    def clear(self):
+        result = super().clear()
+        self.near.clear()
+        self.publish([CLEAR_ALL])
+        return result
+
+    def invalidate_near(self, keys, version):
+        near_keys = [near_key for near_key in (self.near_key(key, version) for key in keys) if near_key is not None]
+        if near_keys:
+            self.check_process()
+            self.near.discard(near_keys)
+            self.publish(near_keys)
+
+    def publish(self, near_keys):
+        if self.hot_keys is None:
+            return
+        try:
+            self.client.get_client().publish(self.channel, '\n'.join([self.origin or '', *near_keys]))
+        except Exception as e:
+            # Other workers see the write once their entries expire
+            logger.warning("Could not publish near cache invalidation: %s", e)
+
+    def receive(self, data):
+        origin, *near_keys = data.decode().split('\n')
+        if origin == self.origin:
+            return
+        if CLEAR_ALL in near_keys:
+            self.near.clear()
+        else:
+            self.near.discard(near_keys)
+
+    def listen(self, pid):
+        while self.pid == pid:
+            try:
+                pubsub = self.client.get_client(write=False).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Whatever was published before the subscription is lost
+                self.near.clear()
+                while self.pid == pid:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self.receive(message['data'])
+            except Exception as e:
+                logger.warning("Near cache invalidation channel lost, retrying: %s", e)
+                self.near.clear()
+                time.sleep(1)
@@ -0,0 +1,97 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+
+def get_generation_timeout():
+    # Generations may expire: a lost key only starts a new generation (a miss)
+    return getattr(settings, 'CACHE_GENERATION_TIMEOUT', 60 * 60 * 24 * 7)
+
+
+def generation_key(scope):
+    return f"gen:{scope}"
+
+
+def get_generation(scope):
+    """
+    Generation of a cache scope (e.g. "book:<id>", "volume:<id>"). The value is
+    the time of the last bump, so it doubles as a Last-Modified timestamp. A
+    missing key starts a new generation, which only costs a cache miss.
+    """
+    key = generation_key(scope)
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, time.time(), timeout=get_generation_timeout())
+        value = cache.get(key)
+    return value
+
+
+def get_generations(*scopes):
+    keys = {generation_key(scope): scope for scope in scopes}
+    values = cache.get_many(list(keys))
+    missing = [key for key in keys if key not in values]
+    if missing:
+        now = time.time()
+        for key in missing:
+            cache.add(key, now, timeout=get_generation_timeout())
+        values.update(cache.get_many(missing))
+    return tuple(values.get(key) for key in keys)
+
+
+def bump_generation(*scopes):
+    now = time.time()
+    cache.set_many({generation_key(scope): now for scope in scopes if scope}, timeout=get_generation_timeout())
+
+
+def invalidate(*scopes):
+    """Start new generations for the scopes and purge proxy cache entries tagged with them."""
+    from .surrogate import purge_surrogate_keys
+    scopes = [scope for scope in scopes if scope]
+    bump_generation(*scopes)
+    purge_surrogate_keys(*scopes)
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_single_flight_timeout():
+    return getattr(settings, 'SINGLE_FLIGHT_TIMEOUT', 10)
+
+
+def single_flight(key, fetch):
+    """
+    Run fetch() for a cache miss at most once at a time per key in this worker.
+    Callers missing the same key meanwhile wait and get the same result; if
+    the fetch fails or outlasts SINGLE_FLIGHT_TIMEOUT they fetch themselves.
+    Returns (result, fetched_here).
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+
+    if not leader:
+        if flight.done.wait(get_single_flight_timeout()) and not flight.failed:
+            return flight.result, False
+        return fetch(), True
+
+    try:
+        flight.result = fetch()
+        return flight.result, True
+    except BaseException:
+        flight.failed = True
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
@@ -0,0 +1,84 @@
+import logging
+from cassandra.cqlengine import connection, models
+from django_cassandra_engine.apps import AppConfig
+from django_cassandra_engine.utils import get_cassandra_connections
+from .background import submit
+
+
+logger = logging.getLogger(__name__)
+
+# Connections registered here; stand-in sessions set from outside are left alone
+_lazy_aliases = set()
+
+
+class LazyCassandraConfig(AppConfig):
+    """
+    django_cassandra_engine opens its connections while the apps load, and
+    with an Astra secure connect bundle it does so even when lazy_connect is
+    set. This registers them with cqlengine as lazy connections instead, so
+    the cluster is set up by the first query (or connect_in_background).
+    """
+
+    def connect(self):
+        aliases = [alias for alias, _ in get_cassandra_connections()]
+        for alias, wrapper in get_cassandra_connections():
+            register_lazy_connection(alias, wrapper.settings_dict, default=alias == 'default' or len(aliases) == 1)
+
+
+class LazyConnection(connection.Connection):
+    """A cqlengine connection that applies OPTIONS['session'] to each session it sets up."""
+
+    def __init__(self, name, hosts, session_options=None, **kwargs):
+        super().__init__(name, hosts, **kwargs)
+        self.session_options = dict(session_options or {})
+
+    def setup_session(self):
+        super().setup_session()
+        for option, value in self.session_options.items():
+            setattr(self.session, option, value)
+
+
+def register_lazy_connection(alias, settings_dict, default):
+    if alias in connection._connections:
+        return  # registered before the apps loaded, e.g. a stand-in session
+    options = settings_dict.get('OPTIONS', {})
+    cluster_options = dict(options.get('connection', {}))
+    consistency = cluster_options.pop('consistency', None)
+    retry_connect = cluster_options.pop('retry_connect', False)
+    cluster_options.pop('lazy_connect', None)
+    cluster_options.pop('default', None)
+    if default:
+        models.DEFAULT_KEYSPACE = settings_dict['NAME']
+    hosts = [host for host in (settings_dict.get('HOST') or '').split(',') if host]
+    # As connection.register_connection does, with a connection class that carries the session options
+    connection._connections[alias] = LazyConnection(
+        alias, hosts, session_options=options.get('session'), consistency=consistency,
+        retry_connect=retry_connect, lazy_connect=True, cluster_options=cluster_options)
+    if default:
+        connection.set_default_connection(alias)
+    _lazy_aliases.add(alias)
+
+
+def connect_cassandra(alias=None):
+    return connection.get_session(alias)
+
+
+def connect_in_background(alias=None):
+    """Set up the lazy connection on the background pool, so the first request does not wait for it."""
+    return submit(connect_cassandra, alias)
+
+
+def reset_after_fork():
+    """
+    Drop sessions inherited from a parent process without shutting them down
+    (their sockets and event loop thread are the parent's), so each lazy
+    connection sets up its own cluster on first use in this process.
+    """
+    for alias in _lazy_aliases:
+        conn = connection._connections.get(alias)
+        if conn is None or conn.session is None:
+            continue
+        if connection.session is conn.session:
+            connection.cluster = connection.session = None
+        conn.session = conn.cluster = None
+        conn.lazy_connect = True
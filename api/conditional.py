@@ -0,0 +1,46 @@
+from calendar import timegm
+from datetime import datetime, time, timezone as dt_timezone
+from functools import wraps
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def last_modified_from(date_updated=None, *generations):
+    """Latest of a DateField value and generation timestamps, as a UTC datetime."""
+    candidates = [datetime.fromtimestamp(value, tz=dt_timezone.utc) for value in generations if value]
+    if date_updated:
+        candidates.append(datetime.combine(date_updated, time.min, tzinfo=dt_timezone.utc))
+    return max(candidates) if candidates else None
+
+
+def make_etag(*parts):
+    return 'W/' + quote_etag('-'.join(str(part) for part in parts))
+
+
+def conditional_view(validators):
+    """
+    Answer GET/HEAD with 304 when If-None-Match / If-Modified-Since match,
+    before the view runs. validators(request, *args, **kwargs) returns
+    (etag, last_modified) and should only read keys and cache generations.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            etag, last_modified = validators(request, *args, **kwargs)
+            timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+
+            if etag and not response.has_header('ETag'):
+                response['ETag'] = etag
+            if timestamp and not response.has_header('Last-Modified'):
+                response['Last-Modified'] = http_date(timestamp)
+            return response
+        return inner
+    return decorator
@@ -0,0 +1,119 @@
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .background import submit
+from .caching import get_generation
+from .redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+GENRE_KEY = 'facets:genre'
+STATUS_KEY = 'facets:status'
+RECONCILED_KEY = 'facets:reconciled_at'
+RECONCILE_LOCK_KEY = 'facets:reconcile_lock'
+
+
+def get_reconcile_interval():
+    return getattr(settings, 'FACET_RECONCILE_INTERVAL', 60 * 60)
+
+
+def apply_facet_deltas(genres=None, statuses=None):
+    """
+    Add count deltas ({genre_id: n}, {status_id: n}) to the facet hashes once
+    the current transaction commits, so rolled back writes never count.
+    """
+    genres = {key: value for key, value in (genres or {}).items() if key is not None and value}
+    statuses = {key: value for key, value in (statuses or {}).items() if key is not None and value}
+    if not genres and not statuses:
+        return
+
+    def apply():
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for genre_id, delta in genres.items():
+                pipe.hincrby(GENRE_KEY, genre_id, delta)
+            for status_id, delta in statuses.items():
+                pipe.hincrby(STATUS_KEY, status_id, delta)
+            pipe.execute()
+        except Exception as e:
+            # The next reconcile repairs the drift
+            logger.warning("Could not update facet counts: %s", e)
+
+    transaction.on_commit(apply)
+
+
+def drop_facet(key, value_id):
+    transaction.on_commit(lambda: get_redis().hdel(key, value_id))
+
+
+def reconcile_facets():
+    """
+    Recount the facets from api_book/api_book_genres and replace both hashes
+    in one transaction. Runs off the request path (periodically and from the
+    reconcile_facets command). Returns (genre_counts, status_counts).
+    """
+    from django.db.models import Count
+    from .models import Book
+
+    through = Book.genres.through
+    genres = {row['genre_id']: row['total'] for row in
+              through.objects.values('genre_id').annotate(total=Count('book_id')).order_by()}
+    statuses = {row['status_id']: row['total'] for row in
+                Book.objects.filter(status__isnull=False).values('status_id').annotate(total=Count('id')).order_by()}
+
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.delete(GENRE_KEY, STATUS_KEY)
+    if genres:
+        pipe.hset(GENRE_KEY, mapping=genres)
+    if statuses:
+        pipe.hset(STATUS_KEY, mapping=statuses)
+    pipe.set(RECONCILED_KEY, time.time())
+    pipe.execute()
+    return genres, statuses
+
+
+def reconcile_in_background():
+    # One reconcile per interval across workers
+    if not cache.add(RECONCILE_LOCK_KEY, 1, timeout=get_reconcile_interval()):
+        return
+    submit(reconcile_facets)
+
+
+def facet_labels():
+    """Genre and status rows for labelling counts, cached until the catalogue changes."""
+    from .models import Genre, Status
+
+    key = f"facet_labels:{get_generation('genres')}"
+    labels = cache.get(key)
+    if labels is None:
+        labels = {
+            'genres': list(Genre.objects.order_by('name').values('id', 'name', 'filter_name')),
+            'statuses': list(Status.objects.order_by('name').values('id', 'name')),
+        }
+        cache.set(key, labels, timeout=60 * 60 * 24)
+    return labels
+
+
+def get_facets():
+    """
+    Book counts per genre and status, read from the facet hashes. A stale or
+    missing reconcile timestamp schedules a background recount.
+    """
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hgetall(GENRE_KEY)
+    pipe.hgetall(STATUS_KEY)
+    pipe.get(RECONCILED_KEY)
+    genre_counts, status_counts, reconciled_at = pipe.execute()
+    if reconciled_at is None or time.time() - float(reconciled_at) > get_reconcile_interval():
+        reconcile_in_background()
+
+    genre_counts = {int(key): int(value) for key, value in genre_counts.items()}
+    status_counts = {int(key): int(value) for key, value in status_counts.items()}
+    labels = facet_labels()
+    return {
+        'genres': [dict(genre, count=max(0, genre_counts.get(genre['id'], 0))) for genre in labels['genres']],
+        'statuses': [dict(status, count=max(0, status_counts.get(status['id'], 0))) for status in labels['statuses']],
+    }
@@ -1,16 +1,42 @@
 # forms.py
 from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse
 from .models import Chapter, Book, Volume
 import uuid
 
 
+class BookAutocompleteWidget(forms.Select):
+    # Renders only the selected book; options are fetched from the admin
+    # search endpoint as the editor types instead of loading every book.
+    template_name = 'admin/widgets/book_autocomplete.html'
+
+    def get_context(self, name, value, attrs):
+        self.choices = [('', '---------')]
+        if value:
+            try:
+                book = Book.objects.filter(id=value).values_list('id', 'title').first()
+            except (ValueError, ValidationError):
+                book = None
+            if book:
+                self.choices.append((str(book[0]), book[1]))
+        context = super().get_context(name, value, attrs)
+        context['widget']['search_url'] = reverse('admin:ajax_search_books')
+        return context
+
+
+class ChapterBrowseForm(forms.Form):
+    book_id = forms.UUIDField(label='Book', required=False, widget=BookAutocompleteWidget)
+    q = forms.CharField(label='Search', required=False)
+
+
 class ChapterAdminForm(forms.ModelForm):
     class Meta:
         model = Chapter
         fields = '__all__'
 
     content = forms.CharField(widget=forms.Textarea, required=False)
-    book_id = forms.ModelChoiceField(queryset=Book.objects.all(), label='Book')
+    book_id = forms.UUIDField(label='Book', widget=BookAutocompleteWidget)
     volume_id = forms.ModelChoiceField(
         queryset=Volume.objects.none(), label='Volume')
 
@@ -0,0 +1,268 @@
+import json
+import logging
+import random
+import socket
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from .background import submit
+from .redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = 'jobs:queue'
+DELAYED_KEY = 'jobs:delayed'
+DEAD_KEY = 'jobs:dead'
+DEAD_SIZE = 1000
+METRIC_FIELDS = ('succeeded', 'failed', 'retried', 'run_ms', 'wait_ms')
+
+# Moves delayed jobs (retries, debounced work) whose time has come onto the queue
+PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, payload in ipairs(due) do
+    redis.call('ZREM', KEYS[1], payload)
+    redis.call('LPUSH', KEYS[2], payload)
+end
+return #due
+"""
+
+_jobs = {}
+_promote_script = None
+# Keys of eager jobs waiting to run in this worker (JOBS_EAGER has no shared queue to hold them)
+_eager_keys = set()
+_eager_lock = threading.Lock()
+
+
+class Job:
+    def __init__(self, name, fn, retries, backoff):
+        self.name = name
+        self.fn = fn
+        self.retries = retries
+        self.backoff = backoff
+
+
+def job(name, retries=5, backoff=2):
+    """
+    Register fn as a background job run by `manage.py run_workers`. A failed
+    run is retried up to retries times, waiting backoff, 2 * backoff,
+    4 * backoff... seconds (with jitter), then kept in jobs:dead. Arguments
+    must be JSON-serializable.
+    """
+    def register(fn):
+        _jobs[name] = Job(name, fn, retries, backoff)
+        return fn
+    return register
+
+
+def get_registered_jobs():
+    return dict(_jobs)
+
+
+def get_idempotency_ttl():
+    return getattr(settings, 'JOBS_IDEMPOTENCY_TTL', 60 * 60)
+
+
+def idempotency_key(key):
+    return f"jobs:key:{key}"
+
+
+def metrics_key(name):
+    return f"jobs:metrics:{name}"
+
+
+def processing_key(worker):
+    return f"jobs:processing:{worker}"
+
+
+def enqueue(name, *args, key=None, delay=0, **kwargs):
+    """
+    Queue job name once the current transaction commits. While a job with the
+    same idempotency key is waiting, further enqueues are dropped, so key plus
+    delay debounces repeated work (the key is released when the job starts).
+    With JOBS_EAGER it runs on this worker's background pool, debounced per
+    worker; when Redis cannot take the job it runs there at once.
+    """
+    if name not in _jobs:
+        raise KeyError(f"Unknown job '{name}'.")
+    payload = {
+        'id': uuid.uuid4().hex,
+        'name': name,
+        'args': args,
+        'kwargs': kwargs,
+        'key': key,
+        'attempt': 0,
+    }
+    transaction.on_commit(lambda: push(payload, delay))
+
+
+def push(payload, delay=0):
+    if getattr(settings, 'JOBS_EAGER', False):
+        push_eager(payload, delay)
+        return
+    try:
+        redis = get_redis()
+        if payload['key'] and not redis.set(
+                idempotency_key(payload['key']), payload['id'], nx=True, ex=get_idempotency_ttl()):
+            return
+        payload['enqueued_at'] = time.time() + delay
+        data = json.dumps(payload, cls=DjangoJSONEncoder)
+        if delay > 0:
+            redis.zadd(DELAYED_KEY, {data: payload['enqueued_at']})
+        else:
+            redis.lpush(QUEUE_KEY, data)
+    except Exception as e:
+        logger.warning("Could not queue job %s, running it here: %s", payload['name'], e)
+        submit(run_inline, payload)
+
+
+def push_eager(payload, delay=0):
+    """The idempotency key and delay debounce within this worker, as the queue does across workers."""
+    if payload['key']:
+        with _eager_lock:
+            if payload['key'] in _eager_keys:
+                return
+            _eager_keys.add(payload['key'])
+    if delay > 0:
+        timer = threading.Timer(delay, submit, (run_eager, payload))
+        timer.daemon = True
+        timer.start()
+    else:
+        submit(run_eager, payload)
+
+
+def run_eager(payload):
+    if payload['key']:
+        with _eager_lock:
+            _eager_keys.discard(payload['key'])
+    run_inline(payload)
+
+
+def run_inline(payload):
+    close_old_connections()
+    try:
+        _jobs[payload['name']].fn(*payload['args'], **payload['kwargs'])
+    finally:
+        close_old_connections()
+
+
+def promote_due_jobs(limit=100):
+    global _promote_script
+    if _promote_script is None:
+        _promote_script = get_redis().register_script(PROMOTE_SCRIPT)
+    return _promote_script(keys=[DELAYED_KEY, QUEUE_KEY], args=[time.time(), limit])
+
+
+def reset_after_fork():
+    global _promote_script, _eager_lock
+    _promote_script = None
+    # Timers for the master's pending eager jobs were not copied into the child
+    _eager_keys.clear()
+    _eager_lock = threading.Lock()
+
+
+def record_metrics(name, **values):
+    pipe = get_redis().pipeline(transaction=False)
+    for field, amount in values.items():
+        pipe.hincrby(metrics_key(name), field, int(amount))
+    pipe.execute()
+
+
+def get_metrics():
+    """{job name: {field: total}} for every registered job, plus the queue lengths."""
+    redis = get_redis()
+    metrics = {}
+    for name in sorted(_jobs):
+        values = {field.decode(): int(value) for field, value in redis.hgetall(metrics_key(name)).items()}
+        metrics[name] = {field: values.get(field, 0) for field in METRIC_FIELDS}
+    queues = {'queued': redis.llen(QUEUE_KEY), 'delayed': redis.zcard(DELAYED_KEY), 'dead': redis.llen(DEAD_KEY)}
+    return metrics, queues
+
+
+def execute(data):
+    """Run one queued job, then record its timing or schedule its retry."""
+    redis = get_redis()
+    payload = json.loads(data)
+    job_type = _jobs.get(payload['name'])
+    if job_type is None:
+        logger.error("Dropping unknown job %s", payload['name'])
+        redis.lpush(DEAD_KEY, data)
+        redis.ltrim(DEAD_KEY, 0, DEAD_SIZE - 1)
+        return False
+    if payload['key']:
+        # Work requested from now on needs a new run
+        redis.delete(idempotency_key(payload['key']))
+
+    started = time.time()
+    wait_ms = max(0.0, started - payload.get('enqueued_at', started)) * 1000
+    close_old_connections()
+    try:
+        job_type.fn(*payload['args'], **payload['kwargs'])
+    except Exception as e:
+        run_ms = (time.time() - started) * 1000
+        payload['attempt'] += 1
+        if payload['attempt'] > job_type.retries:
+            logger.error("Job %s failed for good after %d attempts: %s",
+                         payload['name'], payload['attempt'], e, exc_info=e)
+            redis.lpush(DEAD_KEY, json.dumps(dict(payload, error=str(e)), cls=DjangoJSONEncoder))
+            redis.ltrim(DEAD_KEY, 0, DEAD_SIZE - 1)
+            record_metrics(payload['name'], failed=1, run_ms=run_ms, wait_ms=wait_ms)
+        else:
+            delay = job_type.backoff * 2 ** (payload['attempt'] - 1) * random.uniform(0.5, 1.5)
+            logger.warning("Job %s failed (attempt %d), retrying in %.1fs: %s",
+                           payload['name'], payload['attempt'], delay, e)
+            payload['enqueued_at'] = time.time() + delay
+            redis.zadd(DELAYED_KEY, {json.dumps(payload, cls=DjangoJSONEncoder): payload['enqueued_at']})
+            record_metrics(payload['name'], retried=1, run_ms=run_ms, wait_ms=wait_ms)
+        return False
+    finally:
+        close_old_connections()
+
+    record_metrics(payload['name'], succeeded=1, run_ms=(time.time() - started) * 1000, wait_ms=wait_ms)
+    return True
+
+
+class Worker:
+    """
+    Takes jobs from jobs:queue with BLMOVE into its own processing list and
+    removes them once handled, so jobs held by a worker that died are
+    requeued when a worker with the same name starts again.
+    """
+
+    def __init__(self, name=None, poll_timeout=1):
+        self.name = name or f"{socket.gethostname()}:0"
+        self.poll_timeout = poll_timeout
+        self.stopping = threading.Event()
+
+    def requeue_abandoned(self):
+        redis = get_redis()
+        count = 0
+        while redis.lmove(processing_key(self.name), QUEUE_KEY, 'RIGHT', 'LEFT') is not None:
+            count += 1
+        return count
+
+    def run(self):
+        redis = get_redis()
+        self.requeue_abandoned()
+        while not self.stopping.is_set():
+            try:
+                promote_due_jobs()
+                data = redis.blmove(QUEUE_KEY, processing_key(self.name), self.poll_timeout, 'RIGHT', 'LEFT')
+            except Exception as e:
+                logger.warning("Job queue unavailable: %s", e)
+                self.stopping.wait(self.poll_timeout)
+                continue
+            if data is None:
+                continue
+            try:
+                execute(data)
+                redis.lrem(processing_key(self.name), 1, data)
+            except Exception as e:
+                # Left in the processing list: requeued when this worker starts again
+                logger.error("Could not finish job: %s", e, exc_info=e)
+
+    def stop(self):
+        self.stopping.set()
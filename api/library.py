@@ -0,0 +1,203 @@
+import logging
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+from .caching import invalidate
+from .jobs import enqueue
+from .redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+# Member marking a mirror as loaded: a set holding only a few SADDs is not the whole library
+LOADED = '-'
+
+LIBRARY_COLUMNS = ('user_id', 'followed_at', 'book_id')
+FOLLOWER_COLUMNS = ('book_id', 'user_id', 'followed_at')
+INBOX_COLUMNS = ('user_id', 'created_at', 'chapter_id', 'book_id', 'book_title', 'book_permalink',
+                 'chapter_name', 'chapter_permalink', 'number')
+
+
+def get_mirror_ttl():
+    return getattr(settings, 'LIBRARY_MIRROR_TTL', 60 * 60 * 24)
+
+
+def get_fanout_batch_size():
+    return getattr(settings, 'LIBRARY_FANOUT_BATCH_SIZE', 500)
+
+
+def get_inbox_ttl():
+    return getattr(settings, 'LIBRARY_INBOX_TTL', 60 * 60 * 24 * 30)
+
+
+def mirror_key(user_id):
+    return f"library:{user_id}"
+
+
+def load_mirror(user_id):
+    """Copy the user's followed book ids from the library partition into the Redis set; returns them."""
+    from cassandra.cqlengine import connection
+    from .models import Library
+
+    query = f"SELECT book_id FROM {Library.column_family_name()} WHERE user_id = %s"
+    book_ids = {str(row['book_id']) for row in connection.get_session().execute(query, [user_id])}
+    pipe = get_redis().pipeline()
+    pipe.sadd(mirror_key(user_id), LOADED, *book_ids)
+    pipe.expire(mirror_key(user_id), get_mirror_ttl())
+    pipe.execute()
+    return book_ids
+
+
+def get_follower_row(book_id, user_id):
+    from cassandra.cqlengine import connection
+    from .models import BookFollower
+
+    query = f"SELECT followed_at FROM {BookFollower.column_family_name()} WHERE book_id = %s AND user_id = %s"
+    return connection.get_session().execute(query, [book_id, user_id]).one()
+
+
+def is_following(user_id, book_id):
+    """One SISMEMBER round trip once the user's mirror is loaded; Cassandra answers when Redis cannot."""
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.sismember(mirror_key(user_id), str(book_id))
+        pipe.sismember(mirror_key(user_id), LOADED)
+        following, loaded = pipe.execute()
+        if loaded:
+            return bool(following)
+        return str(book_id) in load_mirror(user_id)
+    except Exception as e:
+        logger.warning("Library mirror unavailable: %s", e)
+        return get_follower_row(book_id, user_id) is not None
+
+
+def update_mirror(user_id, book_id, following):
+    try:
+        if following:
+            get_redis().sadd(mirror_key(user_id), str(book_id))
+        else:
+            get_redis().srem(mirror_key(user_id), str(book_id))
+    except Exception as e:
+        # Corrected when the mirror expires (LIBRARY_MIRROR_TTL) and is reloaded
+        logger.warning("Could not update library mirror: %s", e)
+    invalidate(f"library:{user_id}")
+
+
+def follow(user_id, book_id):
+    """Add the book to the user's library; returns False if it was there already."""
+    from cassandra.cqlengine import connection
+    from .models import BookFollower, Library
+    from .services.chapters import execute_writes, get_prepared, insert_query
+
+    followed_at = timezone.now().replace(tzinfo=None)
+    followed_at = followed_at.replace(microsecond=followed_at.microsecond // 1000 * 1000)
+    session = connection.get_session()
+    # Lightweight transaction: of concurrent follows only one is applied, so the library gets a single row
+    insert = insert_query(BookFollower, FOLLOWER_COLUMNS).format(placeholder='?') + " IF NOT EXISTS"
+    inserted = session.execute(get_prepared(session, insert), (book_id, user_id, followed_at)).one()
+    if not inserted['[applied]']:
+        return False
+    execute_writes(session, [
+        (insert_query(Library, LIBRARY_COLUMNS).format(placeholder='?'), [(user_id, followed_at, book_id)]),
+    ])
+    update_mirror(user_id, book_id, True)
+    return True
+
+
+def unfollow(user_id, book_id):
+    """Remove the book from the user's library; returns False if it was not there."""
+    from cassandra.cqlengine import connection
+    from .models import BookFollower, Library
+
+    row = get_follower_row(book_id, user_id)
+    if row is None:
+        return False
+    session = connection.get_session()
+    session.execute(f"DELETE FROM {BookFollower.column_family_name()} WHERE book_id = %s AND user_id = %s",
+                    [book_id, user_id])
+    session.execute(f"DELETE FROM {Library.column_family_name()} WHERE user_id = %s AND followed_at = %s "
+                    f"AND book_id = %s", [user_id, row['followed_at'], book_id])
+    update_mirror(user_id, book_id, False)
+    return True
+
+
+def page_partition(table, columns, user_id, page_size, cursor, time_column, id_column):
+    from cassandra.cqlengine import connection
+    from .services.chapters import decode_time_cursor, encode_time_cursor
+
+    after = decode_time_cursor(cursor)
+    query = f"SELECT {', '.join(columns)} FROM {table} WHERE user_id = %s"
+    params = [user_id]
+    if after:
+        query += f" AND ({time_column}, {id_column}) < (%s, %s)"
+        params.extend(after)
+    rows = list(connection.get_session().execute(query + " LIMIT %s", params + [page_size + 1]))
+    next_cursor = None
+    if len(rows) > page_size:
+        next_cursor = encode_time_cursor(rows[page_size - 1][time_column], rows[page_size - 1][id_column])
+    return rows[:page_size], next_cursor
+
+
+def page_library(user_id, page_size, cursor=None):
+    """The user's followed books, most recently followed first. Returns (rows, next_cursor)."""
+    from .models import Library
+
+    return page_partition(Library.column_family_name(), LIBRARY_COLUMNS, user_id, page_size, cursor,
+                          'followed_at', 'book_id')
+
+
+def page_updates(user_id, page_size, cursor=None):
+    """New chapters of the user's followed books, newest first: one inbox partition. Returns (rows, next_cursor)."""
+    from .models import Inbox
+
+    return page_partition(Inbox.column_family_name(), INBOX_COLUMNS, user_id, page_size, cursor,
+                          'created_at', 'chapter_id')
+
+
+def announce_chapter(book_id, chapter_id, name, permalink, number, created_at):
+    """Queue the fan-out of a new chapter to the book's followers (the library.fanout job)."""
+    chapter = {
+        'id': str(chapter_id),
+        'name': name,
+        'permalink': permalink,
+        'number': number,
+        'created_at': created_at.isoformat(),
+    }
+    enqueue('library.fanout', str(book_id), chapter, key=f"fanout:{chapter_id}")
+
+
+def fan_out(book_id, chapter, after_user_id=None):
+    """
+    Write the chapter into the inbox of one batch of the book's followers
+    (LIBRARY_FANOUT_BATCH_SIZE, after after_user_id). Inbox rows are keyed by
+    chapter, so a retried batch rewrites the same rows. Returns the last
+    user id written when more followers may remain, else None.
+    """
+    from cassandra.cqlengine import connection
+    from .models import Book, BookFollower, Inbox
+    from .services.chapters import execute_writes, insert_query
+
+    book_id = uuid.UUID(str(book_id))
+    book = Book.objects.filter(id=book_id).values('title', 'permalink').first()
+    if book is None:
+        return None
+    session = connection.get_session()
+    query = f"SELECT user_id FROM {BookFollower.column_family_name()} WHERE book_id = %s"
+    params = [book_id]
+    if after_user_id is not None:
+        query += " AND user_id > %s"
+        params.append(after_user_id)
+    batch_size = get_fanout_batch_size()
+    user_ids = [row['user_id'] for row in session.execute(query + " LIMIT %s", params + [batch_size])]
+    if not user_ids:
+        return None
+
+    created_at = datetime.fromisoformat(chapter['created_at'])
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    values = (created_at, uuid.UUID(chapter['id']), book_id, book['title'], book['permalink'],
+              chapter['name'], chapter['permalink'], chapter['number'])
+    insert = insert_query(Inbox, INBOX_COLUMNS).format(placeholder='?') + f" USING TTL {int(get_inbox_ttl())}"
+    execute_writes(session, [(insert, [(user_id,) + values for user_id in user_ids])])
+    return user_ids[-1] if len(user_ids) == batch_size else None
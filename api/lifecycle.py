@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import resource
+import time
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+from .redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+WORKERS_KEY = 'boot:workers'
+WORKERS_TTL = 60 * 60 * 24
+
+# Modules holding per-process clients, threads or locks; each drops them in reset_after_fork
+FORK_RESETS = (
+    'api.background',
+    'api.cassandra',
+    'api.services.chapters',
+    'api.popularity',
+    'api.throttle',
+    'api.jobs',
+    'api.warmup',
+    'api.suggest',
+)
+
+
+def memory_usage():
+    """
+    {'rss', 'pss', 'uss'} of this process in KiB. PSS and USS count pages
+    shared with the master (preload) fractionally and not at all, so they show
+    what a worker really costs; without /proc only the peak RSS is known.
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as rollup:
+            fields = {}
+            for line in rollup:
+                name, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    fields[name] = int(value.split()[0])
+        return {
+            'rss': fields.get('Rss', 0),
+            'pss': fields.get('Pss', 0),
+            'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+        }
+    except OSError:
+        return {'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, 'pss': None, 'uss': None}
+
+
+def before_fork():
+    """Close the master's sockets, so no worker inherits a connection another process also uses."""
+    connections.close_all()
+    try:
+        get_redis().connection_pool.disconnect()
+    except Exception as e:
+        logger.warning("Could not close Redis connections before fork: %s", e)
+
+
+def after_fork():
+    """In a freshly forked worker: drop the clients, sessions and threads inherited from the master."""
+    for connection in connections.all(initialized_only=True):
+        # The sockets are the master's: forget them without closing (Cassandra is reset by api.cassandra)
+        if connection.vendor != 'cassandra':
+            connection.connection = None
+    try:
+        get_redis().connection_pool.reset()
+    except Exception as e:
+        logger.warning("Could not reset the Redis pool after fork: %s", e)
+    for module in FORK_RESETS:
+        import_string(f"{module}.reset_after_fork")()
+
+
+def run_hooks(paths):
+    """Run each dotted path in order; returns [(path, seconds, ok)]. A failed step is logged and skipped."""
+    steps = []
+    for path in paths:
+        started = time.perf_counter()
+        try:
+            import_string(path)()
+            ok = True
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", path, e, exc_info=e)
+            ok = False
+        steps.append((path, time.perf_counter() - started, ok))
+    return steps
+
+
+def connect_backends():
+    """Open the database, Cassandra and Redis connections before the first request needs them."""
+    from .cassandra import connect_cassandra
+
+    connections['default'].ensure_connection()
+    connect_cassandra()
+    get_redis().ping()
+
+
+def build_suggest_index():
+    from .suggest import ensure_index
+
+    ensure_index()
+
+
+def warm_paths():
+    """Render WORKER_WARMUP_PATHS through the middleware, filling the response and page caches."""
+    from .warmup import render_path
+
+    for path in getattr(settings, 'WORKER_WARMUP_PATHS', ()):
+        status = render_path(path)
+        if status != 200:
+            logger.info("Warm-up of %s answered %s", path, status)
+
+
+def report_worker(stage, started, **extra):
+    """
+    Log and record (in the boot:workers hash, by pid) the seconds since the
+    worker started booting and its memory at stage. See `boot_profile --workers`.
+    """
+    report = {'stage': stage, 'seconds': round(time.time() - started, 3), **memory_usage(), **extra}
+    logger.info("Worker %s %s: %s", os.getpid(), stage, report)
+    try:
+        redis = get_redis()
+        redis.hset(WORKERS_KEY, f"{os.getpid()}:{stage}", json.dumps(report))
+        redis.expire(WORKERS_KEY, WORKERS_TTL)
+    except Exception as e:
+        logger.warning("Could not record worker boot: %s", e)
+    return report
+
+
+def get_worker_reports():
+    """[(pid, stage, report)] recorded by report_worker, oldest pid first."""
+    reports = []
+    for field, value in get_redis().hgetall(WORKERS_KEY).items():
+        pid, _, stage = field.decode().partition(':')
+        reports.append((int(pid), stage, json.loads(value)))
+    return sorted(reports, key=lambda report: (report[0], report[2]['seconds']))
@@ -0,0 +1,93 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from django.core.management.base import BaseCommand, CommandError
+from api.lifecycle import get_worker_reports
+
+
+# Run in a fresh interpreter: this process has booted already
+BOOT_SCRIPT = """
+import json, sys, time
+phases = []
+started = last = time.perf_counter()
+
+def mark(name):
+    global last
+    now = time.perf_counter()
+    phases.append((name, now - last))
+    last = now
+
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+mark('settings')
+django.setup()
+mark('apps (models, ready hooks)')
+from django.urls import get_resolver
+get_resolver().url_patterns
+mark('urlconf and views')
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+mark('middleware')
+if '--connect' in sys.argv:
+    from api.cassandra import connect_cassandra
+    connect_cassandra()
+    mark('cassandra connect')
+    from django.db import connections
+    connections['default'].ensure_connection()
+    mark('database connect')
+phases.append(('total', time.perf_counter() - started))
+print(json.dumps(phases))
+"""
+
+
+class Command(BaseCommand):
+    help = ("Boot the project in a fresh interpreter and show where startup time goes (phases and imports), "
+            "or with --workers what gunicorn workers recorded.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connect', action='store_true',
+                            help="Also open the Cassandra and database connections")
+        parser.add_argument('--top', type=int, default=15, help="Packages listed by import time")
+        parser.add_argument('--workers', action='store_true',
+                            help="Show the boot time and memory gunicorn workers recorded instead")
+
+    def handle(self, *args, **options):
+        if options['workers']:
+            self.show_workers()
+            return
+        command = [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT]
+        if options['connect']:
+            command.append('--connect')
+        result = subprocess.run(command, capture_output=True, text=True, env=os.environ.copy())
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "Boot failed.")
+
+        self.stdout.write("Phases:")
+        for name, seconds in json.loads(result.stdout.strip().splitlines()[-1]):
+            self.stdout.write(f"  {name:<30}{seconds * 1000:>10.1f} ms")
+
+        # -X importtime lines: "import time: self [us] | cumulative | package"
+        packages = defaultdict(int)
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, _, module = line[len('import time:'):].split('|')
+            packages[module.strip().split('.')[0]] += int(self_us)
+        self.stdout.write("Imports by top-level package (self time):")
+        for package, micros in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f"  {package:<30}{micros / 1000:>10.1f} ms")
+
+    def show_workers(self):
+        reports = get_worker_reports()
+        if not reports:
+            self.stdout.write("No worker boots recorded (gunicorn -c gunicorn.conf.py records them).")
+            return
+        self.stdout.write(f"  {'pid':<10}{'mode':<10}{'stage':<16}{'seconds':>10}{'rss KiB':>12}{'pss KiB':>12}{'uss KiB':>12}")
+        for pid, stage, report in reports:
+            mode = 'preload' if report.get('preload') else 'per-worker'
+            self.stdout.write(
+                f"  {pid:<10}{mode:<10}{stage:<16}{report['seconds']:>10.3f}"
+                f"{report['rss'] or '-':>12}{report['pss'] or '-':>12}{report['uss'] or '-':>12}")
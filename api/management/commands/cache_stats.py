@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from api.cache_backend import STATS_KEY
+from api.redis_client import get_redis
+
+
+class Command(BaseCommand):
+    help = "Show cache hit ratios per tier (near cache, Redis) reported by all workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Clear the counters after printing them")
+
+    def handle(self, *args, **options):
+        redis = get_redis()
+        stats = {field.decode(): int(value) for field, value in redis.hgetall(STATS_KEY).items()}
+        for tier in ('near', 'redis'):
+            hits, misses = stats.get(f'{tier}_hits', 0), stats.get(f'{tier}_misses', 0)
+            ratio = f"{hits / (hits + misses):.1%}" if hits + misses else "n/a"
+            self.stdout.write(f"{tier:<6} {hits:>12} hits {misses:>12} misses  hit ratio {ratio}")
+
+        near_hits = stats.get('near_hits', 0)
+        reads = near_hits + stats.get('redis_hits', 0) + stats.get('redis_misses', 0)
+        if reads:
+            self.stdout.write(f"{near_hits / reads:.1%} of {reads} reads were served without a Redis round trip.")
+        if options['reset']:
+            redis.delete(STATS_KEY)
+            self.stdout.write(self.style.SUCCESS("Cache stats reset."))
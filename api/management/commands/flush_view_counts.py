@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.popularity import flush_view_counts
+
+
+class Command(BaseCommand):
+    help = "Flush pending chapter view counts from Redis into Cassandra and the popularity rankings."
+
+    def handle(self, *args, **options):
+        flushed = flush_view_counts()
+        self.stdout.write(self.style.SUCCESS(f"Flushed {flushed} chapter views."))
@@ -0,0 +1,56 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from api.services.corpus import generate_corpus
+
+
+class Command(BaseCommand):
+    help = "Generate a deterministic synthetic catalogue (books, volumes, Vietnamese chapters) for scale testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help="Username recorded as posted_by")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--books', type=int, default=100000)
+        parser.add_argument('--largest-volumes', type=int, default=5000, help="Volumes of the largest series")
+        parser.add_argument('--max-volumes', type=int, default=60, help="Cap for every other book")
+        parser.add_argument('--chapters-per-volume', type=int, nargs=2, default=(5, 30), metavar=('MIN', 'MAX'))
+        parser.add_argument('--paragraphs', type=int, nargs=2, default=(8, 20), metavar=('MIN', 'MAX'),
+                            help="Paragraphs per chapter")
+        parser.add_argument('--max-chapters', type=int, help="Stop writing chapters after this many")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Books per bulk_create")
+        parser.add_argument('--chapter-chunk-size', type=int, default=2000, help="Chapters per write_chapters call")
+        parser.add_argument('--concurrency', type=int)
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' not found.")
+
+        started = time.monotonic()
+
+        def progress(totals):
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f"{totals['books']} books, {totals['volumes']} volumes, {totals['chapters']} chapters "
+                f"({totals['chapters'] / elapsed:.0f} chapters/s)")
+
+        totals = generate_corpus(
+            user,
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+            chapter_chunk_size=options['chapter_chunk_size'],
+            concurrency=options['concurrency'],
+            batch_size=options['batch_size'],
+            progress=progress if options['verbosity'] else None,
+            books=options['books'],
+            largest_volumes=options['largest_volumes'],
+            max_volumes=options['max_volumes'],
+            chapters_per_volume=tuple(options['chapters_per_volume']),
+            paragraphs_per_chapter=tuple(options['paragraphs']),
+            max_chapters=options['max_chapters'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {totals['books']} books, {totals['volumes']} volumes and {totals['chapters']} chapters "
+            f"in {time.monotonic() - started:.1f}s, {totals['failed']} chapter writes failed."))
@@ -0,0 +1,35 @@
+import posixpath
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from api.services.book_import import download_covers, import_books
+
+
+class Command(BaseCommand):
+    help = "Bulk import a book catalogue from CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import (.csv or .jsonl)")
+        parser.add_argument('--user', required=True, help="Username recorded as posted_by")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Override format detection")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Books per bulk_create")
+        parser.add_argument('--skip-covers', action='store_true', help="Do not download cover images")
+        parser.add_argument('--cover-workers', type=int, default=8, help="Concurrent cover downloads")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or posixpath.splitext(options['path'])[1].lstrip('.').lower()
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                result = import_books(fileobj, fmt, options['user'], chunk_size=options['chunk_size'])
+        except OSError as e:
+            raise CommandError(str(e))
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+
+        for failure in result['failed']:
+            self.stderr.write(f"Line {failure['line']}: {failure['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} books, {len(result['failed'])} rows skipped."))
+
+        if result['covers'] and not options['skip_covers']:
+            downloaded = download_covers(result['covers'], workers=options['cover_workers'])
+            self.stdout.write(f"Downloaded {downloaded}/{len(result['covers'])} covers.")
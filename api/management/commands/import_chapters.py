@@ -0,0 +1,41 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from api.services.chapter_import import detect_format, import_chapters, parse_source
+
+
+class Command(BaseCommand):
+    help = "Bulk import chapters for a book from a JSON file, a zip of .txt files or an EPUB."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import (.json, .zip or .epub)")
+        parser.add_argument('--book', required=True, help="Target book id")
+        parser.add_argument('--volume', help="Target volume id for chapters without their own volume")
+        parser.add_argument('--volume-name', help="Create or reuse a volume with this name instead of --volume")
+        parser.add_argument('--format', choices=['json', 'zip', 'epub'], help="Override format detection")
+        parser.add_argument('--concurrency', type=int, help="Max in-flight Cassandra writes")
+        parser.add_argument('--batch-size', type=int, help="Rows per unlogged batch (1 = single inserts)")
+
+    def handle(self, *args, **options):
+        try:
+            fmt = detect_format(options['path'], options['format'])
+            with open(options['path'], 'rb') as fileobj:
+                parsed = parse_source(fileobj, fmt)
+            result = import_chapters(
+                options['book'],
+                parsed,
+                volume_id=options['volume'],
+                volume_name=options['volume_name'],
+                concurrency=options['concurrency'],
+                batch_size=options['batch_size'],
+            )
+        except OSError as e:
+            raise CommandError(str(e))
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
+
+        for failure in result['failed']:
+            self.stderr.write(f"Chapter {failure['number']} ({failure['name']}) failed: {failure['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} chapters "
+            f"(#{result['first_number']}-#{result['last_number']}), {len(result['failed'])} failed."
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from api.jobs import get_metrics
+
+
+class Command(BaseCommand):
+    help = "Show background job counts and timings (api.jobs) and the queue lengths."
+
+    def handle(self, *args, **options):
+        metrics, queues = get_metrics()
+        self.stdout.write(f"{'job':<22}{'succeeded':>10}{'retried':>10}{'failed':>10}{'avg run ms':>12}{'avg wait ms':>12}")
+        for name, values in metrics.items():
+            runs = values['succeeded'] + values['retried'] + values['failed']
+            run_ms = values['run_ms'] / runs if runs else 0
+            wait_ms = values['wait_ms'] / runs if runs else 0
+            self.stdout.write(f"{name:<22}{values['succeeded']:>10}{values['retried']:>10}{values['failed']:>10}"
+                              f"{run_ms:>12.1f}{wait_ms:>12.1f}")
+        self.stdout.write(f"{queues['queued']} queued, {queues['delayed']} delayed, {queues['dead']} dead.")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from api.facets import reconcile_facets
+
+
+class Command(BaseCommand):
+    help = "Recount the genre/status facet counts of the book list from the database."
+
+    def handle(self, *args, **options):
+        genres, statuses = reconcile_facets()
+        self.stdout.write(self.style.SUCCESS(
+            f"Counted {sum(genres.values())} genre links over {len(genres)} genres "
+            f"and {sum(statuses.values())} books over {len(statuses)} statuses."))
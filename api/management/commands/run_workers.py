@@ -0,0 +1,35 @@
+import signal
+import socket
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.jobs import Worker, get_registered_jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (api.jobs) until stopped with SIGINT/SIGTERM."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=getattr(settings, 'JOBS_WORKER_THREADS', 4))
+        parser.add_argument('--name', default=socket.gethostname(),
+                            help="Stable worker name; jobs left in progress under it are requeued at start")
+
+    def handle(self, *args, **options):
+        workers = [Worker(f"{options['name']}:{number}") for number in range(options['threads'])]
+
+        def stop(signum, frame):
+            for worker in workers:
+                worker.stop()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        threads = [threading.Thread(target=worker.run, name=f"job-worker-{number}")
+                   for number, worker in enumerate(workers)]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Running {len(threads)} job workers for {', '.join(sorted(get_registered_jobs()))}.")
+        for thread in threads:
+            # Joined with a timeout so the main thread keeps handling signals
+            while thread.is_alive():
+                thread.join(1)
+        self.stdout.write(self.style.SUCCESS("Job workers stopped."))
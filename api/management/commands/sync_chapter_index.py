@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from cassandra.cqlengine import connection
+from cassandra.query import SimpleStatement
+from api.models import Chapter
+from api.services.chapters import LOOKUP_SOURCE_COLUMNS, write_chapters
+
+
+class Command(BaseCommand):
+    help = "Rebuild the chapter lookup tables (chapter_by_volume, chapter_by_name) from the chapter table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', help="Only rebuild lookups for this book id")
+        parser.add_argument('--fetch-size', type=int, default=500)
+        parser.add_argument('--concurrency', type=int)
+
+    def handle(self, *args, **options):
+        query = "SELECT {} FROM {}".format(', '.join(LOOKUP_SOURCE_COLUMNS), Chapter.column_family_name())
+        params = []
+        if options['book']:
+            query += " WHERE book_id = %s"
+            params.append(options['book'])
+        rows = connection.get_session().execute(SimpleStatement(query, fetch_size=options['fetch_size']), params)
+
+        synced = failed = 0
+        page = []
+        for row in rows:
+            page.append(row)
+            if len(page) >= options['fetch_size']:
+                failed += len(write_chapters(page, concurrency=options['concurrency'], lookups_only=True))
+                synced += len(page)
+                page = []
+        if page:
+            failed += len(write_chapters(page, concurrency=options['concurrency'], lookups_only=True))
+            synced += len(page)
+
+        self.stdout.write(self.style.SUCCESS(f"Synced {synced - failed} chapter lookups, {failed} failed."))
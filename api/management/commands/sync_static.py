@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from api.services.static_sync import sync_static
+
+
+class Command(BaseCommand):
+    help = "Upload changed static files to the static storage, skipping everything when its manifest matches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent uploads")
+        parser.add_argument('--prune', action='store_true', help="Delete files that are no longer collected")
+        parser.add_argument('--force', action='store_true', help="Upload every file regardless of the manifest")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        result = sync_static(workers=options['workers'], prune=options['prune'], force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Uploaded {result['uploaded']}, deleted {result['deleted']}, {result['unchanged']} unchanged "
+            f"in {time.monotonic() - started:.1f}s."))
@@ -1,24 +1,141 @@
+import logging
+import math
 import random
 import string
+import time
 from datetime import timedelta
 from django.core.cache import cache
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
 from django.utils.deprecation import MiddlewareMixin
 from rest_framework.response import Response
 from rest_framework import status
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
+from django.conf import settings
+from django.urls import resolve, Resolver404
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import parse_http_date_safe
+from .caching import get_generations, single_flight
+from .popularity import record_chapter_view
+from .throttle import take_tokens
+from .surrogate import SURROGATE_HEADER, record_cached_url
+from .warmup import WARMUP_ENVIRON_KEY
+import gzip
+import hashlib
+import ipaddress
+import re
+from functools import lru_cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
 
 
 def generate_random_username():
     return 'anonymous#' + ''.join(random.choices(string.digits, k=8))
 
 
+@lru_cache(maxsize=1)
+def get_trusted_networks(proxies):
+    return tuple(ipaddress.ip_network(proxy, strict=False) for proxy in proxies)
+
+
+def from_trusted_proxy(request):
+    """
+    Whether the request came through a proxy in TRUSTED_PROXIES. Only then are
+    the headers nginx sets (X-Real-IP, X-View-Beacon, X-View-Mirrored) believed;
+    a client reaching the backend directly could send them itself.
+    """
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in network for network in get_trusted_networks(tuple(getattr(settings, 'TRUSTED_PROXIES', ()))))
+
+
+def is_view_beacon(request):
+    return 'HTTP_X_VIEW_BEACON' in request.META and from_trusted_proxy(request)
+
+
+class ThrottleMiddleware:
+    """
+    Token bucket per user (JWT user id) or anonymous client (IP), kept in
+    Redis and updated by one Lua script. Each request costs the tokens set
+    for its URL name in THROTTLE_COSTS. Over the limit the request is
+    answered 429 with Retry-After before anything else runs, so it sits first
+    in MIDDLEWARE. Redis errors let requests through (and pause throttling
+    for THROTTLE_FAILURE_BACKOFF seconds) rather than failing them.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rates = getattr(settings, 'THROTTLE_RATES', {})
+        self.costs = getattr(settings, 'THROTTLE_COSTS', {})
+        self.default_cost = getattr(settings, 'THROTTLE_DEFAULT_COST', 1)
+        self.failure_backoff = getattr(settings, 'THROTTLE_FAILURE_BACKOFF', 5)
+        self.paused_until = 0.0
+
+    def __call__(self, request):
+        # Preflights, nginx view beacons (see ViewCountMiddleware) and cache warm-ups are not client requests
+        if not self.rates or request.method == 'OPTIONS' or is_view_beacon(request) \
+                or WARMUP_ENVIRON_KEY in request.META:
+            return self.get_response(request)
+        if time.monotonic() < self.paused_until:
+            return self.get_response(request)
+
+        scope, identity = self.get_identity(request)
+        rate = self.rates.get(scope)
+        if rate is None:
+            return self.get_response(request)
+        try:
+            allowed, retry_after, _ = take_tokens(
+                f"{scope}:{identity}", rate['capacity'], rate['rate'], self.get_cost(request))
+        except Exception as e:
+            logger.warning("Throttle unavailable, letting requests through: %s", e)
+            self.paused_until = time.monotonic() + self.failure_backoff
+            return self.get_response(request)
+
+        if not allowed:
+            wait = max(1, math.ceil(retry_after))
+            response = JsonResponse(
+                {'detail': f'Request was throttled. Expected available in {wait} seconds.'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(wait)
+            return response
+        return self.get_response(request)
+
+    def get_identity(self, request):
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if header.startswith('Bearer '):
+            # Signature and expiry are checked without loading the user
+            try:
+                return 'user', AccessToken(header[7:].strip())[jwt_settings.USER_ID_CLAIM]
+            except (TokenError, KeyError):
+                pass
+        if from_trusted_proxy(request) and request.META.get('HTTP_X_REAL_IP'):
+            return 'anon', request.META['HTTP_X_REAL_IP']
+        return 'anon', request.META.get('REMOTE_ADDR', '')
+
+    def get_cost(self, request):
+        try:
+            return self.costs.get(resolve(request.path_info).url_name, self.default_cost)
+        except Resolver404:
+            return self.default_cost
+
+
 class AnonymousSessionMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
+        if WARMUP_ENVIRON_KEY in request.META:
+            return self.get_response(request)
         if hasattr(request, 'user') and not request.user.is_authenticated:
             if 'anon_username' not in request.session:
                 request.session['anon_username'] = generate_random_username()
@@ -45,3 +162,210 @@ class TokenBlacklistMiddleware:
 
         response = self.get_response(request)
         return response
+
+
+class ViewCountMiddleware:
+    """
+    Counts chapter reads (api.popularity) for successful GETs of the routes in
+    VIEW_COUNT_ROUTES, 304s included. Microcache hits never reach Django, so
+    nginx mirrors chapter requests as beacons (X-View-Beacon): a beacon is
+    only counted and answered with 204, and the proxied request itself comes
+    with X-View-Mirrored so it is not counted twice. Warm-up renders
+    (api.warmup) are not reads.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.routes = getattr(settings, 'VIEW_COUNT_ROUTES', {})
+
+    def __call__(self, request):
+        if is_view_beacon(request):
+            if request.method == 'GET':
+                try:
+                    self.count(resolve(request.path_info))
+                except Resolver404:
+                    pass
+            return HttpResponse(status=204)
+
+        response = self.get_response(request)
+        if request.method == 'GET' and response.status_code in (200, 304) \
+                and not ('HTTP_X_VIEW_MIRRORED' in request.META and from_trusted_proxy(request)) \
+                and WARMUP_ENVIRON_KEY not in request.META:
+            # Responses served by ResponseCacheMiddleware never went through URL resolution
+            match = getattr(request, 'resolver_match', None)
+            if match is None:
+                try:
+                    match = resolve(request.path_info)
+                except Resolver404:
+                    pass
+            self.count(match)
+        return response
+
+    def count(self, match):
+        if match is None or match.url_name not in self.routes:
+            return
+        key = match.kwargs.get(self.routes[match.url_name])
+        if key:
+            record_chapter_view(key)
+
+
+class SurrogateKeyMiddleware:
+    """
+    Marks anonymous GET responses tagged with surrogate keys as publicly
+    cacheable for the nginx microcache and records their URL under each key,
+    so saves can purge exactly the affected entries. Must sit above
+    SessionMiddleware to see the final Set-Cookie/Vary headers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not response.has_header(SURROGATE_HEADER):
+            return response
+
+        cacheable = (
+            request.method in ('GET', 'HEAD')
+            and response.status_code == 200
+            and 'HTTP_AUTHORIZATION' not in request.META
+            and not response.cookies
+        )
+        if not cacheable:
+            patch_cache_control(response, private=True)
+            return response
+
+        max_age = getattr(settings, 'PROXY_CACHE_MAX_AGE', 60)
+        patch_cache_control(response, public=True, max_age=max_age)
+        # Tagged views do not depend on the session, so a Vary: Cookie added by
+        # an anonymous session access would only split the shared cache.
+        if response.has_header('Vary'):
+            vary = [value.strip() for value in response['Vary'].split(',')
+                    if value.strip() and value.strip().lower() != 'cookie']
+            del response['Vary']
+            if vary:
+                patch_vary_headers(response, vary)
+        record_cached_url(response[SURROGATE_HEADER].split(), request.get_host(), request.get_full_path(), max_age)
+        return response
+
+
+class ResponseCacheMiddleware:
+    """
+    Caches whole GET responses for the routes in RESPONSE_CACHE_ROUTES (keyed
+    by URL name). The body is stored once together with gzip and brotli
+    variants, so hits only pick bytes by Accept-Encoding. Keys are built from
+    the host and scheme (bodies carry absolute links), the whitelisted query
+    params in sorted order and the generations of the route's scopes, which
+    writes bump. Concurrent misses on a key collapse
+    into one render per worker (api.caching.single_flight).
+    """
+
+    STORED_HEADERS = ('ETag', 'Last-Modified', SURROGATE_HEADER)
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.routes = getattr(settings, 'RESPONSE_CACHE_ROUTES', {})
+        self.min_compress = getattr(settings, 'RESPONSE_CACHE_MIN_COMPRESS', 512)
+
+    def __call__(self, request):
+        route = self.get_route(request)
+        if route is None:
+            return self.get_response(request)
+
+        name, config, kwargs = route
+        cache_key = self.get_cache_key(request, name, config, kwargs)
+        entry = cache.get(cache_key)
+        if entry is None:
+            # Concurrent misses in this worker wait for one render of the key
+            rendered = []
+
+            def render():
+                rendered.append(self.get_response(request))
+                return self.store(cache_key, config, rendered[0])
+
+            entry, fetched = single_flight(cache_key, render)
+            if fetched:
+                if entry is None:
+                    return rendered[0]
+                response = self.build_response(request, entry)
+                response['X-Cache'] = 'MISS'
+                return response
+            if entry is None:
+                # The shared render was not cacheable (an error, say): render this request
+                return self.get_response(request)
+
+        etag = entry['headers'].get('ETag')
+        last_modified = parse_http_date_safe(entry['headers'].get('Last-Modified', ''))
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = self.build_response(request, entry)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    def get_route(self, request):
+        if request.method not in ('GET', 'HEAD') or not self.routes:
+            return None
+        # The browsable API renders HTML; only JSON is shared
+        if 'text/html' in request.META.get('HTTP_ACCEPT', ''):
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        config = self.routes.get(match.url_name)
+        if config is None:
+            return None
+        if config.get('anonymous_only') and 'HTTP_AUTHORIZATION' in request.META:
+            return None
+        return match.url_name, config, match.kwargs
+
+    def get_cache_key(self, request, name, config, kwargs):
+        params = []
+        for param in sorted(config.get('params', ())):
+            values = sorted(value for value in request.GET.getlist(param) if value != '')
+            if values:
+                params.append((param, values))
+        scopes = [scope.format(**kwargs) for scope in config.get('scopes', ())]
+        generations = get_generations(*scopes) if scopes else ()
+        raw = repr((request.scheme, request.get_host(), sorted(kwargs.items()), params, generations))
+        return f"respcache:{name}:{hashlib.md5(raw.encode('utf-8')).hexdigest()}"
+
+    def store(self, cache_key, config, response):
+        if response.status_code != 200 or response.streaming or response.has_header('Content-Encoding'):
+            return None
+        if not response.get('Content-Type', '').startswith('application/json'):
+            return None
+
+        body = response.content
+        entry = {
+            'content_type': response['Content-Type'],
+            'headers': {header: response[header] for header in self.STORED_HEADERS if response.has_header(header)},
+            'body': body,
+            'gzip': None,
+            'br': None,
+        }
+        if len(body) >= self.min_compress:
+            entry['gzip'] = gzip.compress(body, compresslevel=6)
+            if brotli is not None:
+                entry['br'] = brotli.compress(body, quality=5)
+        cache.set(cache_key, entry, timeout=config.get('timeout', 60 * 10))
+        return entry
+
+    def build_response(self, request, entry):
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        body, encoding = entry['body'], None
+        if entry['br'] is not None and re.search(r'\bbr\b', accept_encoding):
+            body, encoding = entry['br'], 'br'
+        elif entry['gzip'] is not None and re.search(r'\bgzip\b', accept_encoding):
+            body, encoding = entry['gzip'], 'gzip'
+
+        response = HttpResponse(body, content_type=entry['content_type'])
+        for header, value in entry['headers'].items():
+            response[header] = value
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Content-Length'] = str(len(body))
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
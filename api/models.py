@@ -7,9 +7,16 @@ from django.core.exceptions import ValidationError
 import uuid
 import re
 from .utils import generate_permalink, normalize_text
+from .touch import touch_book
+from .caching import invalidate
+from .jobs import enqueue
+from .warmup import schedule_release_warmup
+from .library import announce_chapter
+from .releases import forget_release, record_release
 from django.utils import timezone
+from django.core.cache import cache
 from django_cassandra_engine.models import DjangoCassandraModel
-from cassandra.cqlengine.columns import UUID as CassandraUUID, Text, DateTime, Integer
+from cassandra.cqlengine.columns import UUID as CassandraUUID, Text, DateTime, Integer, Counter
 
 class SearchManager(Manager):
     def search_query(self, raw_query):
@@ -40,6 +47,7 @@ class Genre(models.Model):
         if not self.filter_name:
             self.filter_name = generate_permalink(self.name)
         super().save(*args, **kwargs)
+        invalidate("genres")
 
 
 class Status(models.Model):
@@ -72,16 +80,23 @@ class Book(models.Model):
         if not self.permalink:
             self.permalink = generate_permalink(self.title)
         super().save(*args, **kwargs)
-        self.update_search_vector()
+        enqueue('book.search_vector', str(self.id), key=f"search_vector:{self.id}")
+        invalidate(f"book:{self.id}", "books")
 
-    def update_search_vector(self):
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        invalidate(f"book:{self.id}", "books")
+        return result
+
+    def get_search_vector(self):
         normalized_title = normalize_text(self.title)
         normalized_description = normalize_text(self.description)
         normalized_author = normalize_text(self.author)
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                UPDATE api_book SET search_vector = (%s || ' ' || %s || ' ' || %s) WHERE id = %s;
-            """, [normalized_title, normalized_description, normalized_author, str(self.id)])
+        return f"{normalized_title} {normalized_description} {normalized_author}"
+
+    def update_search_vector(self):
+        self.search_vector = self.get_search_vector()
+        Book.objects.filter(id=self.id).update(search_vector=self.search_vector)
 
 
 class Volume(models.Model):
@@ -98,8 +113,14 @@ class Volume(models.Model):
     def save(self, *args, **kwargs):
         self.date_updated = timezone.now()
         super().save(*args, **kwargs)
-        self.book.date_updated = timezone.now()
-        self.book.save()
+        invalidate(f"volume:{self.id}")
+        touch_book(self.book_id)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        invalidate(f"volume:{self.id}")
+        touch_book(self.book_id)
+        return result
 
 
 class Chapter(DjangoCassandraModel):
@@ -130,17 +151,229 @@ class Chapter(DjangoCassandraModel):
             self.permalink = generate_permalink(self.name)
         if not self.number:
             self.number = self.get_next_chapter_number()
+        previous_volume_id = self._values['volume_id'].previous_value if self._is_persisted else None
+        previous_name = self._values['name'].previous_value if self._is_persisted else None
+        created = not self._is_persisted
         super().save(*args, **kwargs)
-        Book.objects.filter(id=self.book_id).update(
-            date_updated=timezone.now())
+        self.sync_lookups(previous_volume_id, previous_name)
+        invalidate(f"chapter:{self.id}", f"chapter:{self.permalink}")
+        touch_book(self.book_id)
+        if created:
+            schedule_release_warmup(self.book_id, [self.volume_id], [self.permalink])
+            announce_chapter(self.book_id, self.id, self.name, self.permalink, self.number, self.date_created)
+            record_release(self.book_id, self.id, self.name, self.permalink, self.number, self.date_created)
+
+    def delete(self):
+        super().delete()
+        ChapterByVolume.objects.filter(volume_id=self.volume_id, number=self.number, id=self.id).delete()
+        ChapterByName.objects.filter(
+            book_id=self.book_id, name_key=normalize_text(self.name or ''), number=self.number, id=self.id).delete()
+        invalidate(f"volume:{self.volume_id}", f"chapter:{self.id}", f"chapter:{self.permalink}")
+        touch_book(self.book_id)
+        if self.date_created:
+            forget_release(self.book_id, self.id, self.date_created)
+
+    def sync_lookups(self, previous_volume_id=None, previous_name=None):
+        if previous_volume_id and previous_volume_id != self.volume_id:
+            ChapterByVolume.objects.filter(volume_id=previous_volume_id, number=self.number, id=self.id).delete()
+            invalidate(f"volume:{previous_volume_id}")
+        if previous_name is not None and normalize_text(previous_name) != normalize_text(self.name or ''):
+            ChapterByName.objects.filter(
+                book_id=self.book_id, name_key=normalize_text(previous_name), number=self.number, id=self.id).delete()
+        ChapterByName.create(
+            book_id=self.book_id,
+            name_key=normalize_text(self.name or ''),
+            number=self.number,
+            id=self.id,
+            name=self.name,
+            volume_id=self.volume_id,
+            date_created=self.date_created,
+            date_updated=self.date_updated,
+        )
+        ChapterByVolume.create(
+            volume_id=self.volume_id,
+            number=self.number,
+            id=self.id,
+            book_id=self.book_id,
+            name=self.name,
+            permalink=self.permalink,
+            date_updated=self.date_updated,
+        )
+        invalidate(f"volume:{self.volume_id}")
 
     def __str__(self):
         return self.name
     
     def get_next_chapter_number(self):
-        last_chapter = Chapter.objects.filter(book_id=self.book_id).order_by('-number').first()
-        return last_chapter.number + 1 if last_chapter else 1
+        return Chapter.reserve_numbers(self.book_id)[0]
+
+    @classmethod
+    def reserve_numbers(cls, book_id, count=1):
+        # The counter is seeded from the partition once, then handed out with INCRBY
+        # so single creates and bulk imports never read the last chapter again.
+        cache_key = f"chapter_number_{book_id}"
+        if cache.get(cache_key) is None:
+            last_chapter = cls.objects.filter(book_id=book_id).order_by('-number').first()
+            cache.add(cache_key, last_chapter.number if last_chapter else 0, timeout=None)
+        last_number = cache.incr(cache_key, count)
+        return range(last_number - count + 1, last_number + 1)
+
+
+
+class ChapterByVolume(DjangoCassandraModel):
+    # Lookup copy of Chapter partitioned by volume, so a volume's chapter list
+    # can be paged with LIMIT instead of filtering the whole chapter table.
+    volume_id = CassandraUUID(primary_key=True)
+    number = Integer(primary_key=True, clustering_order="ASC")
+    id = CassandraUUID(primary_key=True)
+    book_id = CassandraUUID()
+    name = Text()
+    permalink = Text()
+    date_updated = DateTime()
+
+    class Meta:
+        get_pk_field = 'id'
+
+
+class ChapterByName(DjangoCassandraModel):
+    # Chapters of a book clustered by normalized name, so admin search is a
+    # prefix range over one partition rather than a table scan.
+    book_id = CassandraUUID(primary_key=True)
+    name_key = Text(primary_key=True, clustering_order="ASC")
+    number = Integer(primary_key=True, clustering_order="ASC")
+    id = CassandraUUID(primary_key=True)
+    name = Text()
+    volume_id = CassandraUUID()
+    date_created = DateTime()
+    date_updated = DateTime()
+
+    class Meta:
+        get_pk_field = 'id'
+
+
+class BookViews(DjangoCassandraModel):
+    # Read counters flushed from Redis by api.popularity (counter tables hold only counters)
+    book_id = CassandraUUID(primary_key=True)
+    views = Counter()
+
+
+class ChapterViews(DjangoCassandraModel):
+    book_id = CassandraUUID(primary_key=True)
+    chapter_id = CassandraUUID(primary_key=True, clustering_order="ASC")
+    views = Counter()
+
+    class Meta:
+        get_pk_field = 'chapter_id'
 
 
+class Comment(DjangoCassandraModel):
+    # A chapter's comments, partitioned by time bucket (COMMENT_BUCKET_SECONDS) so
+    # a busy chapter never grows one unbounded partition; newest first within it.
+    # ids are time-based (uuid1): created_at and bucket are derived from them.
+    chapter_id = CassandraUUID(primary_key=True, partition_key=True)
+    bucket = Integer(primary_key=True, partition_key=True)
+    created_at = DateTime(primary_key=True, clustering_order="DESC")
+    id = CassandraUUID(primary_key=True, clustering_order="DESC")
+    book_id = CassandraUUID()
+    user_id = Integer()
+    username = Text()
+    content = Text()
+
+    class Meta:
+        get_pk_field = 'id'
+
+
+class CommentBucket(DjangoCassandraModel):
+    # Buckets holding comments of a chapter, newest first, so paging skips empty ones
+    chapter_id = CassandraUUID(primary_key=True)
+    bucket = Integer(primary_key=True, clustering_order="DESC")
+
+    class Meta:
+        get_pk_field = 'bucket'
+
+
+class Reply(DjangoCassandraModel):
+    comment_id = CassandraUUID(primary_key=True)
+    created_at = DateTime(primary_key=True, clustering_order="DESC")
+    id = CassandraUUID(primary_key=True, clustering_order="DESC")
+    chapter_id = CassandraUUID()
+    user_id = Integer()
+    username = Text()
+    content = Text()
+
+    class Meta:
+        get_pk_field = 'id'
+
+
+class Report(DjangoCassandraModel):
+    # One row per reporting user of a comment or reply; totals live in Redis (api.services.comments)
+    target_id = CassandraUUID(primary_key=True)
+    user_id = Integer(primary_key=True, clustering_order="ASC")
+    chapter_id = CassandraUUID()
+    comment_id = CassandraUUID()
+    reason = Text()
+    created_at = DateTime()
+
+    class Meta:
+        get_pk_field = 'user_id'
+
+
+class CommentCount(DjangoCassandraModel):
+    # Comments of a chapter or replies of a comment, keyed by its id
+    target_id = CassandraUUID(primary_key=True)
+    comments = Counter()
+
+
+class Library(DjangoCassandraModel):
+    # Books a user follows, most recently followed first; Redis mirrors the ids for is_following (api.library)
+    user_id = Integer(primary_key=True)
+    followed_at = DateTime(primary_key=True, clustering_order="DESC")
+    book_id = CassandraUUID(primary_key=True, clustering_order="DESC")
+
+    class Meta:
+        get_pk_field = 'book_id'
+
+
+class BookFollower(DjangoCassandraModel):
+    # Followers of a book, paged through by the new-chapter fan-out
+    book_id = CassandraUUID(primary_key=True)
+    user_id = Integer(primary_key=True, clustering_order="ASC")
+    followed_at = DateTime()
+
+    class Meta:
+        get_pk_field = 'user_id'
+
+
+class Inbox(DjangoCassandraModel):
+    # New chapters of a user's followed books, newest first, written with a TTL by the fan-out.
+    # Book and chapter fields are copied in so the updates feed is a single partition read.
+    user_id = Integer(primary_key=True)
+    created_at = DateTime(primary_key=True, clustering_order="DESC")
+    chapter_id = CassandraUUID(primary_key=True, clustering_order="DESC")
+    book_id = CassandraUUID()
+    book_title = Text()
+    book_permalink = Text()
+    chapter_name = Text()
+    chapter_permalink = Text()
+    number = Integer()
+
+    class Meta:
+        get_pk_field = 'chapter_id'
+
+
+class ReleaseEvent(DjangoCassandraModel):
+    # Chapter releases across all books, partitioned by RELEASE_BUCKET_SECONDS window and written with a TTL;
+    # read newest first for the latest-updates feed (api.releases)
+    bucket = Integer(primary_key=True)
+    created_at = DateTime(primary_key=True, clustering_order="DESC")
+    chapter_id = CassandraUUID(primary_key=True, clustering_order="DESC")
+    book_id = CassandraUUID()
+    chapter_name = Text()
+    chapter_permalink = Text()
+    number = Integer()
+
+    class Meta:
+        get_pk_field = 'chapter_id'
+
 
 User.add_to_class('is_banned', models.BooleanField(default=False))
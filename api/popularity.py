@@ -0,0 +1,287 @@
+import atexit
+import logging
+import threading
+import time
+import uuid
+import orjson
+from django.conf import settings
+from django.core.cache import cache
+from redis.exceptions import ResponseError
+from .redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'views:pending'
+FLUSHING_KEY = 'views:flushing'
+FLUSH_LOCK_KEY = 'views:flush_lock'
+SUMMARIES_KEY = 'popular:books'
+ALL_TIME = 'all'
+# Decayed rankings are rebased onto a new key every EPOCH_HALF_LIVES half-lives,
+# so the weight of a view never exceeds 2 ** EPOCH_HALF_LIVES
+EPOCH_HALF_LIVES = 16
+
+_lock = threading.Lock()
+_timer = None
+
+
+def get_flush_interval():
+    return getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 30)
+
+
+def get_half_lives():
+    return getattr(settings, 'POPULAR_HALF_LIVES', {'day': 60 * 60 * 6, 'week': 60 * 60 * 24 * 2})
+
+
+def get_ranking_size():
+    return getattr(settings, 'POPULAR_RANKING_SIZE', 1000)
+
+
+def get_periods():
+    return tuple(get_half_lives()) + (ALL_TIME,)
+
+
+def chapter_ref_key(key):
+    return f"chapter_ref:{key}"
+
+
+def remember_chapter(key, book_id, chapter_id):
+    """Map the URL key of a chapter (id or permalink) to its book, for resolving counted views."""
+    cache.set(chapter_ref_key(key), (str(book_id), str(chapter_id)), timeout=60 * 60 * 24 * 7)
+
+
+def record_chapter_view(key):
+    """
+    Count one read of the chapter addressed by key (its id or permalink, as
+    in the URL). Only a hash field is incremented here; books are resolved
+    and counters written when the pending counts are flushed.
+    """
+    global _timer
+    try:
+        get_redis().hincrby(PENDING_KEY, str(key), 1)
+    except Exception as e:
+        logger.warning("Could not record chapter view: %s", e)
+        return
+
+    with _lock:
+        if _timer is None:
+            _timer = threading.Timer(get_flush_interval(), flush_view_counts)
+            _timer.daemon = True
+            _timer.start()
+
+
+def epoch(period, now):
+    span = get_half_lives()[period] * EPOCH_HALF_LIVES
+    index = int(now // span)
+    return index, index * span, span
+
+
+def ranking_key(period, index=None):
+    return f"popular:{period}" if index is None else f"popular:{period}:{index}"
+
+
+def decay_weight(period, now):
+    """Weight of a view at now relative to the start of the current epoch."""
+    _, start, _ = epoch(period, now)
+    return 2 ** ((now - start) / get_half_lives()[period])
+
+
+def carry_over(redis, period, index, span):
+    # Scores of the previous epoch, scaled to the new epoch start
+    key = ranking_key(period, index)
+    redis.zunionstore(key, {key: 1, ranking_key(period, index - 1): 2 ** -EPOCH_HALF_LIVES})
+    redis.expire(key, int(span * 2))
+
+
+def roll_over(redis, period, now):
+    """Current key of a decayed ranking, carrying the previous epoch over the first time it is used."""
+    index, _, span = epoch(period, now)
+    key = ranking_key(period, index)
+    if redis.set(f"{key}:merged", 1, nx=True, ex=int(span * 2)):
+        carry_over(redis, period, index, span)
+    return key
+
+
+def resolve_chapters(keys):
+    """(book_id, chapter_id) for each counted key; keys never rendered (or expired) are dropped."""
+    refs = {}
+    for key in keys:
+        book_id, separator, chapter_id = key.partition('/')
+        if separator:
+            refs[key] = (book_id, chapter_id)
+    unknown = [key for key in keys if key not in refs]
+    if unknown:
+        found = cache.get_many([chapter_ref_key(key) for key in unknown])
+        for key in unknown:
+            ref = found.get(chapter_ref_key(key))
+            if ref is not None:
+                refs[key] = tuple(ref)
+    return refs
+
+
+def write_view_counters(deltas):
+    """
+    Add the per-chapter deltas to the chapter_views and book_views counter
+    tables, one counter batch per chapter. Returns the deltas that failed.
+    """
+    from cassandra.concurrent import execute_concurrent
+    from cassandra.cqlengine import connection
+    from cassandra.query import BatchStatement, BatchType, SimpleStatement
+    from .models import BookViews, ChapterViews
+    from .services.chapters import get_write_concurrency
+
+    session = connection.get_session()
+    chapter_update = SimpleStatement("UPDATE {} SET views = views + %s WHERE book_id = %s AND chapter_id = %s".format(
+        ChapterViews.column_family_name()))
+    book_update = SimpleStatement("UPDATE {} SET views = views + %s WHERE book_id = %s".format(
+        BookViews.column_family_name()))
+
+    items = list(deltas.items())
+    statements = []
+    for (book_id, chapter_id), count in items:
+        batch = BatchStatement(batch_type=BatchType.COUNTER)
+        batch.add(chapter_update, (count, uuid.UUID(book_id), uuid.UUID(chapter_id)))
+        batch.add(book_update, (count, uuid.UUID(book_id)))
+        statements.append((batch, ()))
+    results = execute_concurrent(
+        session, statements, concurrency=get_write_concurrency(), raise_on_first_error=False)
+    return {ref: count for (ref, count), (success, _) in zip(items, results) if not success}
+
+
+def refresh_summaries(redis, keys):
+    """
+    Store list summaries of the books currently ranked, so the popular
+    endpoint never touches the database, and drop deleted books from the rankings.
+    """
+    from .models import Book
+    from .serializers import BookListViewSerializer
+
+    limit = getattr(settings, 'POPULAR_MAX_LIMIT', 100)
+    pipe = redis.pipeline(transaction=False)
+    for key in keys:
+        pipe.zrevrange(key, 0, limit - 1)
+    ids = {member.decode() for members in pipe.execute() for member in members}
+    books = Book.objects.filter(id__in=ids).prefetch_related('genres') if ids else []
+    summaries = {str(data['id']): orjson.dumps(data) for data in BookListViewSerializer(books, many=True).data}
+
+    pipe = redis.pipeline(transaction=True)
+    pipe.delete(SUMMARIES_KEY)
+    if summaries:
+        pipe.hset(SUMMARIES_KEY, mapping=summaries)
+    missing = ids - set(summaries)
+    if missing:
+        for key in keys:
+            pipe.zrem(key, *missing)
+    pipe.execute()
+
+
+def flush_view_counts():
+    """
+    Move the pending view counts out of Redis: counters are added in
+    Cassandra, the rankings get the aggregated increments and the ranked book
+    summaries are refreshed. A flush left unfinished by a crash is picked up
+    by the next one. Returns the number of views flushed.
+    """
+    global _timer
+    with _lock:
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+
+    if not cache.add(FLUSH_LOCK_KEY, 1, timeout=get_flush_interval() * 4):
+        return 0
+    try:
+        return _flush(get_redis())
+    except Exception as e:
+        logger.error("Flushing view counts failed: %s", e, exc_info=e)
+        return 0
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+
+def _flush(redis):
+    if not redis.exists(FLUSHING_KEY):
+        try:
+            redis.rename(PENDING_KEY, FLUSHING_KEY)
+        except ResponseError:
+            return 0  # nothing pending
+
+    counts = {key.decode(): int(value) for key, value in redis.hgetall(FLUSHING_KEY).items()}
+    refs = resolve_chapters(counts)
+    deltas = {}
+    for key, count in counts.items():
+        if key in refs:
+            deltas[refs[key]] = deltas.get(refs[key], 0) + count
+    if len(refs) < len(counts):
+        logger.info("Dropped views of %d unresolved chapter keys", len(counts) - len(refs))
+
+    failed = write_view_counters(deltas) if deltas else {}
+    # Requeued views are ranked by the flush that writes their counters, not twice
+    books = {}
+    for (book_id, chapter_id), count in deltas.items():
+        if (book_id, chapter_id) not in failed:
+            books[book_id] = books.get(book_id, 0) + count
+
+    now = time.time()
+    size = get_ranking_size()
+    keys = {period: roll_over(redis, period, now) for period in get_half_lives()}
+    ranked_keys = list(keys.values()) + [ranking_key(ALL_TIME)]
+    pipe = redis.pipeline(transaction=True)
+    for book_id, count in books.items():
+        for period, key in keys.items():
+            pipe.zincrby(key, count * decay_weight(period, now), book_id)
+        pipe.zincrby(ranking_key(ALL_TIME), count, book_id)
+    for key in ranked_keys:
+        pipe.zremrangebyrank(key, 0, -(size + 1))
+    # Failed counter writes go back to the pending hash under a key that resolves by itself
+    for (book_id, chapter_id), count in failed.items():
+        pipe.hincrby(PENDING_KEY, f"{book_id}/{chapter_id}", count)
+    pipe.delete(FLUSHING_KEY)
+    pipe.execute()
+
+    if books:
+        refresh_summaries(redis, ranked_keys)
+    if failed:
+        logger.warning("%d chapter view counters could not be written and were requeued", len(failed))
+    return sum(deltas.values())
+
+
+def popular_books(period, limit):
+    """
+    Top books of a ranking with their stored summaries, read from Redis
+    only. Scores of decayed periods are views weighted down by age, as of now.
+    """
+    redis = get_redis()
+    if period == ALL_TIME:
+        weight = 1
+        ranked = redis.zrevrange(ranking_key(ALL_TIME), 0, limit - 1, withscores=True)
+    else:
+        now = time.time()
+        index, _, span = epoch(period, now)
+        key = ranking_key(period, index)
+        weight = decay_weight(period, now)
+        pipe = redis.pipeline(transaction=False)
+        pipe.set(f"{key}:merged", 1, nx=True, ex=int(span * 2))
+        pipe.zrevrange(key, 0, limit - 1, withscores=True)
+        first_use, ranked = pipe.execute()
+        if first_use:
+            carry_over(redis, period, index, span)
+            ranked = redis.zrevrange(key, 0, limit - 1, withscores=True)
+    if not ranked:
+        return []
+    summaries = redis.hmget(SUMMARIES_KEY, [member for member, _ in ranked])
+    results = []
+    for (_, score), summary in zip(ranked, summaries):
+        if summary is not None:
+            results.append(dict(orjson.loads(summary), score=round(score / weight, 2)))
+    return results
+
+
+def reset_after_fork():
+    # A flush timer started before the fork has no thread in the child
+    global _timer, _lock
+    _timer = None
+    _lock = threading.Lock()
+
+
+atexit.register(flush_view_counts)
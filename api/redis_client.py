@@ -0,0 +1,6 @@
+from django_redis import get_redis_connection
+
+
+def get_redis(alias='default'):
+    """Raw client of the django_redis cache, for sets/hashes/scripts the cache API lacks."""
+    return get_redis_connection(alias)
@@ -0,0 +1,144 @@
+import logging
+import uuid
+from datetime import timezone as dt_timezone
+from django.conf import settings
+from .caching import invalidate
+from .redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+# book id -> id of its newest released chapter, so older events of a book are skipped on every page
+LATEST_KEY = 'releases:latest'
+
+RELEASE_COLUMNS = ('bucket', 'created_at', 'chapter_id', 'book_id', 'chapter_name', 'chapter_permalink', 'number')
+
+
+def get_bucket_seconds():
+    return getattr(settings, 'RELEASE_BUCKET_SECONDS', 60 * 60 * 24)
+
+
+def get_max_buckets():
+    return getattr(settings, 'RELEASE_FEED_MAX_BUCKETS', 7)
+
+
+def get_event_ttl():
+    return getattr(settings, 'RELEASE_EVENT_TTL', 60 * 60 * 24 * 30)
+
+
+def to_event_time(moment):
+    """Naive UTC at ms precision, as Cassandra returns it, so cursors compare exactly."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return moment.replace(microsecond=moment.microsecond // 1000 * 1000)
+
+
+def bucket_of(moment):
+    from .services.chapters import to_millis
+
+    return to_millis(moment) // 1000 // get_bucket_seconds()
+
+
+def record_release(book_id, chapter_id, name, permalink, number, created_at):
+    """Write a release event into its time bucket and mark it as the book's newest chapter."""
+    from cassandra.cqlengine import connection
+    from .models import ReleaseEvent
+    from .services.chapters import execute_writes, insert_query
+
+    created_at = to_event_time(created_at)
+    values = (bucket_of(created_at), created_at, uuid.UUID(str(chapter_id)), uuid.UUID(str(book_id)),
+              name, permalink, number)
+    insert = insert_query(ReleaseEvent, RELEASE_COLUMNS).format(placeholder='?') + f" USING TTL {int(get_event_ttl())}"
+    execute_writes(connection.get_session(), [(insert, [values])])
+    try:
+        get_redis().hset(LATEST_KEY, str(book_id), str(chapter_id))
+    except Exception as e:
+        # Without the mark, older events of the book are only deduplicated within a page
+        logger.warning("Could not mark latest release: %s", e)
+    invalidate("releases")
+
+
+def forget_release(book_id, chapter_id, created_at):
+    """Remove a deleted chapter's release event (a no-op if it has expired or was never recorded)."""
+    forget_releases(book_id, [(chapter_id, created_at)])
+
+
+def forget_releases(book_id, chapters):
+    """Remove the release events of a book's deleted chapters, given [(chapter id, date_created)]."""
+    from cassandra.cqlengine import connection
+    from .models import ReleaseEvent
+    from .services.chapters import execute_writes
+
+    events = []
+    for chapter_id, created_at in chapters:
+        created_at = to_event_time(created_at)
+        events.append((bucket_of(created_at), created_at, uuid.UUID(str(chapter_id))))
+    if not events:
+        return
+    execute_writes(connection.get_session(), [(
+        f"DELETE FROM {ReleaseEvent.column_family_name()} WHERE bucket = ? AND created_at = ? AND chapter_id = ?",
+        events)])
+    try:
+        redis = get_redis()
+        latest = redis.hget(LATEST_KEY, str(book_id))
+        if latest is not None and latest.decode() in {str(chapter_id) for chapter_id, _ in chapters}:
+            redis.hdel(LATEST_KEY, str(book_id))
+    except Exception as e:
+        logger.warning("Could not clear latest release: %s", e)
+    invalidate("releases")
+
+
+def get_latest_marks(book_ids):
+    if not book_ids:
+        return {}
+    try:
+        values = get_redis().hmget(LATEST_KEY, [str(book_id) for book_id in book_ids])
+    except Exception as e:
+        logger.warning("Latest releases unavailable: %s", e)
+        return {}
+    return {book_id: value.decode() for book_id, value in zip(book_ids, values) if value is not None}
+
+
+def page_releases(page_size, cursor=None):
+    """
+    One page of the latest-updates feed: the newest release event of each
+    book, newest first. Buckets are read from the cursor's (or the current)
+    one back through RELEASE_FEED_MAX_BUCKETS, in chunks, until the page is
+    full; a page usually costs one or two partition reads. An event is kept
+    only if it is its book's newest release (releases:latest) and the book is
+    not already on the page. Returns (rows, next_cursor).
+    """
+    from cassandra.cqlengine import connection
+    from django.utils import timezone
+    from .models import ReleaseEvent
+    from .services.chapters import decode_time_cursor, encode_time_cursor
+
+    session = connection.get_session()
+    after = decode_time_cursor(cursor)
+    start = bucket_of(after[0]) if after else bucket_of(to_event_time(timezone.now()))
+    query = "SELECT {} FROM {} WHERE bucket = %s".format(', '.join(RELEASE_COLUMNS), ReleaseEvent.column_family_name())
+    chunk = page_size * 2 + 1
+
+    rows, books = [], set()
+    for bucket in range(start, start - get_max_buckets(), -1):
+        position = after if bucket == start else None
+        while True:
+            bucket_query, params = query, [bucket]
+            if position:
+                bucket_query += " AND (created_at, chapter_id) < (%s, %s)"
+                params.extend(position)
+            events = list(session.execute(bucket_query + " LIMIT %s", params + [chunk]))
+            marks = get_latest_marks(list({event['book_id'] for event in events}))
+            for event in events:
+                mark = marks.get(event['book_id'])
+                if event['book_id'] in books or (mark is not None and mark != str(event['chapter_id'])):
+                    continue
+                books.add(event['book_id'])
+                rows.append(event)
+                if len(rows) > page_size:
+                    last = rows[page_size - 1]
+                    return rows[:page_size], encode_time_cursor(last['created_at'], last['chapter_id'])
+            if len(events) < chunk:
+                break
+            position = (events[-1]['created_at'], events[-1]['chapter_id'])
+    return rows, None
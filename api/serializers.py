@@ -5,11 +5,14 @@ from .models import Book, Genre, Volume, Chapter, Status
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .custom_fields import UUIDField, TextField, DateTimeField, IntegerField, BooleanField
 import uuid
-from django.core.files.base import ContentFile
-import requests
+from .jobs import enqueue
 from django.core.cache import cache
+from django.conf import settings
 from rest_framework.pagination import PageNumberPagination
-from cassandra.cqlengine import connection
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .caching import get_generation, single_flight
+from .library import is_following
+from .services.chapters import count_volume_chapters, page_volume_chapters
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -167,42 +170,52 @@ class VolumeSerializer(serializers.ModelSerializer):
             return []
 
         paginator = ChapterPagination()
-        page = request.query_params.get(paginator.page_query_param, 1)
-        page_size = request.query_params.get(paginator.page_size_query_param, paginator.page_size)
-        cache_key = f"chapters_{obj.id}_{page}_{page_size}"
+        try:
+            page = max(int(request.query_params.get(paginator.page_query_param, 1)), 1)
+            page_size = max(1, min(int(request.query_params.get(paginator.page_size_query_param, paginator.page_size)),
+                                   paginator.max_page_size))
+        except ValueError:
+            page, page_size = 1, paginator.page_size
+        cursor = request.query_params.get('cursor')
+
+        generation = get_generation(f"volume:{obj.id}")
+        cache_key = f"chapters_{obj.id}_{generation}_{cursor or page}_{page_size}"
         cached_chapters = cache.get(cache_key)
         if cached_chapters is not None:
             return cached_chapters
 
-        
-        query = f"""
-        SELECT id, permalink, name, date_updated FROM doctruyen.chapter 
-        WHERE volume_id = {obj.id}
-        ALLOW FILTERING
-        """
-        session = connection.get_session()
-        rows = session.execute(query)
-        chapters_queryset = list(rows)
-        paginated_chapters = paginator.paginate_queryset(chapters_queryset, request)
-        
-
-        response_data = paginator.get_paginated_response(ChapterSummarySerializer(paginated_chapters, many=True).data).data
-
-        # Cache the response data
-        cache.set(cache_key, response_data, timeout=60*60)  # Cache for 15 minutes
-
+        def render():
+            rows, next_cursor, previous_cursor = page_volume_chapters(obj.id, page_size, cursor=cursor, page=page)
+            count_key = f"chapters_count_{obj.id}_{generation}"
+            count = cache.get(count_key)
+            if count is None:
+                count = count_volume_chapters(obj.id)
+                cache.set(count_key, count, timeout=60*60)
+
+            url = request.build_absolute_uri()
+            url = remove_query_param(url, paginator.page_query_param)
+            response_data = {
+                'count': count,
+                'next': replace_query_param(url, 'cursor', next_cursor) if next_cursor else None,
+                'previous': replace_query_param(url, 'cursor', previous_cursor) if previous_cursor else None,
+                'results': ChapterSummarySerializer(rows, many=True).data,
+            }
+
+            # Keys embed the volume generation, so adding a chapter retires every cached page
+            cache.set(cache_key, response_data, timeout=60*60)
+            return response_data
+
+        # A release sends many readers to the same new page at once: one of them reads Cassandra
+        response_data, _ = single_flight(cache_key, render)
         return response_data
-    
+
 
 
 class ImageURLField(serializers.ImageField):
+    # URLs are kept as strings and downloaded by the book.cover job (api.tasks) after the save
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('http'):
-            response = requests.get(data)
-            if response.status_code == 200:
-                file_name = str(uuid.uuid4()) + '.jpg'
-                return ContentFile(response.content, name=file_name)
-            raise serializers.ValidationError("Failed to download image.")
+            return serializers.URLField().run_validation(data)
         return super().to_internal_value(data)
 
 class BookListViewSerializer(serializers.ModelSerializer):
@@ -223,6 +236,12 @@ class BookDetailViewSerializer(serializers.ModelSerializer):
         model = Book
         fields = "__all__"
 
+    def get_is_following(self, obj):
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return False
+        return is_following(request.user.id, obj.id)
+
 
 
 class BookSerializer(serializers.ModelSerializer):
@@ -237,8 +256,13 @@ class BookSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         genres_data = validated_data.pop('genres', [])
+        cover_url = validated_data.get('cover_image')
+        if isinstance(cover_url, str):
+            validated_data['cover_image'] = ''
         book = Book.objects.create(**validated_data)
         book.genres.set(genres_data)
+        if isinstance(cover_url, str):
+            enqueue('book.cover', str(book.id), cover_url, key=f"cover:{book.id}")
         return book
 
 
@@ -260,3 +284,29 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         if user is not None:
             credentials['username'] = user.username
         return super().validate(credentials)
+
+
+class CommentSerializer(serializers.Serializer):
+    # Rows come from api.services.comments; reply counts are passed in the context
+    id = UUIDField(read_only=True)
+    user_id = serializers.IntegerField(read_only=True)
+    username = serializers.CharField(read_only=True)
+    content = serializers.CharField(max_length=getattr(settings, 'COMMENT_MAX_LENGTH', 2000), trim_whitespace=True)
+    created_at = serializers.DateTimeField(read_only=True)
+    reply_count = serializers.SerializerMethodField()
+
+    def get_reply_count(self, obj):
+        return self.context.get('reply_counts', {}).get(obj['id'], 0)
+
+
+class ReplySerializer(serializers.Serializer):
+    id = UUIDField(read_only=True)
+    comment_id = UUIDField(read_only=True)
+    user_id = serializers.IntegerField(read_only=True)
+    username = serializers.CharField(read_only=True)
+    content = serializers.CharField(max_length=getattr(settings, 'COMMENT_MAX_LENGTH', 2000), trim_whitespace=True)
+    created_at = serializers.DateTimeField(read_only=True)
+
+
+class ReportSerializer(serializers.Serializer):
+    reason = serializers.CharField(max_length=500, required=False, allow_blank=True, default='')
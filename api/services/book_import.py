@@ -0,0 +1,200 @@
+import csv
+import io
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from api.caching import invalidate
+from api.facets import apply_facet_deltas
+from api.suggest import publish_book_changes
+from api.models import Book, Genre, Status
+from api.utils import fetch_image, generate_permalink
+
+
+SUPPORTED_FORMATS = ('csv', 'jsonl')
+
+
+def read_csv(fileobj):
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig') if not isinstance(fileobj, io.TextIOBase) else fileobj
+    for line_number, row in enumerate(csv.DictReader(text), start=2):
+        yield line_number, row
+
+
+def read_jsonl(fileobj):
+    for line_number, line in enumerate(fileobj, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8-sig')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+def read_rows(fileobj, fmt):
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValidationError(f"Unsupported import format '{fmt}'. Use one of: {', '.join(SUPPORTED_FORMATS)}.")
+    return read_csv(fileobj) if fmt == 'csv' else read_jsonl(fileobj)
+
+
+def split_names(value):
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        names = value
+    else:
+        names = re.split(r'[|;,]', value)
+    return [name.strip() for name in names if name and name.strip()]
+
+
+class CatalogueMaps:
+    """Genre and Status rows keyed by lower-cased name, loaded once per import."""
+
+    def __init__(self):
+        self.genres = {genre.name.lower(): genre for genre in Genre.objects.all()}
+        self.statuses = {status.name.lower(): status for status in Status.objects.all()}
+
+    def genre(self, name):
+        genre = self.genres.get(name.lower())
+        if genre is None:
+            genre = Genre(name=name)
+            genre.save()
+            self.genres[name.lower()] = genre
+        return genre
+
+    def status(self, name):
+        if not name:
+            return None
+        status = self.statuses.get(name.lower())
+        if status is None:
+            status = Status.objects.create(name=name)
+            self.statuses[name.lower()] = status
+        return status
+
+
+def build_book(row, maps, posted_by):
+    title = (row.get('title') or '').strip()
+    if not title:
+        raise ValidationError("Missing title.")
+    book = Book(
+        title=title,
+        description=row.get('description') or '',
+        author=(row.get('author') or '').strip() or 'unknown',
+        posted_by=posted_by,
+        status=maps.status((row.get('status') or '').strip()),
+        permalink=(row.get('permalink') or '').strip() or generate_permalink(title),
+        cover_image='',
+    )
+    book.search_vector = book.get_search_vector()
+    genres = [maps.genre(name) for name in split_names(row.get('genres'))]
+    return book, genres
+
+
+def insert_chunk(chunk):
+    books = [book for book, _, _, _ in chunk]
+    through = Book.genres.through
+    links = [through(book_id=book.id, genre_id=genre.id)
+             for book, genres, _, _ in chunk for genre in genres]
+    genres, statuses = {}, {}
+    for link in links:
+        genres[link.genre_id] = genres.get(link.genre_id, 0) + 1
+    for book in books:
+        statuses[book.status_id] = statuses.get(book.status_id, 0) + 1
+    with transaction.atomic():
+        Book.objects.bulk_create(books)
+        through.objects.bulk_create(links, ignore_conflicts=True)
+        # bulk_create sends no signals
+        apply_facet_deltas(genres, statuses)
+        publish_book_changes('save', *(book.id for book in books))
+
+
+def insert_rows(chunk):
+    """
+    Insert a chunk in one transaction; if the database rejects it (duplicate
+    permalink, bad reference), retry its rows one by one so only the offending
+    rows are lost. Returns (inserted entries, [(line, error)]).
+    """
+    try:
+        insert_chunk(chunk)
+        return chunk, []
+    except IntegrityError as e:
+        if len(chunk) == 1:
+            return [], [(chunk[0][3], str(e).strip())]
+    inserted, failures = [], []
+    for entry in chunk:
+        try:
+            insert_chunk([entry])
+            inserted.append(entry)
+        except IntegrityError as e:
+            failures.append((entry[3], str(e).strip()))
+    return inserted, failures
+
+
+def import_books(fileobj, fmt, posted_by, chunk_size=500):
+    """
+    Insert books from CSV/JSONL rows with bulk_create, computing permalink and
+    search_vector up front so no follow-up UPDATE is needed. Rows the database
+    rejects are reported in 'failed' with the others. Cover URLs are returned
+    as (book_id, url) pairs for download_covers().
+    """
+    if not isinstance(posted_by, User):
+        try:
+            posted_by = User.objects.get(username=posted_by)
+        except User.DoesNotExist:
+            raise ValidationError(f"User '{posted_by}' not found.")
+
+    maps = CatalogueMaps()
+    result = {'created': 0, 'failed': [], 'covers': []}
+    chunk = []
+
+    def flush():
+        inserted, failures = insert_rows(chunk)
+        result['created'] += len(inserted)
+        result['covers'].extend((book.id, url) for book, _, url, _ in inserted if url)
+        result['failed'].extend({'line': line, 'error': error} for line, error in failures)
+        chunk.clear()
+
+    for line_number, row in read_rows(fileobj, fmt):
+        if not isinstance(row, dict):
+            result['failed'].append({'line': line_number, 'error': "Invalid row."})
+            continue
+        try:
+            book, genres = build_book(row, maps, posted_by)
+        except ValidationError as e:
+            result['failed'].append({'line': line_number, 'error': ' '.join(e.messages)})
+            continue
+        cover_url = (row.get('cover_url') or row.get('cover_image') or '').strip()
+        chunk.append((book, genres, cover_url if cover_url.startswith('http') else None, line_number))
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    if result['created']:
+        invalidate("books")
+    return result
+
+
+def download_cover(book_id, url):
+    image = fetch_image(url)
+    if image is None:
+        return False
+    field = Book._meta.get_field('cover_image')
+    name = field.storage.save(field.generate_filename(None, image.name), image)
+    Book.objects.filter(id=book_id).update(cover_image=name)
+    return True
+
+
+def download_covers(covers, workers=8):
+    """Fetch deferred cover images concurrently; returns the number downloaded."""
+    def safe_download(pair):
+        try:
+            return download_cover(*pair)
+        except Exception:
+            return False
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(safe_download, covers))
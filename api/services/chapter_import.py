@@ -0,0 +1,267 @@
+import io
+import json
+import posixpath
+import re
+import uuid
+import zipfile
+from xml.etree import ElementTree
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.html import strip_tags
+from api.models import Book, Volume, Chapter
+from api.touch import touch_book
+from api.utils import generate_permalink
+from api.library import announce_chapter
+from api.releases import record_release
+from api.warmup import get_warmup_chapters, schedule_release_warmup
+from .chapters import write_chapters
+
+
+SUPPORTED_FORMATS = ('json', 'zip', 'epub')
+
+EPUB_NAMESPACES = {
+    'container': 'urn:oasis:names:tc:opendocument:xmlns:container',
+    'opf': 'http://www.idpf.org/2007/opf',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+}
+
+
+def natural_key(value):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', value)]
+
+
+def detect_format(filename, fmt=None):
+    if fmt:
+        fmt = fmt.lower()
+    elif filename:
+        fmt = posixpath.splitext(filename)[1].lstrip('.').lower()
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValidationError(f"Unsupported import format '{fmt}'. Use one of: {', '.join(SUPPORTED_FORMATS)}.")
+    return fmt
+
+
+def parse_json(data):
+    """
+    Accepts either a single volume ({"volume_id" | "volume_name", "chapters": [...]})
+    or a whole book ({"volumes": [{"id" | "name", "chapters": [...]}]}).
+    """
+    if isinstance(data, (bytes, str)):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            raise ValidationError("Invalid JSON payload.")
+    if not isinstance(data, dict):
+        raise ValidationError("JSON payload must be an object.")
+
+    if 'volumes' in data:
+        volumes = data['volumes']
+        if not isinstance(volumes, list):
+            raise ValidationError("'volumes' must be a list.")
+    else:
+        volumes = [{
+            'id': data.get('volume_id'),
+            'name': data.get('volume_name'),
+            'chapters': data.get('chapters'),
+        }]
+
+    parsed = []
+    for volume in volumes:
+        if not isinstance(volume, dict):
+            raise ValidationError("Each volume must be an object.")
+        chapters = volume.get('chapters')
+        if not isinstance(chapters, list):
+            raise ValidationError("Each volume needs a 'chapters' list.")
+        if not all(isinstance(chapter, dict) for chapter in chapters):
+            raise ValidationError("Each chapter must be an object.")
+        parsed.append({
+            'volume_id': volume.get('id') or volume.get('volume_id'),
+            'name': volume.get('name'),
+            'chapters': [{
+                'name': chapter.get('name'),
+                'content': chapter.get('content', ''),
+                'permalink': chapter.get('permalink'),
+            } for chapter in chapters],
+        })
+    return parsed
+
+
+def parse_zip(fileobj):
+    """
+    Text files at the archive root go to the target volume; files inside a
+    top-level folder go to a volume named after that folder. Files are ordered
+    by natural sort and the file name (without extension) becomes the chapter name.
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise ValidationError("Invalid zip archive.")
+
+    volumes = {}
+    with archive:
+        names = sorted((name for name in archive.namelist()
+                        if not name.endswith('/') and name.lower().endswith('.txt')), key=natural_key)
+        for name in names:
+            folder, filename = posixpath.split(name)
+            volume_name = folder.split('/')[0] if folder else None
+            try:
+                content = archive.read(name).decode('utf-8-sig')
+            except UnicodeDecodeError:
+                raise ValidationError(f"'{name}' is not UTF-8 text.")
+            volumes.setdefault(volume_name, []).append({
+                'name': posixpath.splitext(filename)[0],
+                'content': content.strip(),
+                'permalink': None,
+            })
+
+    if not volumes:
+        raise ValidationError("The archive does not contain any .txt files.")
+    return [{'volume_id': None, 'name': volume_name, 'chapters': chapters}
+            for volume_name, chapters in sorted(volumes.items(), key=lambda item: natural_key(item[0] or ''))]
+
+
+def html_to_text(markup):
+    markup = re.sub(r'(?is)<(script|style|head)[^>]*>.*?</\1>', '', markup)
+    markup = re.sub(r'(?i)<br\s*/?>', '\n', markup)
+    markup = re.sub(r'(?i)</(p|div|h[1-6]|li)>', '\n\n', markup)
+    text = strip_tags(markup)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+
+def html_title(markup):
+    for pattern in (r'(?is)<h[1-3][^>]*>(.*?)</h[1-3]>', r'(?is)<title[^>]*>(.*?)</title>'):
+        match = re.search(pattern, markup)
+        if match and strip_tags(match.group(1)).strip():
+            return strip_tags(match.group(1)).strip()
+    return None
+
+
+def parse_epub(fileobj):
+    """Reads the OPF spine in order; every non-empty document becomes a chapter."""
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise ValidationError("Invalid EPUB file.")
+
+    chapters = []
+    with archive:
+        try:
+            container = ElementTree.fromstring(archive.read('META-INF/container.xml'))
+            rootfile = container.find('.//container:rootfile', EPUB_NAMESPACES).get('full-path')
+            package = ElementTree.fromstring(archive.read(rootfile))
+        except (KeyError, AttributeError, ElementTree.ParseError):
+            raise ValidationError("Invalid EPUB file: missing or broken package document.")
+
+        base = posixpath.dirname(rootfile)
+        manifest = {item.get('id'): item.get('href')
+                    for item in package.findall('.//opf:manifest/opf:item', EPUB_NAMESPACES)}
+        for itemref in package.findall('.//opf:spine/opf:itemref', EPUB_NAMESPACES):
+            href = manifest.get(itemref.get('idref'))
+            if not href:
+                continue
+            try:
+                markup = archive.read(posixpath.normpath(posixpath.join(base, href))).decode('utf-8')
+            except KeyError:
+                continue
+            content = html_to_text(markup)
+            if not content:
+                continue
+            chapters.append({
+                'name': html_title(markup) or f"Chapter {len(chapters) + 1}",
+                'content': content,
+                'permalink': None,
+            })
+
+    if not chapters:
+        raise ValidationError("The EPUB does not contain any readable chapters.")
+    return [{'volume_id': None, 'name': None, 'chapters': chapters}]
+
+
+def parse_source(fileobj, fmt):
+    if fmt == 'json':
+        return parse_json(fileobj.read())
+    if not hasattr(fileobj, 'seek'):
+        fileobj = io.BytesIO(fileobj.read())
+    if fmt == 'zip':
+        return parse_zip(fileobj)
+    return parse_epub(fileobj)
+
+
+def resolve_volumes(book, parsed_volumes, volume_id=None, volume_name=None):
+    """Maps each parsed volume onto a Volume of the book, creating named volumes on demand."""
+    existing = {volume.id: volume for volume in Volume.objects.filter(book=book)}
+    by_name = {volume.name: volume for volume in existing.values()}
+    resolved = []
+    for parsed in parsed_volumes:
+        target_id = parsed['volume_id'] or (volume_id if not parsed['name'] else None)
+        target_name = parsed['name'] or (volume_name if not target_id else None)
+        if target_id:
+            try:
+                volume = existing.get(uuid.UUID(str(target_id)))
+            except ValueError:
+                volume = None
+            if volume is None:
+                raise ValidationError(f"Volume {target_id} does not belong to this book.")
+        elif target_name:
+            volume = by_name.get(target_name)
+            if volume is None:
+                volume = by_name[target_name] = Volume.objects.create(book=book, name=target_name)
+        else:
+            raise ValidationError("A target volume (volume_id or volume_name) is required.")
+        resolved.append((volume, parsed['chapters']))
+    return resolved
+
+
+def import_chapters(book, parsed_volumes, volume_id=None, volume_name=None,
+                    concurrency=None, batch_size=None):
+    if not isinstance(book, Book):
+        try:
+            book = Book.objects.get(id=book)
+        except (Book.DoesNotExist, ValueError, ValidationError):
+            raise ValidationError("Book not found.")
+
+    resolved = resolve_volumes(book, parsed_volumes, volume_id, volume_name)
+    total = sum(len(chapters) for _, chapters in resolved)
+    if not total:
+        raise ValidationError("Nothing to import.")
+
+    numbers = iter(Chapter.reserve_numbers(book.id, total))
+    now = timezone.now()
+    rows = []
+    for volume, chapters in resolved:
+        for chapter in chapters:
+            name = (chapter.get('name') or '').strip() or 'Untitled'
+            rows.append({
+                'book_id': book.id,
+                'number': next(numbers),
+                'id': uuid.uuid4(),
+                'volume_id': volume.id,
+                'name': name,
+                'date_created': now,
+                'date_updated': now,
+                'content': chapter.get('content') or '',
+                'permalink': chapter.get('permalink') or generate_permalink(name),
+            })
+
+    failures = write_chapters(rows, concurrency=concurrency, batch_size=batch_size)
+    if len(failures) < len(rows):
+        touch_book(book.id)
+        failed = {row['id'] for row, _ in failures}
+        written = [row for row in rows if row['id'] not in failed]
+        schedule_release_warmup(book.id, {row['volume_id'] for row in written},
+                                [row['permalink'] for row in written[-get_warmup_chapters():]])
+        # Followers and the latest-updates feed get one entry per import, for its newest chapter
+        latest = written[-1]
+        announce_chapter(book.id, latest['id'], latest['name'], latest['permalink'], latest['number'], now)
+        record_release(book.id, latest['id'], latest['name'], latest['permalink'], latest['number'], now)
+
+    return {
+        'book_id': str(book.id),
+        'created': len(rows) - len(failures),
+        'first_number': rows[0]['number'],
+        'last_number': rows[-1]['number'],
+        'failed': [{
+            'number': row['number'],
+            'name': row['name'],
+            'error': str(error) or error.__class__.__name__,
+        } for row, error in failures],
+    }
@@ -0,0 +1,349 @@
+from django.conf import settings
+from cassandra.concurrent import execute_concurrent, execute_concurrent_with_args
+from cassandra.cqlengine import connection
+from cassandra.query import BatchStatement, BatchType, SimpleStatement
+import base64
+import json
+import uuid
+from datetime import datetime, timedelta
+from api.caching import invalidate
+from api.models import Chapter, ChapterByName, ChapterByVolume
+from api.releases import forget_releases
+from api.touch import touch_book
+from api.utils import normalize_text
+
+
+CHAPTER_COLUMNS = ('book_id', 'number', 'id', 'volume_id', 'name',
+                   'date_created', 'date_updated', 'content', 'permalink')
+VOLUME_LOOKUP_COLUMNS = ('volume_id', 'number', 'id', 'book_id', 'name', 'permalink', 'date_updated')
+NAME_LOOKUP_COLUMNS = ('book_id', 'name_key', 'number', 'id', 'name', 'volume_id', 'date_created', 'date_updated')
+LOOKUP_SOURCE_COLUMNS = ('book_id', 'number', 'id', 'volume_id', 'name', 'permalink', 'date_created', 'date_updated')
+SUMMARY_COLUMNS = ('number', 'id', 'name', 'permalink', 'date_updated')
+BROWSE_COLUMNS = ('book_id', 'number', 'id', 'volume_id', 'name', 'date_created', 'date_updated')
+
+EPOCH = datetime(1970, 1, 1)
+
+_prepared = {}
+
+
+def get_write_concurrency(concurrency=None):
+    limit = getattr(settings, 'CHAPTER_WRITE_CONCURRENCY', 32)
+    if not concurrency:
+        return limit
+    return max(1, min(int(concurrency), limit))
+
+
+def get_prepared(session, query):
+    statement = _prepared.get(query)
+    if statement is None:
+        statement = _prepared[query] = session.prepare(query)
+    return statement
+
+
+def execute_writes(session, writes):
+    """Run (query, rows of values) pairs as prepared statements, concurrently; raises the first failure."""
+    for query, rows in writes:
+        for success, result in execute_concurrent_with_args(session, get_prepared(session, query), rows):
+            if not success:
+                raise result
+
+
+def reset_after_fork():
+    # Prepared statements belong to the session they were prepared on
+    _prepared.clear()
+
+
+def insert_query(model, columns):
+    return "INSERT INTO {} ({}) VALUES ({})".format(
+        model.column_family_name(),
+        ', '.join(columns),
+        ', '.join(['{placeholder}'] * len(columns)),
+    )
+
+
+def row_values(row, columns):
+    return tuple(row.get(column) for column in columns)
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+CHAPTER_TARGET = (Chapter, CHAPTER_COLUMNS, 'book_id')
+LOOKUP_TARGETS = (
+    (ChapterByVolume, VOLUME_LOOKUP_COLUMNS, 'volume_id'),
+    (ChapterByName, NAME_LOOKUP_COLUMNS, 'book_id'),
+)
+
+
+def partition_statements(session, query, columns, partition_key, rows, batch_size):
+    """
+    Statements for executing query once per row: prepared single statements
+    when batch_size <= 1, otherwise unlogged batches that never span partitions.
+    Returns (groups, statements) where groups[i] are the rows behind statements[i].
+    """
+    if batch_size <= 1:
+        statement = get_prepared(session, query.format(placeholder='?'))
+        return [[row] for row in rows], [(statement, row_values(row, columns)) for row in rows]
+
+    query = query.format(placeholder='%s')
+    partitions = {}
+    for row in rows:
+        partitions.setdefault(row[partition_key], []).append(row)
+    groups, statements = [], []
+    for partition_rows in partitions.values():
+        for group in chunked(partition_rows, batch_size):
+            batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+            for row in group:
+                batch.add(SimpleStatement(query), row_values(row, columns))
+            groups.append(group)
+            statements.append((batch, ()))
+    return groups, statements
+
+
+def execute_grouped(session, groups, statements, concurrency):
+    results = execute_concurrent(
+        session, statements, concurrency=get_write_concurrency(concurrency), raise_on_first_error=False)
+    failures = {}
+    for group, (success, result) in zip(groups, results):
+        if not success:
+            for row in group:
+                failures.setdefault(row['id'], (row, result))
+    return list(failures.values())
+
+
+def write_chapters(rows, concurrency=None, batch_size=None, lookups_only=False):
+    """
+    Insert chapter rows (dicts keyed by CHAPTER_COLUMNS) and their lookup rows
+    without going through Chapter.save(). With batch_size > 1 rows sharing a
+    partition are grouped into unlogged batches. Returns a list of
+    (row, exception) failures.
+    """
+    session = connection.get_session()
+    if batch_size is None:
+        batch_size = getattr(settings, 'CHAPTER_WRITE_BATCH_SIZE', 1)
+
+    targets = LOOKUP_TARGETS if lookups_only else (CHAPTER_TARGET,) + LOOKUP_TARGETS
+    rows = [dict(row, name_key=normalize_text(row.get('name') or '')) for row in rows]
+    groups, statements = [], []
+    for model, columns, partition_key in targets:
+        target_groups, target_statements = partition_statements(
+            session, insert_query(model, columns), columns, partition_key, rows, batch_size)
+        groups.extend(target_groups)
+        statements.extend(target_statements)
+
+    failures = execute_grouped(session, groups, statements, concurrency)
+    invalidate(*{f"volume:{row['volume_id']}" for row in rows})
+    return failures
+
+
+DELETE_TARGETS = (
+    (Chapter, ('book_id', 'number', 'id')),
+    (ChapterByVolume, ('volume_id', 'number', 'id')),
+    (ChapterByName, ('book_id', 'name_key', 'number', 'id')),
+)
+
+
+def delete_query(model, columns):
+    conditions = ' AND '.join(f"{column} = {{placeholder}}" for column in columns)
+    return f"DELETE FROM {model.column_family_name()} WHERE {conditions}"
+
+
+def delete_chapters(book_id, keys, concurrency=None, batch_size=None):
+    """
+    Delete chapters of one book given (number, id) keys. The rows needed to
+    find lookup entries are read with one IN query per chunk of the partition,
+    then the chapter and lookup deletes run as per-partition unlogged batches.
+    Returns (deleted_rows, failures).
+    """
+    session = connection.get_session()
+    if batch_size is None:
+        batch_size = getattr(settings, 'CHAPTER_DELETE_BATCH_SIZE', 100)
+
+    wanted = {int(number): chapter_id for number, chapter_id in keys}
+    select = "SELECT number, id, volume_id, name, permalink, date_created FROM {} " \
+        "WHERE book_id = %s AND number IN %s".format(Chapter.column_family_name())
+    rows = []
+    for numbers in chunked(sorted(wanted), 100):
+        for row in session.execute(select, [book_id, tuple(numbers)]):
+            if str(row['id']) == str(wanted[row['number']]):
+                rows.append(dict(row, book_id=book_id, name_key=normalize_text(row['name'] or '')))
+    if not rows:
+        return [], []
+
+    groups, statements = [], []
+    for model, columns in DELETE_TARGETS:
+        target_groups, target_statements = partition_statements(
+            session, delete_query(model, columns), columns, columns[0], rows, batch_size)
+        groups.extend(target_groups)
+        statements.extend(target_statements)
+
+    failures = execute_grouped(session, groups, statements, concurrency)
+    failed_ids = {row['id'] for row, _ in failures}
+    deleted = [row for row in rows if row['id'] not in failed_ids]
+    scopes = {f"volume:{row['volume_id']}" for row in rows} | {f"chapter:{row['id']}" for row in rows} \
+        | {f"chapter:{row['permalink']}" for row in rows if row['permalink']}
+    invalidate(*scopes)
+    touch_book(book_id)
+    forget_releases(book_id, [(row['id'], row['date_created']) for row in deleted if row['date_created']])
+    return deleted, failures
+
+
+def encode_cursor(direction, number):
+    return base64.urlsafe_b64encode(f"{direction}:{number}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, number = base64.urlsafe_b64decode(padded.encode()).decode().split(':')
+        if direction not in ('a', 'b'):
+            raise ValueError
+        return direction, int(number)
+    except (ValueError, UnicodeDecodeError):
+        return None, None
+
+
+def count_volume_chapters(volume_id):
+    query = f"SELECT COUNT(*) AS total FROM {ChapterByVolume.column_family_name()} WHERE volume_id = %s"
+    row = connection.get_session().execute(query, [volume_id]).one()
+    return row['total'] if row else 0
+
+
+def page_start_number(volume_id, page, page_size):
+    """Clustering key where a numbered page starts; only the number column is read."""
+    offset = (page - 1) * page_size
+    if offset <= 0:
+        return None
+    query = (f"SELECT number FROM {ChapterByVolume.column_family_name()} "
+             f"WHERE volume_id = %s LIMIT %s")
+    rows = list(connection.get_session().execute(query, [volume_id, offset + 1]))
+    return rows[-1]['number'] if len(rows) > offset else False
+
+
+def page_volume_chapters(volume_id, page_size, cursor=None, page=1):
+    """
+    Read one page of a volume's chapters straight from the chapter_by_volume
+    partition. Returns (rows, next_cursor, previous_cursor). A cursor
+    continues after/before a chapter number; without one the numbered page is
+    located by reading only clustering keys.
+    """
+    table = ChapterByVolume.column_family_name()
+    columns = ', '.join(SUMMARY_COLUMNS)
+    session = connection.get_session()
+    direction, number = decode_cursor(cursor) if cursor else (None, None)
+
+    if direction == 'b':
+        query = f"SELECT {columns} FROM {table} WHERE volume_id = %s AND number < %s ORDER BY number DESC LIMIT %s"
+        rows = list(session.execute(query, [volume_id, number, page_size + 1]))
+        has_more = len(rows) > page_size
+        rows = list(reversed(rows[:page_size]))
+        next_cursor = encode_cursor('a', rows[-1]['number']) if rows else None
+        previous_cursor = encode_cursor('b', rows[0]['number']) if has_more else None
+        return rows, next_cursor, previous_cursor
+
+    if direction == 'a':
+        start, inclusive = number, False
+    else:
+        start, inclusive = page_start_number(volume_id, page, page_size), True
+        if start is False:
+            return [], None, None
+
+    if start is None:
+        query = f"SELECT {columns} FROM {table} WHERE volume_id = %s LIMIT %s"
+        params = [volume_id, page_size + 1]
+    else:
+        operator = '>=' if inclusive else '>'
+        query = f"SELECT {columns} FROM {table} WHERE volume_id = %s AND number {operator} %s LIMIT %s"
+        params = [volume_id, start, page_size + 1]
+    rows = list(session.execute(query, params))
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = encode_cursor('a', rows[-1]['number']) if has_more else None
+    previous_cursor = encode_cursor('b', rows[0]['number']) if rows and start is not None else None
+    return rows, next_cursor, previous_cursor
+
+
+def encode_key_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_key_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return values if isinstance(values, list) else None
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def to_millis(moment):
+    return int((moment - EPOCH) / timedelta(milliseconds=1))
+
+
+def from_millis(millis):
+    return EPOCH + timedelta(milliseconds=millis)
+
+
+def encode_time_cursor(moment, item_id):
+    """Cursor continuing after (moment, item_id) in a partition clustered by (timestamp DESC, uuid DESC)."""
+    return encode_key_cursor([to_millis(moment), str(item_id)])
+
+
+def decode_time_cursor(cursor):
+    """(moment, item_id) of a time cursor, or None for a missing or malformed one."""
+    values = decode_key_cursor(cursor) if cursor else None
+    if values is None or len(values) != 2:
+        return None
+    try:
+        return from_millis(int(values[0])), uuid.UUID(str(values[1]))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def browse_book_chapters(book_id, page_size, cursor=None, query=None):
+    """
+    One page of a book's chapters for the admin, always inside a single
+    partition. A numeric query is an exact chapter number lookup; any other
+    query is a prefix range on chapter_by_name.name_key. Returns (rows, next_cursor).
+    """
+    session = connection.get_session()
+    after = decode_key_cursor(cursor) if cursor else None
+    query = (query or '').strip()
+
+    if query.isdigit():
+        statement = "SELECT {} FROM {} WHERE book_id = %s AND number = %s".format(
+            ', '.join(BROWSE_COLUMNS), Chapter.column_family_name())
+        return list(session.execute(statement, [book_id, int(query)])), None
+
+    if query:
+        prefix = normalize_text(query)
+        statement = "SELECT {} FROM {} WHERE book_id = %s".format(
+            ', '.join(NAME_LOOKUP_COLUMNS), ChapterByName.column_family_name())
+        if after and len(after) == 2:
+            # Cassandra rejects single-column and tuple relations on clustering columns in one query
+            statement += " AND (name_key, number) > (%s, %s) AND (name_key, number) < (%s, %s)"
+            params = [book_id, after[0], after[1], prefix + '\uffff', -1]
+        else:
+            statement += " AND name_key >= %s AND name_key < %s"
+            params = [book_id, prefix, prefix + '\uffff']
+        statement += " LIMIT %s"
+        params.append(page_size + 1)
+        rows = list(session.execute(statement, params))
+        next_cursor = encode_key_cursor([rows[page_size - 1]['name_key'], rows[page_size - 1]['number']]) \
+            if len(rows) > page_size else None
+        return rows[:page_size], next_cursor
+
+    statement = "SELECT {} FROM {} WHERE book_id = %s".format(
+        ', '.join(BROWSE_COLUMNS), Chapter.column_family_name())
+    params = [book_id]
+    if after and len(after) == 1:
+        statement += " AND number > %s"
+        params.extend(after)
+    statement += " LIMIT %s"
+    params.append(page_size + 1)
+    rows = list(session.execute(statement, params))
+    next_cursor = encode_key_cursor([rows[page_size - 1]['number']]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
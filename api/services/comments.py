@@ -0,0 +1,276 @@
+import time
+import uuid
+from cassandra.cqlengine import connection
+from cassandra.util import datetime_from_uuid1, uuid_from_time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from api.models import Chapter, Comment, CommentBucket, CommentCount, Reply, Report
+from api.popularity import chapter_ref_key, remember_chapter
+from api.redis_client import get_redis
+from api.services.chapters import EPOCH, decode_time_cursor, encode_time_cursor, execute_writes, insert_query
+
+
+COMMENT_COLUMNS = ('chapter_id', 'bucket', 'created_at', 'id', 'book_id', 'user_id', 'username', 'content')
+REPLY_COLUMNS = ('comment_id', 'created_at', 'id', 'chapter_id', 'user_id', 'username', 'content')
+REPORT_COLUMNS = ('target_id', 'user_id', 'chapter_id', 'comment_id', 'reason', 'created_at')
+REPORTED_KEY = 'comments:reported'
+
+
+def get_bucket_seconds():
+    return getattr(settings, 'COMMENT_BUCKET_SECONDS', 60 * 60 * 24 * 7)
+
+
+def get_count_timeout():
+    # Bounds the drift when an increment lands while a count is being seeded
+    return getattr(settings, 'COMMENT_COUNT_TIMEOUT', 60 * 10)
+
+
+def reporters_key(target_id):
+    return f"comments:reporters:{target_id}"
+
+
+def count_key(target_id):
+    return f"comment_count:{target_id}"
+
+
+def new_id():
+    return uuid_from_time(time.time())
+
+
+def created_at_of(item_id):
+    """Creation time encoded in a comment or reply id (ms precision, as stored), or None if it has none."""
+    if item_id.version != 1:
+        return None
+    created_at = datetime_from_uuid1(item_id)
+    return created_at.replace(microsecond=created_at.microsecond // 1000 * 1000)
+
+
+def bucket_of(created_at):
+    return int((created_at - EPOCH).total_seconds() // get_bucket_seconds())
+
+
+def resolve_chapter(chapter_id):
+    """(book_id, chapter_id) of an existing chapter, or None. Found once, then remembered in the cache."""
+    ref = cache.get(chapter_ref_key(str(chapter_id)))
+    if ref is not None:
+        return uuid.UUID(ref[0]), uuid.UUID(ref[1])
+    chapter = Chapter.objects.filter(id=chapter_id).first()
+    if chapter is None:
+        return None
+    remember_chapter(str(chapter_id), chapter.book_id, chapter.id)
+    return chapter.book_id, chapter.id
+
+
+def add_comment(chapter_id, book_id, user, content):
+    comment_id = new_id()
+    created_at = created_at_of(comment_id)
+    row = {
+        'chapter_id': chapter_id,
+        'bucket': bucket_of(created_at),
+        'created_at': created_at,
+        'id': comment_id,
+        'book_id': book_id,
+        'user_id': user.id,
+        'username': user.username,
+        'content': content,
+    }
+    session = connection.get_session()
+    execute_writes(session, [
+        (insert_query(Comment, COMMENT_COLUMNS).format(placeholder='?'),
+         [tuple(row[column] for column in COMMENT_COLUMNS)]),
+        (insert_query(CommentBucket, ('chapter_id', 'bucket')).format(placeholder='?'),
+         [(chapter_id, row['bucket'])]),
+    ])
+    change_count(chapter_id, 1)
+    return row
+
+
+def add_reply(comment, user, content):
+    reply_id = new_id()
+    row = {
+        'comment_id': comment['id'],
+        'created_at': created_at_of(reply_id),
+        'id': reply_id,
+        'chapter_id': comment['chapter_id'],
+        'user_id': user.id,
+        'username': user.username,
+        'content': content,
+    }
+    execute_writes(connection.get_session(), [
+        (insert_query(Reply, REPLY_COLUMNS).format(placeholder='?'), [tuple(row[column] for column in REPLY_COLUMNS)]),
+    ])
+    change_count(comment['id'], 1)
+    return row
+
+
+def get_comment(chapter_id, comment_id):
+    created_at = created_at_of(comment_id)
+    if created_at is None:
+        return None
+    query = "SELECT {} FROM {} WHERE chapter_id = %s AND bucket = %s AND created_at = %s AND id = %s".format(
+        ', '.join(COMMENT_COLUMNS), Comment.column_family_name())
+    return connection.get_session().execute(
+        query, [chapter_id, bucket_of(created_at), created_at, comment_id]).one()
+
+
+def get_reply(comment_id, reply_id):
+    created_at = created_at_of(reply_id)
+    if created_at is None:
+        return None
+    query = "SELECT {} FROM {} WHERE comment_id = %s AND created_at = %s AND id = %s".format(
+        ', '.join(REPLY_COLUMNS), Reply.column_family_name())
+    return connection.get_session().execute(query, [comment_id, created_at, reply_id]).one()
+
+
+def page_comments(chapter_id, page_size, cursor=None):
+    """
+    One page of a chapter's comments, newest first. Buckets are listed from
+    comment_bucket and read in turn until the page is full, so a page costs
+    one read per non-empty bucket it spans. Returns (rows, next_cursor).
+    """
+    session = connection.get_session()
+    after = decode_time_cursor(cursor)
+    after_bucket = bucket_of(after[0]) if after else None
+
+    bucket_query = f"SELECT bucket FROM {CommentBucket.column_family_name()} WHERE chapter_id = %s"
+    bucket_params = [chapter_id]
+    if after:
+        bucket_query += " AND bucket <= %s"
+        bucket_params.append(after_bucket)
+    comment_query = "SELECT {} FROM {} WHERE chapter_id = %s AND bucket = %s".format(
+        ', '.join(COMMENT_COLUMNS), Comment.column_family_name())
+
+    rows = []
+    for bucket in session.execute(bucket_query, bucket_params):
+        query, params = comment_query, [chapter_id, bucket['bucket']]
+        if bucket['bucket'] == after_bucket:
+            query += " AND (created_at, id) < (%s, %s)"
+            params.extend(after)
+        rows.extend(session.execute(query + " LIMIT %s", params + [page_size + 1 - len(rows)]))
+        if len(rows) > page_size:
+            break
+
+    next_cursor = None
+    if len(rows) > page_size:
+        next_cursor = encode_time_cursor(rows[page_size - 1]['created_at'], rows[page_size - 1]['id'])
+    return rows[:page_size], next_cursor
+
+
+def page_replies(comment_id, page_size, cursor=None):
+    """One page of a comment's replies, newest first, from its single partition. Returns (rows, next_cursor)."""
+    after = decode_time_cursor(cursor)
+    query = "SELECT {} FROM {} WHERE comment_id = %s".format(', '.join(REPLY_COLUMNS), Reply.column_family_name())
+    params = [comment_id]
+    if after:
+        query += " AND (created_at, id) < (%s, %s)"
+        params.extend(after)
+    rows = list(connection.get_session().execute(query + " LIMIT %s", params + [page_size + 1]))
+    next_cursor = None
+    if len(rows) > page_size:
+        next_cursor = encode_time_cursor(rows[page_size - 1]['created_at'], rows[page_size - 1]['id'])
+    return rows[:page_size], next_cursor
+
+
+def delete_comment(comment):
+    """Delete a comment and its replies, and take it off the report queue."""
+    session = connection.get_session()
+    session.execute(
+        f"DELETE FROM {Comment.column_family_name()} WHERE chapter_id = %s AND bucket = %s "
+        f"AND created_at = %s AND id = %s",
+        [comment['chapter_id'], comment['bucket'], comment['created_at'], comment['id']])
+    # Replies and their reports stay in Redis until dismissed; the admin queue skips missing targets
+    session.execute(f"DELETE FROM {Reply.column_family_name()} WHERE comment_id = %s", [comment['id']])
+    change_count(comment['chapter_id'], -1)
+    clear_reports(comment['id'], report_ref(comment['chapter_id'], comment['id']))
+
+
+def delete_reply(reply):
+    connection.get_session().execute(
+        f"DELETE FROM {Reply.column_family_name()} WHERE comment_id = %s AND created_at = %s AND id = %s",
+        [reply['comment_id'], reply['created_at'], reply['id']])
+    change_count(reply['comment_id'], -1)
+    clear_reports(reply['id'], report_ref(reply['chapter_id'], reply['comment_id'], reply['id']))
+
+
+def change_count(target_id, delta):
+    connection.get_session().execute(
+        f"UPDATE {CommentCount.column_family_name()} SET comments = comments + %s WHERE target_id = %s",
+        [delta, target_id])
+    try:
+        cache.incr(count_key(target_id), delta)
+    except ValueError:
+        pass  # not cached: the next read seeds it from the counter table
+
+
+def get_comment_counts(target_ids):
+    """{target id: comment (or reply) count}, from the cache with misses read from comment_count in one query."""
+    keys = {count_key(target_id): target_id for target_id in target_ids}
+    cached = cache.get_many(list(keys))
+    counts = {keys[key]: value for key, value in cached.items()}
+    missing = [target_id for key, target_id in keys.items() if key not in cached]
+    if missing:
+        query = f"SELECT target_id, comments FROM {CommentCount.column_family_name()} WHERE target_id IN %s"
+        found = {str(row['target_id']): row['comments'] for row in connection.get_session().execute(
+            query, [tuple(uuid.UUID(str(target_id)) for target_id in missing)])}
+        seeded = {target_id: max(0, found.get(str(target_id)) or 0) for target_id in missing}
+        cache.set_many({count_key(target_id): count for target_id, count in seeded.items()},
+                       timeout=get_count_timeout())
+        counts.update(seeded)
+    return counts
+
+
+def report_ref(chapter_id, comment_id, reply_id=None):
+    return '/'.join(str(part) for part in (chapter_id, comment_id, reply_id) if part is not None)
+
+
+def parse_report_ref(ref):
+    """(chapter_id, comment_id, reply_id or None) of a report queue member."""
+    parts = [uuid.UUID(part) for part in ref.split('/')]
+    return parts[0], parts[1], parts[2] if len(parts) > 2 else None
+
+
+def report(target, user, reason):
+    """
+    Record user's report of a comment (or reply, which has a comment_id).
+    Each user counts once per target; totals are kept in the comments:reported
+    sorted set, so the moderation queue never reads comment partitions.
+    Returns True for a new report.
+    """
+    comment_id = target.get('comment_id', target['id'])
+    row = {
+        'target_id': target['id'],
+        'user_id': user.id,
+        'chapter_id': target['chapter_id'],
+        'comment_id': comment_id,
+        'reason': reason,
+        'created_at': timezone.now(),
+    }
+    execute_writes(connection.get_session(), [
+        (insert_query(Report, REPORT_COLUMNS).format(placeholder='?'), [tuple(row[column] for column in REPORT_COLUMNS)]),
+    ])
+    redis = get_redis()
+    if not redis.sadd(reporters_key(target['id']), user.id):
+        return False
+    reply_id = target['id'] if 'comment_id' in target else None
+    redis.zincrby(REPORTED_KEY, 1, report_ref(target['chapter_id'], comment_id, reply_id))
+    return True
+
+
+def clear_reports(target_id, ref):
+    """Drop a target from the moderation queue (its report rows stay as history)."""
+    pipe = get_redis().pipeline()
+    pipe.zrem(REPORTED_KEY, ref)
+    pipe.delete(reporters_key(target_id))
+    pipe.execute()
+
+
+def most_reported(limit, offset=0):
+    """[(ref, report count)] with the most reported comments and replies first."""
+    return [(member.decode(), int(score)) for member, score in get_redis().zrevrange(
+        REPORTED_KEY, offset, offset + limit - 1, withscores=True)]
+
+
+def get_reports(target_id):
+    query = "SELECT user_id, reason, created_at FROM {} WHERE target_id = %s".format(Report.column_family_name())
+    return list(connection.get_session().execute(query, [target_id]))
@@ -0,0 +1,222 @@
+import random
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import transaction
+from django.utils.text import slugify
+from api.caching import invalidate
+from api.facets import reconcile_facets
+from api.suggest import publish_book_changes
+from api.models import Book, Volume
+from .book_import import CatalogueMaps
+from .chapters import write_chapters
+
+
+GENRES = ('Tiên hiệp', 'Kiếm hiệp', 'Huyền huyễn', 'Ngôn tình', 'Đô thị', 'Khoa huyễn', 'Võng du',
+          'Đồng nhân', 'Lịch sử', 'Quân sự', 'Linh dị', 'Trinh thám', 'Xuyên không', 'Trọng sinh',
+          'Điền văn', 'Cung đấu', 'Hài hước', 'Dị giới')
+STATUSES = ('Đang ra', 'Hoàn thành', 'Tạm ngưng')
+
+WORDS = (
+    'anh', 'em', 'người', 'ta', 'hắn', 'nàng', 'lão', 'tiểu', 'đại', 'sư', 'phụ', 'huynh', 'muội', 'môn', 'phái',
+    'kiếm', 'đao', 'thương', 'quyền', 'chưởng', 'khí', 'linh', 'lực', 'đan', 'dược', 'pháp', 'bảo', 'trận',
+    'thiên', 'địa', 'nhân', 'thần', 'ma', 'yêu', 'quỷ', 'tiên', 'phật', 'đạo', 'tâm', 'hồn', 'phách', 'mệnh',
+    'núi', 'sông', 'biển', 'rừng', 'trời', 'mây', 'gió', 'mưa', 'tuyết', 'trăng', 'sao', 'lửa', 'nước', 'đất',
+    'đi', 'đến', 'về', 'nhìn', 'thấy', 'nói', 'cười', 'khóc', 'đánh', 'chạy', 'bay', 'đứng', 'ngồi', 'nghĩ',
+    'biết', 'muốn', 'phải', 'được', 'không', 'chưa', 'đã', 'sẽ', 'đang', 'vẫn', 'còn', 'lại', 'ra', 'vào',
+    'một', 'hai', 'ba', 'trăm', 'nghìn', 'vạn', 'năm', 'tháng', 'ngày', 'đêm', 'sáng', 'chiều', 'lúc', 'khi',
+    'rất', 'quá', 'lắm', 'thật', 'cũng', 'chỉ', 'đều', 'mới', 'cả', 'những', 'các', 'này', 'kia', 'đó',
+    'mạnh', 'yếu', 'nhanh', 'chậm', 'lạnh', 'nóng', 'sâu', 'cao', 'xa', 'gần', 'đẹp', 'xấu', 'lớn', 'nhỏ',
+    'và', 'nhưng', 'vì', 'nên', 'nếu', 'thì', 'mà', 'với', 'của', 'cho', 'trong', 'ngoài', 'trên', 'dưới',
+)
+TITLE_WORDS = ('Thiên', 'Đạo', 'Kiếm', 'Thần', 'Ma', 'Tiên', 'Vương', 'Đế', 'Long', 'Phượng', 'Huyết', 'Nguyệt',
+               'Phong', 'Vân', 'Lôi', 'Hỏa', 'Băng', 'Tinh', 'Hồn', 'Mộng', 'Truyền', 'Thuyết', 'Ký', 'Lục')
+AUTHOR_NAMES = ('Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Vũ', 'Đặng', 'Bùi', 'Đỗ', 'Hồ', 'Ngô', 'Dương',
+                'Minh', 'Anh', 'Thu', 'Lan', 'Hùng', 'Tuấn', 'Hà', 'Phong', 'Vân', 'Khôi', 'Ngọc', 'Bảo')
+
+BASE_DATE = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+PARAGRAPH_POOL_SIZE = 512
+
+
+def random_uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def sentence(rng, low=6, high=18):
+    text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+    return text[0].upper() + text[1:] + rng.choice('...!?.')
+
+
+def paragraph(rng):
+    return ' '.join(sentence(rng) for _ in range(rng.randint(3, 8)))
+
+
+def title_phrase(rng, words):
+    return ' '.join(rng.choice(TITLE_WORDS) for _ in range(words))
+
+
+class CorpusSpec:
+    """
+    Sizes of the generated catalogue. Volumes per book follow a Pareto
+    distribution capped at max_volumes, except the first book, which is the
+    largest series with largest_volumes volumes.
+    """
+
+    def __init__(self, books=1000, largest_volumes=5000, max_volumes=60, volume_alpha=1.6,
+                 chapters_per_volume=(5, 30), paragraphs_per_chapter=(8, 20), max_chapters=None):
+        self.books = books
+        self.largest_volumes = largest_volumes
+        self.max_volumes = max_volumes
+        self.volume_alpha = volume_alpha
+        self.chapters_per_volume = chapters_per_volume
+        self.paragraphs_per_chapter = paragraphs_per_chapter
+        self.max_chapters = max_chapters
+
+    def volume_count(self, rng, index):
+        if index == 0:
+            return self.largest_volumes
+        return max(1, min(self.max_volumes, int(rng.paretovariate(self.volume_alpha))))
+
+
+class CorpusGenerator:
+    """
+    Streams a deterministic catalogue into the databases: books, genre links
+    and volumes with bulk_create per chunk, chapters (and their lookup rows)
+    with concurrent Cassandra writes through write_chapters(). The same seed
+    and spec always produce the same ids, text and dates, and existing
+    primary keys are left alone, so an interrupted run can simply be repeated.
+    """
+
+    def __init__(self, posted_by, spec, seed=1, chunk_size=1000, chapter_chunk_size=2000,
+                 concurrency=None, batch_size=None, progress=None):
+        self.posted_by = posted_by
+        self.spec = spec
+        self.rng = random.Random(seed)
+        self.paragraphs = [paragraph(random.Random(f"{seed}:{index}")) for index in range(PARAGRAPH_POOL_SIZE)]
+        self.chunk_size = chunk_size
+        self.chapter_chunk_size = chapter_chunk_size
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.progress = progress
+        self.totals = {'books': 0, 'volumes': 0, 'chapters': 0, 'failed': 0}
+        self.pending_chapters = []
+
+    def catalogue(self):
+        maps = CatalogueMaps()
+        genres = [maps.genre(name) for name in GENRES]
+        statuses = [maps.status(name) for name in STATUSES]
+        return genres, statuses
+
+    def build_book(self, index, genres, statuses):
+        rng = self.rng
+        title = f"{title_phrase(rng, rng.randint(2, 4))} {index}"
+        created = BASE_DATE + timedelta(days=rng.randint(0, 1500))
+        book = Book(
+            id=random_uuid(rng),
+            title=title,
+            description='\n\n'.join(rng.choice(self.paragraphs) for _ in range(rng.randint(1, 3))),
+            author=f"{rng.choice(AUTHOR_NAMES)} {rng.choice(AUTHOR_NAMES)}",
+            posted_by=self.posted_by,
+            status=rng.choice(statuses),
+            permalink=f"{slugify(title)}-{index}",
+            cover_image='',
+            date_created=created.date(),
+            date_updated=(created + timedelta(days=rng.randint(0, 300))).date(),
+        )
+        book.search_vector = book.get_search_vector()
+        book_genres = rng.sample(genres, rng.randint(1, 4))
+        return book, book_genres, self.spec.volume_count(rng, index), rng.getrandbits(64)
+
+    def build_volumes(self, book, count):
+        return [Volume(id=random_uuid(self.rng), book=book, name=f"Quyển {number}")
+                for number in range(1, count + 1)]
+
+    def queue_chapters(self, book, volumes, chapter_seed):
+        # Chapters draw from their own stream so the output does not depend on chunk sizes
+        rng = random.Random(chapter_seed)
+        low, high = self.spec.chapters_per_volume
+        paragraphs_low, paragraphs_high = self.spec.paragraphs_per_chapter
+        number = 0
+        moment = datetime.combine(book.date_created, datetime.min.time(), tzinfo=dt_timezone.utc)
+        for volume in volumes:
+            for _ in range(rng.randint(low, high)):
+                if self.spec.max_chapters is not None and \
+                        self.totals['chapters'] + len(self.pending_chapters) >= self.spec.max_chapters:
+                    return
+                number += 1
+                moment += timedelta(minutes=rng.randint(30, 60 * 48))
+                name = f"Chương {number}: {title_phrase(rng, rng.randint(2, 5))}"
+                self.pending_chapters.append({
+                    'book_id': book.id,
+                    'number': number,
+                    'id': random_uuid(rng),
+                    'volume_id': volume.id,
+                    'name': name,
+                    'date_created': moment,
+                    'date_updated': moment,
+                    'content': '\n\n'.join(rng.choice(self.paragraphs)
+                                           for _ in range(rng.randint(paragraphs_low, paragraphs_high))),
+                    'permalink': f"{slugify(name)}-{book.permalink}",
+                })
+                if len(self.pending_chapters) >= self.chapter_chunk_size:
+                    self.flush_chapters()
+
+    def flush_chapters(self):
+        if not self.pending_chapters:
+            return
+        failures = write_chapters(self.pending_chapters, concurrency=self.concurrency, batch_size=self.batch_size)
+        self.totals['chapters'] += len(self.pending_chapters) - len(failures)
+        self.totals['failed'] += len(failures)
+        self.pending_chapters = []
+        self.report()
+
+    def insert_books(self, chunk):
+        through = Book.genres.through
+        volumes = [volume for _, _, book_volumes, _ in chunk for volume in book_volumes]
+        with transaction.atomic():
+            # bulk_create applies auto_now/auto_now_add; the generated dates are put back afterwards
+            books = [book for book, _, _, _ in chunk]
+            dates = {book.id: (book.date_created, book.date_updated) for book in books}
+            Book.objects.bulk_create(books, ignore_conflicts=True)
+            for book in books:
+                book.date_created, book.date_updated = dates[book.id]
+            Book.objects.bulk_update(books, ['date_created', 'date_updated'])
+            through.objects.bulk_create([through(book_id=book.id, genre_id=genre.id)
+                                         for book, genres, _, _ in chunk for genre in genres], ignore_conflicts=True)
+            Volume.objects.bulk_create(volumes, ignore_conflicts=True)
+        self.totals['books'] += len(chunk)
+        self.totals['volumes'] += len(volumes)
+
+    def report(self):
+        if self.progress:
+            self.progress(dict(self.totals))
+
+    def run(self):
+        genres, statuses = self.catalogue()
+        chunk = []
+        for index in range(self.spec.books):
+            book, book_genres, volume_count, chapter_seed = self.build_book(index, genres, statuses)
+            chunk.append((book, book_genres, self.build_volumes(book, volume_count), chapter_seed))
+            if len(chunk) >= self.chunk_size:
+                self.write_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.write_chunk(chunk)
+        self.flush_chapters()
+        # Conflicting (already generated) rows make deltas unreliable, so recount
+        reconcile_facets()
+        publish_book_changes('reset')
+        invalidate("books")
+        return dict(self.totals)
+
+    def write_chunk(self, chunk):
+        self.insert_books(chunk)
+        for book, _, volumes, chapter_seed in chunk:
+            self.queue_chapters(book, volumes, chapter_seed)
+        self.report()
+
+
+def generate_corpus(posted_by, seed=1, chunk_size=1000, chapter_chunk_size=2000,
+                    concurrency=None, batch_size=None, progress=None, **sizes):
+    return CorpusGenerator(posted_by, CorpusSpec(**sizes), seed=seed, chunk_size=chunk_size,
+                           chapter_chunk_size=chapter_chunk_size, concurrency=concurrency,
+                           batch_size=batch_size, progress=progress).run()
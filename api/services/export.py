@@ -0,0 +1,182 @@
+import html
+import json
+import zipfile
+from django.conf import settings
+from cassandra.cqlengine import connection
+from cassandra.query import SimpleStatement
+from api.models import Chapter, Volume
+
+
+EXPORT_COLUMNS = ('number', 'id', 'volume_id', 'name', 'content', 'permalink', 'date_created', 'date_updated')
+
+
+def get_fetch_size(requested=None):
+    session_options = settings.DATABASES.get('cassandra', {}).get('OPTIONS', {}).get('session', {})
+    limit = session_options.get('default_fetch_size', 5000)
+    fetch_size = requested or getattr(settings, 'CHAPTER_EXPORT_FETCH_SIZE', limit)
+    return max(1, min(int(fetch_size), limit))
+
+
+def iter_book_chapters(book_id, start_number=None, fetch_size=None):
+    """
+    Walk the book's chapter partition in clustering order. The driver fetches
+    the next page only when the previous one has been consumed, so at most
+    fetch_size rows are held in memory.
+    """
+    query = "SELECT {} FROM {} WHERE book_id = %s".format(', '.join(EXPORT_COLUMNS), Chapter.column_family_name())
+    params = [book_id]
+    if start_number:
+        query += " AND number >= %s"
+        params.append(int(start_number))
+    statement = SimpleStatement(query, fetch_size=get_fetch_size(fetch_size))
+    session = connection.get_session()
+    for row in session.execute(statement, params):
+        yield row
+
+
+def serialize_chapter(row, volume_names):
+    return {
+        'id': str(row['id']),
+        'number': row['number'],
+        'volume_id': str(row['volume_id']) if row['volume_id'] else None,
+        'volume_name': volume_names.get(row['volume_id']),
+        'name': row['name'],
+        'permalink': row['permalink'],
+        'date_created': row['date_created'].isoformat() if row['date_created'] else None,
+        'date_updated': row['date_updated'].isoformat() if row['date_updated'] else None,
+        'content': row['content'],
+    }
+
+
+def get_volume_names(book):
+    return dict(Volume.objects.filter(book=book).values_list('id', 'name'))
+
+
+def stream_jsonl(book, start_number=None, fetch_size=None):
+    volume_names = get_volume_names(book)
+    yield json.dumps({
+        'type': 'book',
+        'id': str(book.id),
+        'title': book.title,
+        'author': book.author,
+        'description': book.description,
+        'permalink': book.permalink,
+    }, ensure_ascii=False).encode('utf-8') + b'\n'
+    for row in iter_book_chapters(book.id, start_number, fetch_size):
+        chapter = serialize_chapter(row, volume_names)
+        chapter['type'] = 'chapter'
+        yield json.dumps(chapter, ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+class StreamBuffer:
+    """Write-only file object for zipfile; drained after every entry."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+CONTAINER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+CHAPTER_XHTML = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="vi">
+<head><title>{title}</title></head>
+<body>
+<h2>{title}</h2>
+{body}
+</body>
+</html>
+"""
+
+
+def chapter_xhtml(row):
+    paragraphs = [part.strip() for part in (row['content'] or '').split('\n') if part.strip()]
+    body = '\n'.join(f"<p>{html.escape(part)}</p>" for part in paragraphs)
+    return CHAPTER_XHTML.format(title=html.escape(row['name'] or ''), body=body)
+
+
+def package_opf(book, toc):
+    manifest = '\n'.join(
+        f'    <item id="c{number}" href="chapter-{number}.xhtml" media-type="application/xhtml+xml"/>'
+        for number, _ in toc)
+    spine = '\n'.join(f'    <itemref idref="c{number}"/>' for number, _ in toc)
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="book-id">urn:uuid:{book.id}</dc:identifier>
+    <dc:title>{html.escape(book.title)}</dc:title>
+    <dc:creator>{html.escape(book.author)}</dc:creator>
+    <dc:language>vi</dc:language>
+  </metadata>
+  <manifest>
+    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+{manifest}
+  </manifest>
+  <spine>
+{spine}
+  </spine>
+</package>
+"""
+
+
+def nav_xhtml(book, toc):
+    items = '\n'.join(f'<li><a href="chapter-{number}.xhtml">{html.escape(name or "")}</a></li>' for number, name in toc)
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head><title>{html.escape(book.title)}</title></head>
+<body>
+<nav epub:type="toc"><ol>
+{items}
+</ol></nav>
+</body>
+</html>
+"""
+
+
+def stream_epub(book, start_number=None, fetch_size=None):
+    """
+    Build the EPUB as a streamed zip: chapter documents are emitted as they are
+    read and the package document/nav go last. Only (number, name) pairs are
+    kept for the table of contents.
+    """
+    buffer = StreamBuffer()
+    archive = zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED)
+    archive.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+    archive.writestr('META-INF/container.xml', CONTAINER_XML)
+    yield buffer.drain()
+
+    toc = []
+    for row in iter_book_chapters(book.id, start_number, fetch_size):
+        archive.writestr(f"OEBPS/chapter-{row['number']}.xhtml", chapter_xhtml(row))
+        toc.append((row['number'], row['name']))
+        yield buffer.drain()
+
+    archive.writestr('OEBPS/nav.xhtml', nav_xhtml(book, toc))
+    archive.writestr('OEBPS/content.opf', package_opf(book, toc))
+    archive.close()
+    yield buffer.drain()
+
+
+EXPORT_FORMATS = {
+    'jsonl': (stream_jsonl, 'application/x-ndjson'),
+    'epub': (stream_epub, 'application/epub+zip'),
+}
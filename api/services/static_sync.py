@@ -0,0 +1,81 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.base import ContentFile
+
+
+MANIFEST_NAME = 'staticfiles-sync.json'
+IGNORE_PATTERNS = ['CVS', '.*', '*~']
+
+
+def local_manifest():
+    """{name: (sha256, source storage, source path)} of every file the finders collect; the first finder wins."""
+    files = {}
+    for finder in finders.get_finders():
+        for path, storage in finder.list(IGNORE_PATTERNS):
+            prefix = getattr(storage, 'prefix', None)
+            name = f"{prefix}/{path}" if prefix else path
+            if name in files:
+                continue
+            digest = hashlib.sha256()
+            with storage.open(path) as source:
+                for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            files[name.replace('\\', '/')] = (digest.hexdigest(), storage, path)
+    return files
+
+
+def manifest_digest(hashes):
+    return hashlib.sha256(json.dumps(hashes, sort_keys=True).encode()).hexdigest()
+
+
+def remote_manifest(storage):
+    try:
+        with storage.open(MANIFEST_NAME) as manifest:
+            return json.loads(manifest.read())
+    except Exception:
+        # Missing or unreadable: everything is uploaded again
+        return {'digest': None, 'files': {}}
+
+
+def replace(storage, name, content):
+    # S3 storages overwrite in place (AWS_S3_FILE_OVERWRITE); others would pick a new name
+    if not getattr(storage, 'file_overwrite', False) and storage.exists(name):
+        storage.delete(name)
+    storage.save(name, content)
+
+
+def upload(storage, name, source_storage, source_path):
+    with source_storage.open(source_path) as source:
+        replace(storage, name, ContentFile(source.read()))
+
+
+def sync_static(storage=None, workers=8, prune=False, force=False):
+    """
+    Upload the static files whose content hash differs from the manifest kept
+    next to them in the static storage, then store the new manifest. One read
+    of the manifest is all it costs when nothing changed. With prune, files
+    no longer collected are deleted. Returns {'uploaded', 'deleted', 'unchanged'}.
+    """
+    storage = storage or staticfiles_storage
+    files = local_manifest()
+    hashes = {name: digest for name, (digest, _, _) in files.items()}
+    digest = manifest_digest(hashes)
+    remote = remote_manifest(storage)
+    if not force and remote.get('digest') == digest:
+        return {'uploaded': 0, 'deleted': 0, 'unchanged': len(files)}
+
+    remote_files = {} if force else remote.get('files', {})
+    changed = [name for name, file_hash in hashes.items() if remote_files.get(name) != file_hash]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(upload, storage, name, *files[name][1:]) for name in changed]:
+            future.result()
+
+    deleted = [name for name in remote_files if name not in hashes] if prune else []
+    for name in deleted:
+        storage.delete(name)
+
+    replace(storage, MANIFEST_NAME, ContentFile(json.dumps({'digest': digest, 'files': hashes}).encode()))
+    return {'uploaded': len(changed), 'deleted': len(deleted), 'unchanged': len(files) - len(changed)}
@@ -0,0 +1,90 @@
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+from .caching import invalidate
+from .facets import GENRE_KEY, STATUS_KEY, apply_facet_deltas, drop_facet
+from .models import Book, Genre, Status
+from .suggest import publish_book_changes
+
+
+# Facet counts (api.facets) follow single-object writes here; bulk inserts
+# report their own deltas and the periodic reconcile repairs anything else.
+
+DEFERRED = object()
+
+
+@receiver(post_init, sender=Book)
+def remember_book_status(sender, instance, **kwargs):
+    # Read from __dict__ so a deferred status is not loaded here
+    instance._facet_status_id = instance.__dict__.get('status_id', DEFERRED)
+
+
+@receiver(post_save, sender=Book)
+def count_book_status(sender, instance, created, **kwargs):
+    previous = None if created else instance._facet_status_id
+    if previous is DEFERRED:
+        return  # loaded without its status: the old value is unknown, left to the reconcile
+    if previous != instance.status_id:
+        apply_facet_deltas(statuses={previous: -1, instance.status_id: 1})
+    instance._facet_status_id = instance.status_id
+
+
+@receiver(post_save, sender=Book)
+def publish_book_save(sender, instance, **kwargs):
+    publish_book_changes('save', instance.pk)
+
+
+@receiver(post_delete, sender=Book)
+def publish_book_delete(sender, instance, **kwargs):
+    publish_book_changes('delete', instance.pk)
+
+
+@receiver(pre_delete, sender=Book)
+def remember_book_genres(sender, instance, **kwargs):
+    # The genre links are gone by post_delete and their cascade sends no m2m_changed
+    instance._facet_genre_ids = list(instance.genres.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Book)
+def uncount_book(sender, instance, **kwargs):
+    apply_facet_deltas(genres={genre_id: -1 for genre_id in getattr(instance, '_facet_genre_ids', ())},
+                       statuses={instance.status_id: -1})
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+def count_book_genres(sender, instance, action, reverse, pk_set, **kwargs):
+    through = Book.genres.through
+    if action in ('pre_remove', 'pre_clear'):
+        # Only links that exist are removed; remember them before they go
+        links = through.objects.filter(genre_id=instance.pk) if reverse else through.objects.filter(book_id=instance.pk)
+        if pk_set:
+            links = links.filter(**{'book_id__in' if reverse else 'genre_id__in': pk_set})
+        instance._facet_removed = list(links.values_list('book_id' if reverse else 'genre_id', flat=True))
+        return
+    if action == 'post_add' and pk_set:
+        # pk_set holds only the links actually inserted
+        sign, related = 1, pk_set
+    elif action in ('post_remove', 'post_clear'):
+        sign, related = -1, getattr(instance, '_facet_removed', ())
+    else:
+        return
+    if reverse:
+        apply_facet_deltas(genres={instance.pk: sign * len(related)})
+    else:
+        apply_facet_deltas(genres={genre_id: sign for genre_id in related})
+
+
+@receiver(post_delete, sender=Genre)
+def drop_genre_facet(sender, instance, **kwargs):
+    drop_facet(GENRE_KEY, instance.pk)
+    invalidate("genres")
+
+
+@receiver(post_save, sender=Status)
+def refresh_status_labels(sender, instance, **kwargs):
+    invalidate("genres")
+
+
+@receiver(post_delete, sender=Status)
+def drop_status_facet(sender, instance, **kwargs):
+    drop_facet(STATUS_KEY, instance.pk)
+    invalidate("genres")
@@ -0,0 +1,284 @@
+import heapq
+import logging
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from django.conf import settings
+from django.db import transaction
+from .background import submit
+from .redis_client import get_redis
+from .utils import normalize_text
+
+
+logger = logging.getLogger(__name__)
+
+CHANGES_KEY = 'suggest:changes'
+# Top books are precomputed for every prefix matching more word entries than
+# this; narrower prefixes are ranked at query time
+PRECOMPUTE_THRESHOLD = 256
+# Most entries scanned for a multi-word query, taken from its most selective word
+# (most popular first within each word)
+SCAN_LIMIT = 1000
+WORD_RE = re.compile(r'\w+')
+
+
+def get_max_limit():
+    return getattr(settings, 'SUGGEST_MAX_LIMIT', 20)
+
+
+def get_sync_interval():
+    return getattr(settings, 'SUGGEST_SYNC_INTERVAL', 5)
+
+
+def get_rebuild_interval():
+    return getattr(settings, 'SUGGEST_REBUILD_INTERVAL', 60 * 60)
+
+
+def words_of(text):
+    return list(dict.fromkeys(sys.intern(word) for word in WORD_RE.findall(text)))
+
+
+class SuggestIndex:
+    """
+    Prefix index over the normalize_text() words of book titles and authors.
+
+    word_keys/word_refs are parallel sorted arrays (word, book position),
+    ordered by popularity within a word, so a prefix is a bisect range.
+    top holds the most popular positions for every prefix too wide to rank
+    per query. Books removed or replaced after the build are only marked
+    dead and skipped; the periodic rebuild compacts them away.
+    """
+
+    def __init__(self):
+        self.books = []
+        self.texts = []
+        self.popularity = array('d')
+        self.positions = {}
+        self.word_keys = []
+        self.word_refs = array('I')
+        self.top = {}
+        self.top_size = get_max_limit() * 2
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls, rows, popularity):
+        """rows: (id, title, author, permalink); popularity: {book id: score}."""
+        index = cls()
+        entries = []
+        for book_id, title, author, permalink in rows:
+            book_id = str(book_id)
+            position = index.add_book(book_id, title, author, permalink, popularity.get(book_id, 0.0))
+            score = index.popularity[position]
+            entries.extend((word, -score, position) for word in words_of(index.texts[position]))
+        entries.sort()
+        index.word_keys = [word for word, _, _ in entries]
+        index.word_refs = array('I', (position for _, _, position in entries))
+        index.compute_top()
+        return index
+
+    def add_book(self, book_id, title, author, permalink, score):
+        position = len(self.books)
+        self.books.append({'id': book_id, 'title': title, 'author': author, 'permalink': permalink})
+        # Words separated (and led) by spaces, so ' ' + token finds a word prefix
+        self.texts.append(' ' + ' '.join(WORD_RE.findall(normalize_text(f"{title} {author}"))))
+        self.popularity.append(score)
+        self.positions[book_id] = position
+        return position
+
+    def compute_top(self, start=None, end=None, length=1):
+        if start is None:
+            start, end = 0, len(self.word_keys)
+        keys = self.word_keys
+        while start < end:
+            if len(keys[start]) < length:
+                start = bisect_right(keys, keys[start], start, end)
+                continue
+            prefix = keys[start][:length]
+            stop = bisect_left(keys, prefix + '\uffff', start, end)
+            if stop - start > PRECOMPUTE_THRESHOLD:
+                self.top[prefix] = self.rank(dict.fromkeys(self.word_refs[start:stop]), self.top_size)
+                self.compute_top(start, stop, length + 1)
+            start = stop
+
+    def rank(self, positions, limit):
+        alive = (position for position in positions if self.books[position] is not None)
+        return heapq.nlargest(limit, alive, key=self.popularity.__getitem__)
+
+    def word_range(self, prefix):
+        start = bisect_left(self.word_keys, prefix)
+        return start, bisect_left(self.word_keys, prefix + '\uffff', start)
+
+    def suggest(self, query, limit):
+        tokens = WORD_RE.findall(normalize_text(query))
+        if not tokens:
+            return []
+        with self.lock:
+            if len(tokens) == 1 and tokens[0] in self.top:
+                positions = [position for position in self.top.get(tokens[0], ())
+                             if self.books[position] is not None][:limit]
+            else:
+                start, end = min((self.word_range(token) for token in tokens), key=lambda bounds: bounds[1] - bounds[0])
+                candidates = dict.fromkeys(self.word_refs[start:min(end, start + SCAN_LIMIT)])
+                if len(tokens) > 1:
+                    needles = [' ' + token for token in tokens]
+                    candidates = [position for position in candidates
+                                  if all(needle in self.texts[position] for needle in needles)]
+                positions = self.rank(candidates, limit)
+            return [self.books[position] for position in positions]
+
+    def upsert(self, book_id, title, author, permalink):
+        with self.lock:
+            previous = self.positions.get(book_id)
+            score = 0.0
+            if previous is not None:
+                score = self.popularity[previous]
+                self.books[previous] = None
+            position = self.add_book(book_id, title, author, permalink, score)
+            for word in words_of(self.texts[position]):
+                at = bisect_right(self.word_keys, word)
+                self.word_keys.insert(at, word)
+                self.word_refs.insert(at, position)
+                # Lists missing here are narrow prefixes ranked per query, which see the new entry anyway
+                for length in range(1, len(word) + 1):
+                    top = self.top.get(word[:length])
+                    if top is None:
+                        break
+                    if len(top) < self.top_size or score > self.popularity[top[-1]]:
+                        top.append(position)
+                        top.sort(key=self.popularity.__getitem__, reverse=True)
+                        del top[self.top_size:]
+
+    def remove(self, book_id):
+        with self.lock:
+            position = self.positions.pop(book_id, None)
+            if position is not None:
+                self.books[position] = None
+
+
+_index = None
+_state_lock = threading.Lock()
+_syncing = False
+_next_sync = 0.0
+_next_rebuild = 0.0
+_last_change = None
+
+
+def load_popularity():
+    from .popularity import ALL_TIME, ranking_key
+    try:
+        ranked = get_redis().zrange(ranking_key(ALL_TIME), 0, -1, withscores=True)
+    except Exception as e:
+        logger.warning("Could not load popularity for suggestions: %s", e)
+        return {}
+    return {member.decode(): score for member, score in ranked}
+
+
+def rebuild_index():
+    """Build a fresh index from api_book and swap it in. Changes published meanwhile are replayed."""
+    global _index, _last_change, _next_rebuild
+    from .models import Book
+
+    latest = get_redis().xrevrange(CHANGES_KEY, count=1)
+    last_change = latest[0][0] if latest else b'0-0'
+    rows = Book.objects.values_list('id', 'title', 'author', 'permalink').order_by().iterator(chunk_size=5000)
+    _index = SuggestIndex.build(rows, load_popularity())
+    _last_change = last_change
+    _next_rebuild = time.monotonic() + get_rebuild_interval()
+    return _index
+
+
+def apply_changes():
+    """Apply the book changes published since the last sync; a gap in the stream means a rebuild."""
+    global _last_change
+    from .models import Book
+
+    changes = get_redis().xrange(CHANGES_KEY, min=_last_change, max='+', count=10000)
+    if _last_change != b'0-0':
+        if not changes or changes[0][0] != _last_change:
+            return rebuild_index()
+        changes = changes[1:]
+    if not changes:
+        return _index
+
+    saved, deleted = set(), set()
+    for _, fields in changes:
+        operation = fields[b'op'].decode()
+        if operation == 'reset':
+            return rebuild_index()
+        ids = set(fields[b'ids'].decode().split(','))
+        if operation == 'delete':
+            deleted |= ids
+            saved -= ids
+        else:
+            saved |= ids
+            deleted -= ids
+    for book_id in deleted:
+        _index.remove(book_id)
+    if saved:
+        for book_id, title, author, permalink in Book.objects.filter(id__in=saved).values_list(
+                'id', 'title', 'author', 'permalink'):
+            _index.upsert(str(book_id), title, author, permalink)
+    _last_change = changes[-1][0]
+    return _index
+
+
+def sync_index():
+    global _syncing
+    try:
+        if _index is None or time.monotonic() >= _next_rebuild:
+            rebuild_index()
+        else:
+            apply_changes()
+    finally:
+        _syncing = False
+
+
+def get_index():
+    """
+    This worker's index. Syncing runs on the background pool at most every
+    SUGGEST_SYNC_INTERVAL seconds, so callers never wait on the database;
+    until the first build finishes this returns None.
+    """
+    global _syncing, _next_sync
+    now = time.monotonic()
+    if now >= _next_sync:
+        with _state_lock:
+            if not _syncing and now >= _next_sync:
+                _syncing = True
+                _next_sync = now + get_sync_interval()
+                submit(sync_index)
+    return _index
+
+
+def ensure_index():
+    """This worker's index, built now if there is none yet (a warm-up step)."""
+    return _index if _index is not None else rebuild_index()
+
+
+def reset_after_fork():
+    # An index built before the fork is kept (shared copy-on-write); syncing restarts here
+    global _syncing, _next_sync, _state_lock
+    _syncing = False
+    _next_sync = 0.0
+    _state_lock = threading.Lock()
+
+
+def suggest_books(query, limit):
+    index = get_index()
+    return index.suggest(query, limit) if index is not None else []
+
+
+def publish_book_changes(operation, *book_ids):
+    """Tell every worker's index about saved/deleted books ('save', 'delete') or to rebuild ('reset')."""
+    fields = {'op': operation, 'ids': ','.join(str(book_id) for book_id in book_ids)}
+
+    def publish():
+        try:
+            get_redis().xadd(CHANGES_KEY, fields, maxlen=10000, approximate=True)
+        except Exception as e:
+            logger.warning("Could not publish book changes for suggestions: %s", e)
+
+    transaction.on_commit(publish)
@@ -0,0 +1,63 @@
+import logging
+import requests
+from django.conf import settings
+from .background import submit
+from .redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+SURROGATE_HEADER = 'Surrogate-Key'
+
+
+def add_surrogate_keys(response, *keys):
+    keys = [str(key) for key in keys if key]
+    if keys:
+        existing = response.get(SURROGATE_HEADER, '').split()
+        response[SURROGATE_HEADER] = ' '.join(dict.fromkeys(existing + keys))
+    return response
+
+
+def surrogate_set_key(key):
+    return f"surrogate:{key}"
+
+
+def record_cached_url(keys, host, path, max_age):
+    """Remember which proxy cache entries carry each key so a purge can find them."""
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for key in keys:
+            pipe.sadd(surrogate_set_key(key), f"{host}|{path}")
+            pipe.expire(surrogate_set_key(key), max_age * 2 + 60)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Could not record surrogate keys: %s", e)
+
+
+def send_purges(entries):
+    base_url = settings.NGINX_PURGE_URL.rstrip('/')
+    for entry in entries:
+        host, _, path = entry.partition('|')
+        try:
+            requests.get(f"{base_url}/purge{path}", headers={'Host': host}, timeout=2)
+        except requests.RequestException as e:
+            logger.warning("Proxy cache purge of %s%s failed: %s", host, path, e)
+
+
+def purge_surrogate_keys(*keys):
+    if not getattr(settings, 'NGINX_PURGE_URL', None) or not keys:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=True)
+        for key in keys:
+            pipe.smembers(surrogate_set_key(key))
+            pipe.delete(surrogate_set_key(key))
+        results = pipe.execute()
+    except Exception as e:
+        logger.warning("Could not load surrogate keys for purge: %s", e)
+        return
+    entries = set()
+    for members in results[::2]:
+        entries.update(members)
+    if entries:
+        submit(send_purges, [entry.decode() if isinstance(entry, bytes) else entry for entry in entries])
@@ -0,0 +1,42 @@
+from django.utils import timezone
+from .caching import invalidate
+from .jobs import enqueue, job
+
+
+# Jobs run by `manage.py run_workers` (api.jobs). Model saves and serializers
+# enqueue them after commit instead of doing the work in the request.
+
+
+@job('book.touch')
+def touch_book(book_id):
+    from .models import Book
+    Book.objects.filter(id=book_id).update(date_updated=timezone.now())
+    invalidate(f"book:{book_id}", "books")
+
+
+@job('book.search_vector')
+def update_search_vector(book_id):
+    from .models import Book
+    book = Book.objects.filter(id=book_id).only('title', 'description', 'author').first()
+    if book is None:
+        return
+    Book.objects.filter(id=book_id).update(search_vector=book.get_search_vector())
+    # Searches cached before the update did not find the book by its new text
+    invalidate("books")
+
+
+@job('book.cover', retries=3, backoff=30)
+def download_cover(book_id, url):
+    from .services.book_import import download_cover as download
+    if not download(book_id, url):
+        raise ValueError(f"Cover download from {url} failed.")
+    invalidate(f"book:{book_id}", "books")
+
+
+@job('library.fanout', retries=5, backoff=5)
+def fan_out_chapter(book_id, chapter, after_user_id=None):
+    # One batch of followers per run; the next batch is queued as its own job
+    from .library import fan_out
+    last_user_id = fan_out(book_id, chapter, after_user_id)
+    if last_user_id is not None:
+        enqueue('library.fanout', book_id, chapter, last_user_id, key=f"fanout:{chapter['id']}:{last_user_id}")
@@ -0,0 +1,53 @@
+import time
+from .redis_client import get_redis
+
+
+# Refills the bucket for the time elapsed since the last call, then takes
+# cost tokens if there are enough. State is one hash per identity that
+# expires once the bucket would be full again. Fractions are returned as
+# strings since Lua numbers are truncated to integers in replies.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(retry_after), tostring(tokens)}
+"""
+
+_script = None
+
+
+def bucket_key(identity):
+    return f"throttle:{identity}"
+
+
+def reset_after_fork():
+    global _script
+    _script = None
+
+
+def take_tokens(identity, capacity, rate, cost):
+    """
+    Atomically take cost tokens from the identity's bucket (capacity tokens,
+    refilled at rate per second). Returns (allowed, retry_after_seconds, tokens_left).
+    """
+    global _script
+    if _script is None:
+        _script = get_redis().register_script(TOKEN_BUCKET_SCRIPT)
+    allowed, retry_after, tokens = _script(
+        keys=[bucket_key(identity)], args=[capacity, rate, min(cost, capacity), time.time()])
+    return bool(allowed), float(retry_after), float(tokens)
@@ -0,0 +1,20 @@
+from django.conf import settings
+from .jobs import enqueue
+
+
+def get_touch_window():
+    return getattr(settings, 'BOOK_TOUCH_WINDOW', 5)
+
+
+def touch_book(book_id):
+    """
+    Bump Book.date_updated without writing the row right away.
+
+    The UPDATE is a book.touch job delayed by the touch window and keyed by
+    book, so every touch of a book inside a window shares one write. The job
+    invalidates the book's caches once the new date_updated is stored, so no
+    response, ETag or Last-Modified is cached with the old one.
+    """
+    if book_id is None:
+        return
+    enqueue('book.touch', str(book_id), key=f"touch:{book_id}", delay=get_touch_window())
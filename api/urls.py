@@ -4,10 +4,14 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 from .views.User import RegisterView, CustomTokenObtainPairView, LogoutView, UserDetailView, MeDetailView
-from .views.Book import BookCreateView, BookDetailView, BookListView, search_books
+from .views.Book import BookCreateView, BookDetailView, BookListView, BookExportView, search_books
+from .views.Book import popular_books_view, book_facets, book_suggest, LatestBooksView
 from .views.Book import VolumeCreateView, VolumeDetailView
-from .views.Book import ChapterCreateView, ChapterDetailView, GenreListView
+from .views.Book import ChapterCreateView, ChapterDetailView, GenreListView, ChapterImportView
 from .views.Book import ChapterUpdateView, ChapterDeleteView, VolumeListView, VolumeListAllView
+from .views.Comment import CommentListView, CommentDetailView, ReplyListView, ReplyDetailView, ReportView
+from .views.Comment import comment_counts
+from .views.Library import FollowView, LibraryView, LibraryUpdatesView
 
 urlpatterns = [
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
@@ -28,6 +32,12 @@ urlpatterns = [
     path('books/permalink/<str:permalink>/',
          BookDetailView.as_view(), name='book-view-permalink'),
     path('books/search/', search_books, name='search-books'),
+    path('books/popular/', popular_books_view, name='book-popular'),
+    path('books/facets/', book_facets, name='book-facets'),
+    path('books/suggest/', book_suggest, name='book-suggest'),
+    path('books/latest/', LatestBooksView.as_view(), name='book-latest'),
+    path('books/<uuid:id>/export/<str:export_format>/', BookExportView.as_view(), name='book-export'),
+    path('books/<uuid:id>/follow/', FollowView.as_view(), name='book-follow'),
 
 
     path('genres/list/', GenreListView.as_view(), name='genre-list'),
@@ -40,10 +50,27 @@ urlpatterns = [
 
     # Chapter api
     path('chapters/', ChapterCreateView.as_view(), name='chapter-create'),
+    path('chapters/import/', ChapterImportView.as_view(), name='chapter-import'),
     path('chapters/<uuid:pk>/', ChapterUpdateView.as_view(), name='chapter-update'),
     path('chapters/<uuid:pk>/delete/', ChapterDeleteView.as_view(), name='chapter-delete'),
     path('chapters/<uuid:id>/',
          ChapterDetailView.as_view(), name='chapter-view'),
     path('chapters/permalink/<str:permalink>/',
          ChapterDetailView.as_view(), name='chapter-view-permalink'),
+
+    # Comment api
+    path('chapters/<uuid:chapter_id>/comments/', CommentListView.as_view(), name='comment-list'),
+    path('chapters/<uuid:chapter_id>/comments/<uuid:comment_id>/',
+         CommentDetailView.as_view(), name='comment-detail'),
+    path('chapters/<uuid:chapter_id>/comments/<uuid:comment_id>/report/', ReportView.as_view(), name='comment-report'),
+    path('chapters/<uuid:chapter_id>/comments/<uuid:comment_id>/replies/', ReplyListView.as_view(), name='reply-list'),
+    path('chapters/<uuid:chapter_id>/comments/<uuid:comment_id>/replies/<uuid:reply_id>/',
+         ReplyDetailView.as_view(), name='reply-detail'),
+    path('chapters/<uuid:chapter_id>/comments/<uuid:comment_id>/replies/<uuid:reply_id>/report/',
+         ReportView.as_view(), name='reply-report'),
+    path('comments/counts/', comment_counts, name='comment-counts'),
+
+    # Library api
+    path('library/', LibraryView.as_view(), name='library'),
+    path('library/updates/', LibraryUpdatesView.as_view(), name='library-updates'),
 ]
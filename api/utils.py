@@ -6,6 +6,9 @@ from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from datetime import datetime
+import uuid
+import requests
+from django.core.files.base import ContentFile
 
 
 def normalize_text(text):
@@ -31,4 +34,12 @@ def generate_permalink(s):
     url_friendly_str = url_friendly_str.strip('-')
     random_string = ''.join(random.choices(
         string.ascii_lowercase + string.digits, k=12))
-    return f'{url_friendly_str}-{random_string}'
\ No newline at end of file
+    return f'{url_friendly_str}-{random_string}'
+
+
+def fetch_image(url, timeout=10):
+    response = requests.get(url, timeout=timeout)
+    if response.status_code == 200:
+        file_name = str(uuid.uuid4()) + '.jpg'
+        return ContentFile(response.content, name=file_name)
+    return None
@@ -10,16 +10,31 @@ from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import AllowAny, BasePermission, IsAuthenticated
 from rest_framework.exceptions import NotFound
 from django.core.cache import cache
-from django.views.decorators.cache import cache_page
+from django.conf import settings
 from django.utils.decorators import method_decorator
 from django_filters.rest_framework import DjangoFilterBackend
 import hashlib
 import json
-import zlib
 from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import MultiPartParser
+from api.parsers import ORJSONParser
 from cassandra.cqlengine import connection
+from django.core.exceptions import ValidationError
+from api.services.chapter_import import detect_format, import_chapters, parse_json, parse_source
+from api.services.export import EXPORT_FORMATS
+from django.http import StreamingHttpResponse
+from api.caching import get_generation, get_generations
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from api.conditional import conditional_view, last_modified_from, make_etag
+from api.surrogate import add_surrogate_keys
+from api.popularity import get_periods, popular_books, remember_chapter
+from api.facets import get_facets
+from api.releases import page_releases
+from api.suggest import get_max_limit as get_suggest_max_limit, suggest_books
 
 
 class IsSuperUser(BasePermission):
@@ -32,11 +47,27 @@ class IsModeratorOrHigher(BasePermission):
         return request.user and (request.user.is_staff or request.user.is_superuser)
 
 
+class SurrogateKeyMixin:
+    # Keys tag responses for the shared proxy cache; see api.surrogate
+    surrogate_keys = ()
+
+    def get_surrogate_keys(self):
+        return list(self.surrogate_keys) + getattr(self, '_surrogate_keys', [])
+
+    def add_surrogate_key(self, *keys):
+        self._surrogate_keys = getattr(self, '_surrogate_keys', []) + list(keys)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and response.status_code == 200:
+            add_surrogate_keys(response, *self.get_surrogate_keys())
+        return response
+
+
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
-@cache_page(60 * 12)
 def search_books(request):
     query = request.query_params.get('q', None)
     if query:
@@ -45,12 +76,103 @@ def search_books(request):
         serializer = BookListViewSerializer(
             books, many=True, context={'request': request})
         if serializer.data:
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return add_surrogate_keys(Response(serializer.data, status=status.HTTP_200_OK), "books")
         else:
             return Response({"error": "No books found."}, status=status.HTTP_404_NOT_FOUND)
     return Response({"error": "Query parameter 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def popular_books_view(request):
+    # Served from the Redis rankings only; see api.popularity
+    period = request.query_params.get('period', 'day')
+    if period not in get_periods():
+        return Response({"error": "Supported periods are: " + ", ".join(get_periods())}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = int(request.query_params.get('limit', 20))
+    except ValueError:
+        return Response({"error": "'limit' must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, getattr(settings, 'POPULAR_MAX_LIMIT', 100)))
+    return Response(popular_books(period, limit), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def book_facets(request):
+    # Book counts per BookFilter genre/status value, maintained in Redis; see api.facets
+    return Response(get_facets(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def book_suggest(request):
+    # Title/author prefix matches from this worker's in-memory index; see api.suggest
+    query = request.query_params.get('q', '')
+    try:
+        limit = int(request.query_params.get('limit', 10))
+    except ValueError:
+        return Response({"error": "'limit' must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, get_suggest_max_limit()))
+    return Response(suggest_books(query, limit), status=status.HTTP_200_OK)
+
+
+def query_fingerprint(request):
+    return hashlib.md5(json.dumps(sorted(request.GET.lists())).encode('utf-8')).hexdigest()
+
+
+def token_user_id(request):
+    # Validators run before DRF authentication; the access token alone identifies the user (as in ThrottleMiddleware)
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if header.startswith('Bearer '):
+        try:
+            return AccessToken(header[7:].strip())[jwt_settings.USER_ID_CLAIM]
+        except (TokenError, KeyError):
+            pass
+    return None
+
+
+def book_validators(lookup, *extra, scopes=()):
+    row = Book.objects.filter(**lookup).values_list('id', 'date_updated').first()
+    if row is None:
+        return None, None
+    book_id, date_updated = row
+    generations = get_generations(f"book:{book_id}", *scopes)
+    return make_etag(book_id, *generations, *extra), last_modified_from(date_updated, *generations)
+
+
+def book_detail_validators(request, *args, **kwargs):
+    # Signed-in users also get is_following, which changes with their library generation
+    user_id = token_user_id(request)
+    extra, scopes = ((f"u{user_id}",), (f"library:{user_id}",)) if user_id is not None else ((), ())
+    if 'id' in kwargs:
+        return book_validators({'id': kwargs['id']}, *extra, scopes=scopes)
+    return book_validators({'permalink': kwargs.get('permalink')}, *extra, scopes=scopes)
+
+
+def volume_list_validators(request, *args, **kwargs):
+    params = query_fingerprint(request)
+    if 'permalink' in kwargs:
+        return book_validators({'permalink': kwargs['permalink']}, params)
+    return book_validators({'id': kwargs.get('id')}, params)
+
+
+def chapter_validators(request, *args, **kwargs):
+    scope = f"chapter:{kwargs['id']}" if 'id' in kwargs else f"chapter:{kwargs.get('permalink')}"
+    generation = get_generation(scope)
+    return make_etag(scope, generation), last_modified_from(None, generation)
+
+
+def book_list_validators(request, *args, **kwargs):
+    generation = get_generation("books")
+    return make_etag('books', generation, query_fingerprint(request)), last_modified_from(None, generation)
+
+
+def latest_books_validators(request, *args, **kwargs):
+    generations = get_generations("releases", "books")
+    return make_etag('releases', *generations, query_fingerprint(request)), last_modified_from(None, *generations)
+
+
 class BookCreateView(generics.CreateAPIView):
     queryset = Book.objects.all()
     permission_classes = (IsModeratorOrHigher,)
@@ -60,7 +182,8 @@ class BookCreateView(generics.CreateAPIView):
         serializer.save(posted_by=self.request.user)
 
 
-class BookDetailView(generics.RetrieveAPIView):
+@method_decorator(conditional_view(book_detail_validators), name='dispatch')
+class BookDetailView(SurrogateKeyMixin, generics.RetrieveAPIView):
     queryset = Book.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = BookDetailViewSerializer
@@ -76,17 +199,22 @@ class BookDetailView(generics.RetrieveAPIView):
             raise NotFound("Book not found")
 
         try:
-            return Book.objects.get(**{lookup_field: lookup_value})
+            book = Book.objects.get(**{lookup_field: lookup_value})
         except Book.DoesNotExist:
             raise NotFound("Book not found")
+        self.add_surrogate_key(f"book:{book.id}")
+        return book
     
 
 class BookListPagination(PageNumberPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
-     
-class BookListView(generics.ListAPIView):
+
+
+@method_decorator(conditional_view(book_list_validators), name='dispatch')
+class BookListView(SurrogateKeyMixin, generics.ListAPIView):
+    surrogate_keys = ("books",)
     queryset = Book.objects.all()
     serializer_class = BookListViewSerializer
     permission_classes = (AllowAny,)
@@ -95,17 +223,7 @@ class BookListView(generics.ListAPIView):
     pagination_class = BookListPagination
 
     def list(self, request, *args, **kwargs):
-        # Generate cache key based on request query parameters
-        query_params = request.query_params
-        cache_key = hashlib.md5(json.dumps(
-            query_params, sort_keys=True).encode('utf-8')).hexdigest()
-        cached_response = cache.get(cache_key)
-
-        if cached_response:
-            # Decompress response
-            cached_response = zlib.decompress(cached_response)
-            return Response(json.loads(cached_response))
-        
+        # Responses are cached by ResponseCacheMiddleware (RESPONSE_CACHE_ROUTES['book-list'])
         queryset = self.filter_queryset(self.get_queryset())
         
         # Check if limit parameter is provided
@@ -118,19 +236,45 @@ class BookListView(generics.ListAPIView):
 
         if page is not None:
             serializer = self.get_serializer(page, many=True)
-            result = self.get_paginated_response(serializer.data)
-        else:
-            serializer = self.get_serializer(queryset, many=True)
-            result = Response(serializer.data)
+            return self.get_paginated_response(serializer.data)
 
-        # Compress response
-        compressed_response = zlib.compress(
-            json.dumps(result.data).encode('utf-8'))
-        cache.set(cache_key, compressed_response,
-                  timeout=60*30)  # Cache for 30 minutes
-        return result
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
 
-class VolumeListView(generics.ListAPIView):
+
+@method_decorator(conditional_view(latest_books_validators), name='dispatch')
+class LatestBooksView(SurrogateKeyMixin, generics.GenericAPIView):
+    # Recently updated books with their newest chapter, from the release_event buckets (api.releases).
+    # Cursor paged; ?cursor= takes the "next" of the previous page.
+    surrogate_keys = ("releases", "books")
+    serializer_class = BookListViewSerializer
+    permission_classes = (AllowAny,)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            page_size = int(request.query_params.get('page_size', 20))
+        except ValueError:
+            return Response({"error": "'page_size' must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        page_size = max(1, min(page_size, getattr(settings, 'RELEASE_FEED_MAX_PAGE_SIZE', 100)))
+        rows, next_cursor = page_releases(page_size, request.query_params.get('cursor'))
+        books = Book.objects.in_bulk([row['book_id'] for row in rows])
+        results = []
+        for row in rows:
+            book = books.get(row['book_id'])
+            if book is None:
+                continue
+            results.append({**self.get_serializer(book).data, 'latest_chapter': {
+                'id': row['chapter_id'],
+                'name': row['chapter_name'],
+                'permalink': row['chapter_permalink'],
+                'number': row['number'],
+                'date_created': row['created_at'],
+            }})
+        return Response({'next': next_cursor, 'results': results})
+
+
+@method_decorator(conditional_view(volume_list_validators), name='dispatch')
+class VolumeListView(SurrogateKeyMixin, generics.ListAPIView):
     permission_classes = (AllowAny,)
     serializer_class = VolumeSerializer
     
@@ -138,6 +282,7 @@ class VolumeListView(generics.ListAPIView):
         permalink = self.kwargs['permalink']
         book = Book.objects.filter(permalink=permalink).first()
         if book:
+            self.add_surrogate_key(f"book:{book.id}")
             return Volume.objects.filter(book=book)
         return Volume.objects.none()
     
@@ -146,15 +291,17 @@ class VolumeListView(generics.ListAPIView):
         if not queryset.exists():
             return Response({"detail": "Book not found or no volume available."}, status=status.HTTP_204_NO_CONTENT)
         serializer = self.get_serializer(queryset, many=True, context={'request': request})
+        self.add_surrogate_key(*(f"volume:{volume.id}" for volume in queryset))
         return Response(serializer.data)
 
-@method_decorator(cache_page(60 * 12), name='dispatch')    
-class VolumeListAllView(generics.ListAPIView):
+@method_decorator(conditional_view(volume_list_validators), name='dispatch')
+class VolumeListAllView(SurrogateKeyMixin, generics.ListAPIView):
     def get(self, request, *args, **kwargs):
         book_id = kwargs.get('id')
         book = Book.objects.filter(id=book_id).first()
         if not book:
             return Response({"detail": "Book not found."}, status=404)
+        self.add_surrogate_key(f"book:{book.id}")
 
         volumes = Volume.objects.filter(book=book)
         result = {
@@ -187,6 +334,30 @@ class VolumeListAllView(generics.ListAPIView):
         return Response(result)
 
 
+class BookExportView(generics.GenericAPIView):
+    permission_classes = (AllowAny,)
+
+    def get(self, request, *args, **kwargs):
+        export_format = kwargs.get('export_format')
+        if export_format not in EXPORT_FORMATS:
+            return Response({"error": "Supported formats are: " + ", ".join(EXPORT_FORMATS)}, status=status.HTTP_400_BAD_REQUEST)
+
+        book = Book.objects.filter(id=kwargs.get('id')).first()
+        if not book:
+            return Response({"detail": "Book not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            start_number = int(request.query_params.get('from', 0)) or None
+            fetch_size = int(request.query_params.get('fetch_size', 0)) or None
+        except ValueError:
+            return Response({"error": "'from' and 'fetch_size' must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        stream, content_type = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(stream(book, start_number, fetch_size), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{book.permalink}.{export_format}"'
+        return response
+
+
 class VolumeCreateView(generics.CreateAPIView):
     queryset = Volume.objects.all()
     permission_classes = (IsModeratorOrHigher,)
@@ -196,7 +367,7 @@ class VolumeCreateView(generics.CreateAPIView):
         serializer.save()
 
 
-class VolumeDetailView(generics.RetrieveAPIView):
+class VolumeDetailView(SurrogateKeyMixin, generics.RetrieveAPIView):
     queryset = Volume.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = VolumeSerializer
@@ -209,9 +380,19 @@ class VolumeDetailView(generics.RetrieveAPIView):
             lookup_field = 'id'
             lookup_value = self.kwargs['id']
         try:
-            return Volume.objects.get(**{lookup_field: lookup_value})
-        except Chapter.DoesNotExist:
+            volume = Volume.objects.get(**{lookup_field: lookup_value})
+        except Volume.DoesNotExist:
             raise NotFound("Volume not found")
+        self.add_surrogate_key(f"volume:{volume.id}", f"book:{volume.book_id}")
+        return volume
+
+
+def find_chapter(**lookup):
+    # Not objects.get(): it sets obj.pk, which cqlengine writes to the first key column and so overwrites book_id
+    chapter = Chapter.objects.filter(**lookup).first()
+    if chapter is None:
+        raise NotFound("Chapter not found")
+    return chapter
 
 
 class ChapterCreateView(generics.CreateAPIView):
@@ -223,17 +404,16 @@ class ChapterCreateView(generics.CreateAPIView):
         data = request.data.copy()
         data['date_created'] = timezone.now().isoformat()
         data['date_updated'] = timezone.now().isoformat()
-        last_chapter = Chapter.objects.filter(book_id=data['book_id']).order_by('-number').first()
-        data['number'] =  1 if last_chapter is None else last_chapter.number + 1
         # Generate permalink if not provided
-        if 'permalink' not in data or not data['permalink']:
+        if ('permalink' not in data or not data['permalink']) and data.get('name'):
             data['permalink'] = generate_permalink(data['name'])
 
         serializer = self.get_serializer(data=data)
 
         if serializer.is_valid():
             try:
-                chapter = serializer.save()
+                # Numbers are reserved only for valid payloads, so rejected posts leave no gaps
+                chapter = serializer.save(number=Chapter.reserve_numbers(serializer.validated_data['book_id'])[0])
                 return Response(ChapterSerializer(chapter).data, status=status.HTTP_201_CREATED)
             except serializers.ValidationError as e:
                 return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
@@ -242,11 +422,46 @@ class ChapterCreateView(generics.CreateAPIView):
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class ChapterImportView(generics.GenericAPIView):
+    permission_classes = (IsSuperUser,)
+    parser_classes = (ORJSONParser, MultiPartParser)
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        try:
+            concurrency = int(request.data.get('concurrency') or 0) or None
+            batch_size = int(request.data.get('batch_size') or 0) or None
+        except (TypeError, ValueError):
+            return Response({"error": ["Invalid concurrency or batch_size."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if upload is not None:
+                parsed = parse_source(upload, detect_format(upload.name, request.data.get('format')))
+            else:
+                parsed = parse_json(request.data)
+            result = import_chapters(
+                request.data.get('book_id'),
+                parsed,
+                volume_id=request.data.get('volume_id'),
+                volume_name=request.data.get('volume_name'),
+                concurrency=concurrency,
+                batch_size=batch_size,
+            )
+        except ValidationError as e:
+            return Response({"error": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+
+        response_status = status.HTTP_207_MULTI_STATUS if result['failed'] else status.HTTP_201_CREATED
+        return Response(result, status=response_status)
+
+
 class ChapterUpdateView(generics.UpdateAPIView):
     queryset = Chapter.objects.all()
     serializer_class = ChapterSerializer
     permission_classes = (AllowAny,)
 
+    def get_object(self):
+        return find_chapter(id=self.kwargs['pk'])
+
     def put(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
@@ -266,8 +481,12 @@ class ChapterUpdateView(generics.UpdateAPIView):
 class ChapterDeleteView(generics.DestroyAPIView):
     queryset = Chapter.objects.all()
     permission_classes = (AllowAny,)
+
+    def get_object(self):
+        return find_chapter(id=self.kwargs['pk'])
     
-class ChapterDetailView(generics.RetrieveAPIView):
+@method_decorator(conditional_view(chapter_validators), name='dispatch')
+class ChapterDetailView(SurrogateKeyMixin, generics.RetrieveAPIView):
     queryset = Chapter.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = ChapterSerializer
@@ -285,13 +504,13 @@ class ChapterDetailView(generics.RetrieveAPIView):
         else:
             raise NotFound("Chapter not found")
 
-        try:
-            return Chapter.objects.get(**{lookup_field: lookup_value})
-        except Chapter.DoesNotExist:
-            raise NotFound("Chapter not found")
+        chapter = find_chapter(**{lookup_field: lookup_value})
+        remember_chapter(lookup_value, chapter.book_id, chapter.id)
+        self.add_surrogate_key(f"chapter:{chapter.id}", f"chapter:{chapter.permalink}")
+        return chapter
 
-@method_decorator(cache_page(60 * 12), name='dispatch')
-class GenreListView(generics.ListAPIView):
+class GenreListView(SurrogateKeyMixin, generics.ListAPIView):
+    surrogate_keys = ("genres",)
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
     permission_classes = (AllowAny,)
@@ -0,0 +1,128 @@
+from uuid import UUID
+from django.conf import settings
+from rest_framework import generics, status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound, PermissionDenied
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.response import Response
+from api.serializers import CommentSerializer, ReplySerializer, ReportSerializer
+from api.services.comments import (
+    add_comment, add_reply, delete_comment, delete_reply, get_comment, get_comment_counts, get_reply,
+    page_comments, page_replies, report, resolve_chapter,
+)
+
+
+def get_page_size(request):
+    default = getattr(settings, 'COMMENT_PAGE_SIZE', 20)
+    try:
+        page_size = int(request.query_params.get('page_size', default))
+    except ValueError:
+        page_size = default
+    return max(1, min(page_size, getattr(settings, 'COMMENT_MAX_PAGE_SIZE', 100)))
+
+
+def can_delete(user, row):
+    return user.is_staff or user.is_superuser or row['user_id'] == user.id
+
+
+def find_comment(chapter_id, comment_id):
+    comment = get_comment(chapter_id, comment_id)
+    if comment is None:
+        raise NotFound("Comment not found")
+    return comment
+
+
+def find_reply(chapter_id, comment_id, reply_id):
+    reply = get_reply(comment_id, reply_id)
+    if reply is None or reply['chapter_id'] != chapter_id:
+        raise NotFound("Reply not found")
+    return reply
+
+
+class CommentListView(generics.GenericAPIView):
+    # Cursor paged, newest first; ?cursor= takes the "next" of the previous page
+    permission_classes = (IsAuthenticatedOrReadOnly,)
+    serializer_class = CommentSerializer
+
+    def get(self, request, chapter_id):
+        rows, next_cursor = page_comments(chapter_id, get_page_size(request), request.query_params.get('cursor'))
+        counts = get_comment_counts([chapter_id] + [row['id'] for row in rows])
+        serializer = self.get_serializer(rows, many=True, context={'reply_counts': counts})
+        return Response({'count': counts[chapter_id], 'next': next_cursor, 'results': serializer.data})
+
+    def post(self, request, chapter_id):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        chapter = resolve_chapter(chapter_id)
+        if chapter is None:
+            raise NotFound("Chapter not found")
+        row = add_comment(chapter_id, chapter[0], request.user, serializer.validated_data['content'])
+        return Response(self.get_serializer(row).data, status=status.HTTP_201_CREATED)
+
+
+class CommentDetailView(generics.GenericAPIView):
+    permission_classes = (IsAuthenticated,)
+
+    def delete(self, request, chapter_id, comment_id):
+        comment = find_comment(chapter_id, comment_id)
+        if not can_delete(request.user, comment):
+            raise PermissionDenied("Only the author or a moderator can delete this comment.")
+        delete_comment(comment)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ReplyListView(generics.GenericAPIView):
+    permission_classes = (IsAuthenticatedOrReadOnly,)
+    serializer_class = ReplySerializer
+
+    def get(self, request, chapter_id, comment_id):
+        comment = find_comment(chapter_id, comment_id)
+        rows, next_cursor = page_replies(comment['id'], get_page_size(request), request.query_params.get('cursor'))
+        count = get_comment_counts([comment['id']])[comment['id']]
+        return Response({'count': count, 'next': next_cursor, 'results': self.get_serializer(rows, many=True).data})
+
+    def post(self, request, chapter_id, comment_id):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        comment = find_comment(chapter_id, comment_id)
+        row = add_reply(comment, request.user, serializer.validated_data['content'])
+        return Response(self.get_serializer(row).data, status=status.HTTP_201_CREATED)
+
+
+class ReplyDetailView(generics.GenericAPIView):
+    permission_classes = (IsAuthenticated,)
+
+    def delete(self, request, chapter_id, comment_id, reply_id):
+        reply = find_reply(chapter_id, comment_id, reply_id)
+        if not can_delete(request.user, reply):
+            raise PermissionDenied("Only the author or a moderator can delete this reply.")
+        delete_reply(reply)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ReportView(generics.GenericAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = ReportSerializer
+
+    def post(self, request, chapter_id, comment_id, reply_id=None):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if reply_id is None:
+            target = find_comment(chapter_id, comment_id)
+        else:
+            target = find_reply(chapter_id, comment_id, reply_id)
+        created = report(target, request.user, serializer.validated_data['reason'])
+        return Response({'reported': True}, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def comment_counts(request):
+    # ?chapters=<id>,<id>... for chapter lists; counts come from the cache (api.services.comments)
+    try:
+        chapter_ids = [UUID(value) for value in request.query_params.get('chapters', '').split(',') if value][:100]
+        counts = get_comment_counts(chapter_ids)
+    except ValueError:
+        return Response({"error": "'chapters' must be a comma-separated list of chapter ids."},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return Response({str(chapter_id): count for chapter_id, count in counts.items()}, status=status.HTTP_200_OK)
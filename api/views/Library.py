@@ -0,0 +1,67 @@
+from django.conf import settings
+from rest_framework import generics, status
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from api.library import follow, page_library, page_updates, unfollow
+from api.models import Book
+from api.serializers import BookListViewSerializer
+
+
+def get_page_size(request):
+    default = getattr(settings, 'LIBRARY_PAGE_SIZE', 20)
+    try:
+        page_size = int(request.query_params.get('page_size', default))
+    except ValueError:
+        page_size = default
+    return max(1, min(page_size, getattr(settings, 'LIBRARY_MAX_PAGE_SIZE', 100)))
+
+
+class FollowView(generics.GenericAPIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, id):
+        if not Book.objects.filter(id=id).exists():
+            raise NotFound("Book not found")
+        created = follow(request.user.id, id)
+        return Response({'following': True}, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    def delete(self, request, id):
+        unfollow(request.user.id, id)
+        return Response({'following': False}, status=status.HTTP_200_OK)
+
+
+class LibraryView(generics.GenericAPIView):
+    # Cursor paged, most recently followed first; ?cursor= takes the "next" of the previous page
+    permission_classes = (IsAuthenticated,)
+    serializer_class = BookListViewSerializer
+
+    def get(self, request):
+        rows, next_cursor = page_library(request.user.id, get_page_size(request), request.query_params.get('cursor'))
+        books = Book.objects.in_bulk([row['book_id'] for row in rows])
+        results = []
+        for row in rows:
+            book = books.get(row['book_id'])
+            if book is not None:
+                # Deleted books drop out of the page rather than out of the library
+                results.append({**self.get_serializer(book).data, 'followed_at': row['followed_at']})
+        return Response({'next': next_cursor, 'results': results})
+
+
+class LibraryUpdatesView(generics.GenericAPIView):
+    # New chapters of followed books, newest first, from the user's inbox (api.library.fan_out)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        rows, next_cursor = page_updates(request.user.id, get_page_size(request), request.query_params.get('cursor'))
+        results = [{
+            'book_id': row['book_id'],
+            'book_title': row['book_title'],
+            'book_permalink': row['book_permalink'],
+            'chapter_id': row['chapter_id'],
+            'chapter_name': row['chapter_name'],
+            'chapter_permalink': row['chapter_permalink'],
+            'number': row['number'],
+            'created_at': row['created_at'],
+        } for row in rows]
+        return Response({'next': next_cursor, 'results': results})
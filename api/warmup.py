@@ -0,0 +1,159 @@
+import io
+import logging
+import math
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import reverse
+from .background import submit
+
+
+logger = logging.getLogger(__name__)
+
+# Set in the environ of warm-up requests. Not an HTTP_ key, so clients cannot
+# send it; the throttle, view counting and anonymous sessions skip these requests.
+WARMUP_ENVIRON_KEY = 'api.warmup'
+
+_pending = {}
+_lock = threading.Lock()
+_timer = None
+_handler = None
+
+
+def get_warmup_delay():
+    return getattr(settings, 'RELEASE_WARMUP_DELAY', 1)
+
+
+def get_warmup_chapters():
+    # Bulk imports only warm their last few chapters, the ones readers open first
+    return getattr(settings, 'RELEASE_WARMUP_CHAPTERS', 5)
+
+
+def get_warmup_host():
+    return getattr(settings, 'RELEASE_WARMUP_HOST', 'localhost')
+
+
+def schedule_release_warmup(book_id, volume_ids=(), chapter_permalinks=()):
+    """
+    Warm the caches readers of a new release hit first: the chapters, the
+    book detail and the TOC pages of the volumes they went into.
+
+    Releases are collected per book for RELEASE_WARMUP_DELAY seconds, so a
+    batch of chapters is rendered once, then warmed on the background pool.
+    """
+    global _timer
+    if book_id is None or not getattr(settings, 'RELEASE_WARMUP', True):
+        return
+
+    with _lock:
+        volumes, permalinks = _pending.setdefault(book_id, (set(), set()))
+        volumes.update(volume_id for volume_id in volume_ids if volume_id)
+        permalinks.update(permalink for permalink in chapter_permalinks if permalink)
+        if _timer is None:
+            _timer = threading.Timer(get_warmup_delay(), flush_release_warmups)
+            _timer.daemon = True
+            _timer.start()
+
+
+def flush_release_warmups():
+    global _timer
+    with _lock:
+        releases = dict(_pending)
+        _pending.clear()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+
+    for book_id, (volume_ids, permalinks) in releases.items():
+        submit(warm_release, book_id, volume_ids, permalinks)
+    return len(releases)
+
+
+def reset_after_fork():
+    global _timer, _lock
+    _timer = None
+    _lock = threading.Lock()
+    _pending.clear()
+
+
+def last_page(volume_id):
+    from .caching import get_generation
+    from .serializers import ChapterPagination
+    from .services.chapters import count_volume_chapters
+
+    count_key = f"chapters_count_{volume_id}_{get_generation(f'volume:{volume_id}')}"
+    count = cache.get(count_key)
+    if count is None:
+        count = count_volume_chapters(volume_id)
+        cache.set(count_key, count, timeout=60*60)
+    return max(1, math.ceil(count / ChapterPagination.page_size))
+
+
+def release_paths(book_id, volume_ids, chapter_permalinks):
+    """Paths rendered for a release, in the order readers reach them."""
+    from .models import Book
+
+    permalink = Book.objects.filter(id=book_id).values_list('permalink', flat=True).first()
+    if permalink is None:
+        return []
+
+    paths = [reverse('chapter-view-permalink', kwargs={'permalink': chapter}) for chapter in sorted(chapter_permalinks)]
+    paths.append(reverse('book-view', kwargs={'id': book_id}))
+    paths.append(reverse('volume-list-all', kwargs={'id': book_id}))
+    # New chapters are appended: the first page and the one they landed on change
+    pages = {1}
+    for volume_id in sorted(volume_ids, key=str):
+        volume_path = reverse('volume-view', kwargs={'id': volume_id})
+        page = last_page(volume_id)
+        pages.add(page)
+        paths.append(volume_path)
+        if page > 1:
+            paths.append(f"{volume_path}?page={page}")
+    toc_path = reverse('volume-list', kwargs={'permalink': permalink})
+    paths.extend(toc_path if page == 1 else f"{toc_path}?page={page}" for page in sorted(pages))
+    return paths
+
+
+def get_handler():
+    global _handler
+    if _handler is None:
+        handler = BaseHandler()
+        handler.load_middleware()
+        _handler = handler
+    return _handler
+
+
+def render_path(path):
+    """GET path through the full middleware stack as an anonymous JSON client; returns the status code."""
+    path_info, _, query = path.partition('?')
+    host = get_warmup_host()
+    request = WSGIRequest({
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path_info,
+        'QUERY_STRING': query,
+        'SERVER_NAME': host,
+        'SERVER_PORT': '80',
+        'HTTP_HOST': host,
+        'HTTP_ACCEPT': 'application/json',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        WARMUP_ENVIRON_KEY: True,
+    })
+    response = get_handler().get_response(request)
+    response.close()
+    return response.status_code
+
+
+def warm_release(book_id, volume_ids=(), chapter_permalinks=()):
+    """
+    Render the release paths so their entries land in the response and page
+    caches before readers ask. Returns the number of paths rendered.
+    """
+    paths = release_paths(book_id, volume_ids, chapter_permalinks)
+    for path in paths:
+        status = render_path(path)
+        if status != 200:
+            logger.info("Warm-up of %s answered %s", path, status)
+    return len(paths)
@@ -28,12 +28,22 @@ INSTALLED_APPS = [
     'api.apps.ApiConfig',
 ]
 
-INSTALLED_APPS = ['django_cassandra_engine'] + INSTALLED_APPS
+# Connects on first use instead of while the apps load (api.cassandra)
+INSTALLED_APPS = ['api.cassandra.LazyCassandraConfig'] + INSTALLED_APPS
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
@@ -63,9 +73,13 @@ CSRF_TRUSTED_ORIGINS = ["*"]
 
 
 MIDDLEWARE = [
+    'api.middleware.ThrottleMiddleware',
     'api.middleware.TokenBlacklistMiddleware',
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.ViewCountMiddleware',
+    'api.middleware.SurrogateKeyMiddleware',
+    'api.middleware.ResponseCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -131,8 +145,18 @@ DATABASES = {
 
 CACHES = {
     'default': {
-        'BACKEND': 'django_redis.cache.RedisCache',
+        'BACKEND': 'api.cache_backend.TwoTierRedisCache',
         'LOCATION': config('LOCATION_URL'),
+        'OPTIONS': {
+            # Small keys read on nearly every request, kept per worker (see the note at the end)
+            'NEAR_CACHE': {
+                'KEYS': ['gen:*', 'facet_labels:*', 'respcache:genre-list:*', 'chapters_count_*', 'chapter_ref:*'],
+                'MAX_ENTRIES': 5000,
+                'TTL': 5,
+                'CHANNEL': 'cache:invalidate',
+                'STATS_INTERVAL': 10,
+            },
+        },
     }
 }
 
@@ -181,3 +205,164 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 CASSANDRA_FALLBACK_ORDER_BY_PYTHON = True
+
+# Seconds during which Book.date_updated touches from volume/chapter writes are coalesced (one book.touch job)
+BOOK_TOUCH_WINDOW = 5
+
+# Bulk chapter writes (import_chapters): max in-flight Cassandra requests and rows per unlogged batch
+CHAPTER_WRITE_CONCURRENCY = 32
+CHAPTER_WRITE_BATCH_SIZE = 1
+CHAPTER_DELETE_BATCH_SIZE = 100
+
+# Rows per Cassandra page when streaming book exports (capped by the session default_fetch_size)
+CHAPTER_EXPORT_FETCH_SIZE = 200
+
+# Shared nginx microcache: max-age of public API responses and the internal purge endpoint (empty disables purging)
+PROXY_CACHE_MAX_AGE = 60
+NGINX_PURGE_URL = config('NGINX_PURGE_URL', default='')
+BACKGROUND_WORKERS = 4
+
+# Full-response cache (api.middleware.ResponseCacheMiddleware), keyed by URL name.
+# params: query params that take part in the key (others are ignored)
+# scopes: cache generations (formatted with the URL kwargs) that retire entries on writes
+RESPONSE_CACHE_ROUTES = {
+    'search-books': {'timeout': 60 * 12, 'params': ['q'], 'scopes': ['books']},
+    'genre-list': {'timeout': 60 * 60, 'params': ['page', 'page_size'], 'scopes': ['genres']},
+    'volume-list-all': {'timeout': 60 * 12, 'params': [], 'scopes': ['book:{id}']},
+    'chapter-view': {'timeout': 60 * 60 * 6, 'params': [], 'scopes': ['chapter:{id}']},
+    'chapter-view-permalink': {'timeout': 60 * 60 * 6, 'params': [], 'scopes': ['chapter:{permalink}']},
+    'book-view': {'timeout': 60 * 30, 'params': [], 'scopes': ['book:{id}'], 'anonymous_only': True},
+    'book-latest': {'timeout': 60 * 5, 'params': ['cursor', 'page_size'], 'scopes': ['releases', 'books']},
+    'book-list': {
+        'timeout': 60 * 30,
+        'params': ['page', 'page_size', 'limit', 'genres', 'status', 'author', 'date_updated', 'title', 'theme', 'ordering'],
+        'scopes': ['books'],
+    },
+}
+RESPONSE_CACHE_MIN_COMPRESS = 512
+
+# Chapter read counting (api.popularity). Routes map URL names to the kwarg identifying the chapter;
+# pending counts are flushed into Cassandra and the popularity rankings every VIEW_COUNT_FLUSH_INTERVAL seconds.
+VIEW_COUNT_ROUTES = {'chapter-view': 'id', 'chapter-view-permalink': 'permalink'}
+VIEW_COUNT_FLUSH_INTERVAL = 30
+# Half-lives (seconds) of the decayed 'day' and 'week' rankings; 'all' is never decayed
+POPULAR_HALF_LIVES = {'day': 60 * 60 * 6, 'week': 60 * 60 * 24 * 2}
+POPULAR_RANKING_SIZE = 1000
+POPULAR_MAX_LIMIT = 100
+
+# Seconds between background recounts of the genre/status facet counts (api.facets)
+FACET_RECONCILE_INTERVAL = 60 * 60
+
+# In-memory title/author suggestions (api.suggest): seconds between applying published book changes,
+# seconds between full rebuilds (which also pick up new popularity), and the largest limit served
+SUGGEST_SYNC_INTERVAL = 5
+SUGGEST_REBUILD_INTERVAL = 60 * 60
+SUGGEST_MAX_LIMIT = 20
+
+# Proxies (nginx) whose X-Real-IP, X-View-Beacon and X-View-Mirrored headers are believed, as addresses
+# or networks; other clients' copies of these headers are ignored. The default covers docker networks.
+TRUSTED_PROXIES = [proxy.strip() for proxy in config('TRUSTED_PROXIES', default='127.0.0.1,172.16.0.0/12').split(',')
+                   if proxy.strip()]
+
+# Application throttle (api.middleware.ThrottleMiddleware): token buckets per JWT user or anonymous IP.
+# capacity is the burst in tokens, rate the refill in tokens per second; each request costs
+# THROTTLE_COSTS[url name] tokens (THROTTLE_DEFAULT_COST otherwise).
+THROTTLE_RATES = {
+    'user': {'capacity': 120, 'rate': 4},
+    'anon': {'capacity': 60, 'rate': 2},
+}
+THROTTLE_COSTS = {
+    'genre-list': 1,
+    'book-list': 2,
+    'book-facets': 1,
+    'book-suggest': 1,
+    'book-popular': 1,
+    'book-latest': 2,
+    'search-books': 4,
+    'book-view': 2,
+    'book-view-permalink': 2,
+    'volume-list': 3,
+    'volume-list-all': 4,
+    'chapter-view': 5,
+    'chapter-view-permalink': 5,
+    'book-export': 30,
+    'chapter-import': 20,
+    'comment-list': 2,
+    'reply-list': 2,
+    'comment-report': 10,
+    'reply-report': 10,
+    'book-follow': 2,
+    'login': 5,
+    'token_obtain_pair': 5,
+    'register': 10,
+}
+THROTTLE_DEFAULT_COST = 1
+THROTTLE_FAILURE_BACKOFF = 5
+
+# Release warm-up (api.warmup): new chapters (created, admin or imported) render their chapter, the book
+# detail and the affected TOC pages into cache in the background, RELEASE_WARMUP_DELAY seconds after the
+# first one of a batch. Imports warm their last RELEASE_WARMUP_CHAPTERS chapters. RELEASE_WARMUP_HOST is
+# the host the rendered pagination links point at. Concurrent cache misses wait up to SINGLE_FLIGHT_TIMEOUT
+# seconds for the render already running in their worker.
+RELEASE_WARMUP = True
+RELEASE_WARMUP_DELAY = 1
+RELEASE_WARMUP_CHAPTERS = 5
+RELEASE_WARMUP_HOST = config('RELEASE_WARMUP_HOST', default='api.boxtruyen.online')
+SINGLE_FLIGHT_TIMEOUT = 10
+
+# Two-tier cache (api.cache_backend.TwoTierRedisCache): keys matching CACHES OPTIONS NEAR_CACHE KEYS are
+# also kept in each worker's LRU for up to TTL seconds, dropped everywhere through Redis pub/sub on writes.
+# Per-tier hit ratios: python manage.py cache_stats
+
+# Background jobs (api.jobs), run by `python manage.py run_workers`: search vectors, date_updated touches and
+# cover downloads. Pending jobs with the same idempotency key are enqueued once (keys expire after
+# JOBS_IDEMPOTENCY_TTL seconds). JOBS_EAGER runs jobs on the web worker's background pool instead of queueing
+# (keys and delays still debounce, within each worker).
+JOBS_EAGER = config('JOBS_EAGER', default=False, cast=bool)
+JOBS_IDEMPOTENCY_TTL = 60 * 60
+JOBS_WORKER_THREADS = 4
+
+# Worker boot (gunicorn.conf.py, api.lifecycle): every worker runs the WORKER_WARMUP steps before taking
+# traffic (connections opened, suggestion index built, WORKER_WARMUP_PATHS rendered into cache). With
+# GUNICORN_PRELOAD=1 the master imports the app once and runs PRELOAD_WARMUP before forking, so workers
+# share what it built; connections are never carried across the fork.
+WORKER_WARMUP = [
+    'api.lifecycle.connect_backends',
+    'api.lifecycle.build_suggest_index',
+    'api.lifecycle.warm_paths',
+]
+PRELOAD_WARMUP = [
+    'api.lifecycle.build_suggest_index',
+]
+WORKER_WARMUP_PATHS = [
+    '/api/genres/list/',
+    '/api/books/facets/',
+    '/api/books/popular/',
+]
+
+# Chapter comments (api.services.comments): Cassandra partitions per chapter and COMMENT_BUCKET_SECONDS
+# window, read newest first with cursor paging. Per-chapter comment and per-comment reply counts are kept
+# in comment_count counters and cached for COMMENT_COUNT_TIMEOUT seconds. Reports are totalled in Redis.
+COMMENT_BUCKET_SECONDS = 60 * 60 * 24 * 7
+COMMENT_PAGE_SIZE = 20
+COMMENT_MAX_PAGE_SIZE = 100
+COMMENT_MAX_LENGTH = 2000
+COMMENT_COUNT_TIMEOUT = 60 * 10
+
+# Library (api.library): follows are stored per user (library) and per book (book_follower); each user's
+# followed ids are mirrored into a Redis set for is_following, reloaded after LIBRARY_MIRROR_TTL seconds.
+# New chapters are fanned out to followers' inboxes by library.fanout jobs, LIBRARY_FANOUT_BATCH_SIZE
+# followers per job; inbox rows expire after LIBRARY_INBOX_TTL seconds.
+LIBRARY_MIRROR_TTL = 60 * 60 * 24
+LIBRARY_FANOUT_BATCH_SIZE = 500
+LIBRARY_INBOX_TTL = 60 * 60 * 24 * 30
+LIBRARY_PAGE_SIZE = 20
+LIBRARY_MAX_PAGE_SIZE = 100
+
+# Latest-updates feed (api.releases): chapter releases are written to release_event partitions of
+# RELEASE_BUCKET_SECONDS and expire after RELEASE_EVENT_TTL seconds. A page reads back from the cursor's
+# bucket through at most RELEASE_FEED_MAX_BUCKETS buckets, keeping each book's newest release once.
+RELEASE_BUCKET_SECONDS = 60 * 60 * 24
+RELEASE_FEED_MAX_BUCKETS = 7
+RELEASE_FEED_MAX_PAGE_SIZE = 100
+RELEASE_EVENT_TTL = 60 * 60 * 24 * 30
@@ -0,0 +1,293 @@
+"""
+Offline API benchmark.
+
+    python -m bench run [--iterations 200] [--endpoint book-list ...] [--output out.json]
+    python -m bench compare baseline.json candidate.json [--threshold 20]
+
+Every URL name in api/urls.py is requested through the real middleware
+stack against local stand-ins (see bench.settings). For each endpoint the
+run records latency percentiles, SQL queries and CQL statements per request
+and allocation sizes (tracemalloc, measured in a separate pass so tracing
+does not skew the timings), and writes them as JSON for later comparison.
+The checks in bench.endpoints run first on the seeded corpus; a failing
+check aborts the run, and any non-2xx response makes it exit with 1.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone as dt_timezone
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def mean(values):
+    return sum(values) / len(values) if values else None
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bench.settings')
+    import django
+    django.setup()
+
+
+class Runner:
+    def __init__(self, client, session, cold=False):
+        from django.core.cache import cache
+        self.client = client
+        self.session = session
+        self.cold = cold
+        self.cache = cache
+
+    def send(self, spec):
+        from rest_framework_simplejwt.tokens import AccessToken
+        headers = {}
+        if spec['user'] is not None:
+            headers['HTTP_AUTHORIZATION'] = f"Bearer {AccessToken.for_user(spec['user'])}"
+        method = spec['method'].lower()
+        data = spec['data']
+        if spec['content_type'] is None:
+            return lambda: getattr(self.client, method)(spec['path'], data, **headers, **spec['extra'])
+        if data is not None and spec['content_type'] == 'application/json':
+            data = json.dumps(data)
+        return lambda: getattr(self.client, method)(
+            spec['path'], data, content_type=spec['content_type'], **headers, **spec['extra'])
+
+    @staticmethod
+    def read_body(response):
+        if getattr(response, 'streaming', False):
+            return sum(len(chunk) for chunk in response.streaming_content)
+        return len(response.content)
+
+    def measure(self, recipe, ctx, iterations, warmup, alloc_iterations):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        # Every response of every pass is counted, so a recipe that errors anywhere shows up in the run
+        statuses = {}
+
+        def count(response):
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            return response
+
+        for iteration in range(warmup):
+            call = self.send(recipe(ctx, iteration))
+            self.read_body(count(call()))
+
+        latencies, sql, cql, rows_read, scans, sizes = [], [], [], [], [], []
+        for iteration in range(warmup, warmup + iterations):
+            call = self.send(recipe(ctx, iteration))
+            if self.cold:
+                self.cache.clear()
+            statements, read, scanned = self.session.statements, self.session.rows_read, self.session.scans
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = call()
+                size = self.read_body(response)
+                latencies.append((time.perf_counter() - start) * 1000)
+            count(response)
+            sql.append(len(queries))
+            cql.append(self.session.statements - statements)
+            rows_read.append(self.session.rows_read - read)
+            scans.append(self.session.scans - scanned)
+            sizes.append(size)
+
+        peaks, retained = [], []
+        tracemalloc.start()
+        try:
+            for iteration in range(warmup + iterations, warmup + iterations + alloc_iterations):
+                call = self.send(recipe(ctx, iteration))
+                if self.cold:
+                    self.cache.clear()
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                self.read_body(count(call()))
+                current, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - before)
+                retained.append(current - before)
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'status': statuses,
+            'latency_ms': {
+                'p50': percentile(latencies, 0.50),
+                'p90': percentile(latencies, 0.90),
+                'p99': percentile(latencies, 0.99),
+                'mean': mean(latencies),
+                'min': min(latencies) if latencies else None,
+                'max': max(latencies) if latencies else None,
+            },
+            'sql_queries': mean(sql),
+            'cql_statements': mean(cql),
+            'cql_rows_read': mean(rows_read),
+            'cql_scans': mean(scans),
+            'alloc_peak_kb': percentile(peaks, 0.50) / 1024 if peaks else None,
+            'alloc_retained_kb': percentile(retained, 0.50) / 1024 if retained else None,
+            'response_bytes': mean(sizes),
+        }
+
+
+def run(args):
+    setup_django()
+    from django.conf import settings
+    from django.test import Client
+    from django.urls import get_resolver
+    from api import urls as api_urls
+    from bench.corpus import seed_corpus
+    from bench.database import reset_database
+    from bench.endpoints import CHECKS, ENDPOINTS
+
+    reset_database()
+    session = settings.CASSANDRA_SESSION
+    session.reset()
+    get_resolver().url_patterns  # import views before timing anything
+    ctx = seed_corpus(books=args.books, largest_volumes=args.largest_volumes, max_volumes=args.max_volumes,
+                      chapters_per_volume=tuple(args.chapters_per_volume), seed=args.seed)
+
+    names = [pattern.name for pattern in api_urls.urlpatterns]
+    selected = [name for name in ENDPOINTS if name in names and (not args.endpoint or name in args.endpoint)]
+    runner = Runner(Client(raise_request_exception=False), session, cold=args.cold)
+
+    failed = [name for name, check in CHECKS.items() if not check(runner.client, ctx)]
+    if failed:
+        print(f"Checks failed: {', '.join(failed)}", file=sys.stderr)
+        return 1
+
+    results = {}
+    for name in selected:
+        print(f"{name} ...", end=' ', file=sys.stderr, flush=True)
+        results[name] = runner.measure(ENDPOINTS[name], ctx, args.iterations, args.warmup, args.alloc_iterations)
+        latency = results[name]['latency_ms']
+        print(f"p50 {latency['p50']:.2f} ms  p99 {latency['p99']:.2f} ms  {results[name]['status']}",
+              file=sys.stderr)
+
+    report = {
+        'meta': {
+            'created': datetime.now(dt_timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'cql_latency_ms': settings.BENCH_CQL_LATENCY_MS,
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'alloc_iterations': args.alloc_iterations,
+            'cold_cache': args.cold,
+            'corpus': {'books': args.books, 'largest_volumes': args.largest_volumes, 'max_volumes': args.max_volumes,
+                       'chapters_per_volume': args.chapters_per_volume, 'seed': args.seed},
+        },
+        'endpoints': results,
+        'not_covered': sorted(name for name in names if name not in ENDPOINTS),
+    }
+    output = args.output or f"bench-{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(output, 'w') as handle:
+        json.dump(report, handle, indent=2, sort_keys=True)
+    print(f"Results written to {output}", file=sys.stderr)
+    if report['not_covered']:
+        print(f"No request recipe for: {', '.join(report['not_covered'])}", file=sys.stderr)
+    errors = sorted(name for name, result in results.items()
+                    if any(not 200 <= int(code) < 300 for code in result['status']))
+    if errors:
+        print(f"Non-2xx responses from: {', '.join(errors)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def change(old, new):
+    if old is None or new is None:
+        return None
+    if old == 0:
+        return 0.0 if new == 0 else float('inf')
+    return (new - old) / old * 100
+
+
+def compare(args):
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    with open(args.candidate) as handle:
+        candidate = json.load(handle)
+
+    metrics = (
+        ('p50 ms', lambda result: result['latency_ms']['p50'], args.threshold),
+        ('p99 ms', lambda result: result['latency_ms']['p99'], args.threshold),
+        ('sql', lambda result: result['sql_queries'], 0),
+        ('cql', lambda result: result['cql_statements'], 0),
+        ('alloc kb', lambda result: result['alloc_peak_kb'], args.threshold),
+    )
+    regressions = []
+    header = f"{'endpoint':28}" + ''.join(f"{label:>24}" for label, _, _ in metrics)
+    print(header)
+    for name in sorted(set(baseline['endpoints']) | set(candidate['endpoints'])):
+        old, new = baseline['endpoints'].get(name), candidate['endpoints'].get(name)
+        if old is None or new is None:
+            print(f"{name:28}{'only in ' + ('candidate' if old is None else 'baseline'):>24}")
+            continue
+        cells = []
+        for label, getter, threshold in metrics:
+            before, after = getter(old), getter(new)
+            delta = change(before, after)
+            if delta is None:
+                cells.append(f"{'-':>24}")
+                continue
+            cells.append(f"{before:>9.2f} -> {after:>8.2f} {delta:+5.0f}%")
+            if delta > threshold:
+                regressions.append(f"{name} {label}")
+        print(f"{name:28}" + ''.join(cells))
+
+    if regressions:
+        print("\nRegressions: " + ', '.join(regressions))
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command')
+
+    run_parser = commands.add_parser('run', help='Benchmark the API endpoints')
+    run_parser.add_argument('--iterations', type=int, default=200)
+    run_parser.add_argument('--warmup', type=int, default=10)
+    run_parser.add_argument('--alloc-iterations', type=int, default=20)
+    run_parser.add_argument('--endpoint', action='append', help='URL name to run (repeatable); default all')
+    run_parser.add_argument('--cold', action='store_true', help='Clear the cache before every request')
+    run_parser.add_argument('--books', type=int, default=50)
+    run_parser.add_argument('--largest-volumes', type=int, default=20, help='Volumes of the sample (largest) book')
+    run_parser.add_argument('--max-volumes', type=int, default=5, help='Volume cap for the other books')
+    run_parser.add_argument('--chapters-per-volume', type=int, nargs=2, default=(10, 30), metavar=('MIN', 'MAX'))
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--output')
+
+    compare_parser = commands.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=20,
+                                help='Allowed latency/allocation increase in percent (query counts allow none)')
+
+    args = parser.parse_args(argv)
+    if args.command == 'compare':
+        return compare(args)
+    if args.command is None:
+        args = run_parser.parse_args([])
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+from django.contrib.auth.models import User
+from cassandra.cqlengine import connection
+from django.utils import timezone
+from api.library import fan_out, follow
+from api.models import Book, ChapterByVolume, Genre, Status, Volume
+from api.popularity import flush_view_counts, record_chapter_view
+from api.releases import record_release
+from api.services.comments import add_comment, add_reply
+from api.services.corpus import generate_corpus
+from api.suggest import rebuild_index
+
+
+FIRST_CHAPTER_QUERY = f"SELECT id, number, permalink FROM {ChapterByVolume.column_family_name()} WHERE volume_id = %s LIMIT 1"
+
+
+def seed_corpus(books=50, largest_volumes=20, max_volumes=5, chapters_per_volume=(10, 30), seed=1):
+    """
+    Generate the benchmark data set with the generate_corpus service and
+    return what the endpoint recipes need: users, a sample book (the
+    largest series), volume and chapter, and a comment and reply on it.
+    """
+    admin = User.objects.create_superuser('benchadmin', 'admin@bench.local', 'bench-password')
+    reader = User.objects.create_user('benchreader', 'reader@bench.local', 'bench-password')
+    generate_corpus(admin, seed=seed, books=books, largest_volumes=largest_volumes, max_volumes=max_volumes,
+                    chapters_per_volume=chapters_per_volume, paragraphs_per_chapter=(8, 20))
+
+    book = Book.objects.get(permalink__endswith='-0')
+    volumes = list(Volume.objects.filter(book=book).order_by('name'))
+    volume = volumes[len(volumes) // 2]
+    chapter = connection.get_session().execute(FIRST_CHAPTER_QUERY, [volume.id]).one()
+    seed_views(20)
+    comment, reply = seed_comments(book, chapter, reader, 30)
+    seed_library(reader, 20)
+    rebuild_index()  # built in the background on first use otherwise
+    return {
+        'admin': admin,
+        'reader': reader,
+        'book': book,
+        'volume': volume,
+        'chapter': chapter,
+        'comment': comment,
+        'reply': reply,
+        'genres': list(Genre.objects.all()),
+        'statuses': list(Status.objects.all()),
+    }
+
+
+def seed_views(count):
+    """Count reads of the first chapter of a few books and flush them, so the popular rankings have entries."""
+    session = connection.get_session()
+    volumes = Volume.objects.order_by('book_id', 'name')
+    seen = set()
+    for volume in volumes:
+        if volume.book_id in seen:
+            continue
+        seen.add(volume.book_id)
+        chapter = session.execute(FIRST_CHAPTER_QUERY, [volume.id]).one()
+        if chapter is not None:
+            for _ in range(len(seen)):
+                record_chapter_view(f"{volume.book_id}/{chapter['id']}")
+        if len(seen) >= count:
+            break
+    flush_view_counts()
+
+
+def seed_comments(book, chapter, user, count):
+    """Comment on the sample chapter and reply to the first comment; returns that comment and a reply."""
+    comments = [add_comment(chapter['id'], book.id, user, f"Bench comment {n}") for n in range(count)]
+    replies = [add_reply(comments[0], user, f"Bench reply {n}") for n in range(count)]
+    return comments[0], replies[0]
+
+
+def seed_library(user, count):
+    """
+    Release the first chapter of a few books, followed by user: a release
+    event for the latest-updates feed and an inbox row, as the
+    library.fanout job would write.
+    """
+    session = connection.get_session()
+    seen = set()
+    for volume in Volume.objects.order_by('book_id', 'name'):
+        if volume.book_id in seen:
+            continue
+        seen.add(volume.book_id)
+        follow(user.id, volume.book_id)
+        chapter = session.execute(FIRST_CHAPTER_QUERY, [volume.id]).one()
+        if chapter is not None:
+            name, now = f"Chapter {chapter['number']}", timezone.now()
+            record_release(volume.book_id, chapter['id'], name, chapter['permalink'], chapter['number'], now)
+            fan_out(volume.book_id, {'id': str(chapter['id']), 'name': name, 'permalink': chapter['permalink'],
+                                     'number': chapter['number'], 'created_at': now.isoformat()})
+        if len(seen) >= count:
+            break
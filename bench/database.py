@@ -0,0 +1,59 @@
+import os
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django_cassandra_engine.models import DjangoCassandraModel
+
+
+def trigrams(text):
+    padded = f"  {(text or '').lower()} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def similarity(left, right):
+    """pg_trgm similarity(), enough for the search query to run on SQLite."""
+    left, right = trigrams(left), trigrams(right)
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def install_sqlite_functions(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function('similarity', 2, similarity, deterministic=True)
+
+
+connection_created.connect(install_sqlite_functions)
+
+
+def reset_database():
+    """
+    Recreate the relational schema from scratch. The api app ships without
+    migrations, so its tables are created straight from the models, as is the
+    is_banned column that api.models adds to auth_user.
+    """
+    os.makedirs(settings.BENCH_DIR, exist_ok=True)
+    os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+    if connection.vendor == 'sqlite':
+        connection.close()
+        if os.path.exists(settings.DATABASES['default']['NAME']):
+            os.remove(settings.DATABASES['default']['NAME'])
+    else:
+        call_command('flush', interactive=False, verbosity=0)
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    call_command('migrate', verbosity=0)
+    existing = set(connection.introspection.table_names())
+    with connection.schema_editor() as editor:
+        for model in apps.get_app_config('api').get_models():
+            if issubclass(model, DjangoCassandraModel) or model._meta.db_table in existing:
+                continue
+            editor.create_model(model)
+        columns = {column.name for column in connection.introspection.get_table_description(
+            connection.cursor(), User._meta.db_table)}
+        if 'is_banned' not in columns:
+            editor.add_field(User, User._meta.get_field('is_banned'))
@@ -0,0 +1,151 @@
+"""
+One request recipe per URL name in api/urls.py. A recipe gets the corpus
+context and the iteration number and returns the request to send; anything
+it needs to set up (fresh tokens, a chapter to delete) happens here, outside
+the timed section. Reads are listed before writes so writes do not retire
+the caches the reads are measured against.
+"""
+import io
+import uuid
+from django.urls import reverse
+from PIL import Image
+from rest_framework_simplejwt.tokens import RefreshToken
+from api.models import Chapter
+from api.services.comments import add_comment, add_reply
+
+
+def request(method, path, data=None, user=None, content_type='application/json', **extra):
+    return {'method': method, 'path': path, 'data': data, 'user': user,
+            'content_type': content_type, 'extra': extra}
+
+
+def cover_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), (200, 120, 40)).save(buffer, format='PNG')
+    buffer.seek(0)
+    buffer.name = 'cover.png'
+    return buffer
+
+
+def new_chapter(ctx, iteration):
+    chapter = Chapter(book_id=ctx['book'].id, volume_id=ctx['volume'].id,
+                      name=f"Bench chapter {iteration}", content='Nội dung chương.')
+    chapter.save()
+    return chapter
+
+
+def new_comment(ctx, iteration):
+    return add_comment(ctx['chapter']['id'], ctx['book'].id, ctx['reader'], f"Bench comment {iteration}")
+
+
+def new_reply(ctx, iteration):
+    return add_reply(ctx['comment'], ctx['reader'], f"Bench reply {iteration}")
+
+
+def comment_kwargs(ctx, **extra):
+    return {'chapter_id': ctx['chapter']['id'], 'comment_id': ctx['comment']['id'], **extra}
+
+
+READS = {
+    'book-view': lambda ctx, i: request('GET', reverse('book-view', kwargs={'id': ctx['book'].id})),
+    'book-view-permalink': lambda ctx, i: request(
+        'GET', reverse('book-view-permalink', kwargs={'permalink': ctx['book'].permalink})),
+    'book-list': lambda ctx, i: request('GET', reverse('book-list') + '?page_size=20'),
+    'search-books': lambda ctx, i: request('GET', reverse('search-books') + '?q=kiem'),
+    'book-popular': lambda ctx, i: request('GET', reverse('book-popular') + '?period=week'),
+    'book-export': lambda ctx, i: request(
+        'GET', reverse('book-export', kwargs={'id': ctx['book'].id, 'export_format': 'jsonl'})),
+    'book-suggest': lambda ctx, i: request('GET', reverse('book-suggest') + ('?q=thien' if i % 2 else '?q=th')),
+    'book-facets': lambda ctx, i: request('GET', reverse('book-facets')),
+    'genre-list': lambda ctx, i: request('GET', reverse('genre-list')),
+    'volume-view': lambda ctx, i: request('GET', reverse('volume-view', kwargs={'id': ctx['volume'].id})),
+    'volume-list': lambda ctx, i: request(
+        'GET', reverse('volume-list', kwargs={'permalink': ctx['book'].permalink})),
+    'volume-list-all': lambda ctx, i: request('GET', reverse('volume-list-all', kwargs={'id': ctx['book'].id})),
+    # chapters/<uuid>/ resolves to chapter-update first, which has no GET, so the view is reached by permalink
+    'chapter-view': lambda ctx, i: request(
+        'GET', reverse('chapter-view-permalink', kwargs={'permalink': ctx['chapter']['permalink']})),
+    'chapter-view-permalink': lambda ctx, i: request(
+        'GET', reverse('chapter-view-permalink', kwargs={'permalink': ctx['chapter']['permalink']})),
+    'user-detail': lambda ctx, i: request('GET', reverse('user-detail', kwargs={'pk': ctx['reader'].pk})),
+    'me-detail': lambda ctx, i: request('GET', reverse('me-detail'), user=ctx['reader']),
+    'book-latest': lambda ctx, i: request('GET', reverse('book-latest') + '?page_size=20'),
+    'comment-list': lambda ctx, i: request(
+        'GET', reverse('comment-list', kwargs={'chapter_id': ctx['chapter']['id']})),
+    'reply-list': lambda ctx, i: request('GET', reverse('reply-list', kwargs=comment_kwargs(ctx))),
+    'comment-counts': lambda ctx, i: request('GET', reverse('comment-counts') + f"?chapters={ctx['chapter']['id']}"),
+    'library': lambda ctx, i: request('GET', reverse('library'), user=ctx['reader']),
+    'library-updates': lambda ctx, i: request('GET', reverse('library-updates'), user=ctx['reader']),
+}
+
+WRITES = {
+    'token_obtain_pair': lambda ctx, i: request(
+        'POST', reverse('token_obtain_pair'), {'username': 'benchreader', 'password': 'bench-password'}),
+    'login': lambda ctx, i: request(
+        'POST', reverse('login'), {'username': 'benchreader', 'password': 'bench-password'}),
+    'token_refresh': lambda ctx, i: request(
+        'POST', reverse('token_refresh'), {'refresh': str(RefreshToken.for_user(ctx['reader']))}),
+    'register': lambda ctx, i: request(
+        'POST', reverse('register'),
+        {'username': f"bench-user-{i}-{uuid.uuid4().hex[:6]}", 'password': 'bench-password',
+         'email': f"{uuid.uuid4().hex}@bench.local"}),
+    'logout': lambda ctx, i: request(
+        'POST', reverse('logout'), {'refresh': str(RefreshToken.for_user(ctx['reader']))}, user=ctx['reader']),
+    'book-create': lambda ctx, i: request(
+        'POST', reverse('book-create'),
+        {'title': f"Bench book {i}", 'description': 'Mô tả.', 'author': 'Bench',
+         'genres': [genre.id for genre in ctx['genres'][:2]], 'cover_image': cover_image()},
+        user=ctx['admin'], content_type=None),
+    'volume-create': lambda ctx, i: request(
+        'POST', reverse('volume-create'), {'book': str(ctx['book'].id), 'name': f"Bench volume {i}"},
+        user=ctx['admin']),
+    'chapter-create': lambda ctx, i: request(
+        'POST', reverse('chapter-create'),
+        {'book_id': str(ctx['book'].id), 'volume_id': str(ctx['volume'].id),
+         'name': f"Bench chapter {i}", 'content': 'Nội dung chương.'},
+        user=ctx['admin']),
+    'chapter-import': lambda ctx, i: request(
+        'POST', reverse('chapter-import'),
+        {'book_id': str(ctx['book'].id), 'volume_id': str(ctx['volume'].id),
+         'chapters': [{'name': f"Imported {i}-{n}", 'content': 'Nội dung chương.'} for n in range(10)]},
+        user=ctx['admin']),
+    'chapter-update': lambda ctx, i: request(
+        'PUT', reverse('chapter-update', kwargs={'pk': ctx['chapter']['id']}),
+        {'volume_id': str(ctx['volume'].id), 'name': f"Renamed {i}", 'content': 'Nội dung chương.'},
+        user=ctx['admin']),
+    'chapter-delete': lambda ctx, i: request(
+        'DELETE', reverse('chapter-delete', kwargs={'pk': new_chapter(ctx, i).id}), user=ctx['admin']),
+    'book-follow': lambda ctx, i: request(
+        'POST', reverse('book-follow', kwargs={'id': ctx['book'].id}), user=ctx['admin']),
+    'comment-report': lambda ctx, i: request(
+        'POST', reverse('comment-report', kwargs=comment_kwargs(ctx)), {'reason': 'spam'}, user=ctx['admin']),
+    'reply-report': lambda ctx, i: request(
+        'POST', reverse('reply-report', kwargs=comment_kwargs(ctx, reply_id=ctx['reply']['id'])), {'reason': 'spam'},
+        user=ctx['admin']),
+    'comment-detail': lambda ctx, i: request(
+        'DELETE', reverse('comment-detail', kwargs=comment_kwargs(ctx, comment_id=new_comment(ctx, i)['id'])),
+        user=ctx['admin']),
+    'reply-detail': lambda ctx, i: request(
+        'DELETE', reverse('reply-detail', kwargs=comment_kwargs(ctx, reply_id=new_reply(ctx, i)['id'])),
+        user=ctx['admin']),
+}
+
+ENDPOINTS = dict(READS, **WRITES)
+
+
+def check_view_ranking(client, ctx):
+    """A chapter read through the endpoint counts for its book in the all-time ranking once flushed."""
+    from api.popularity import ALL_TIME, flush_view_counts, get_redis, ranking_key
+
+    book_id = str(ctx['book'].id)
+    before = get_redis().zscore(ranking_key(ALL_TIME), book_id) or 0
+    client.get(reverse('chapter-view-permalink', kwargs={'permalink': ctx['chapter']['permalink']}))
+    flush_view_counts()
+    after = get_redis().zscore(ranking_key(ALL_TIME), book_id) or 0
+    return after > before
+
+
+# Run once on the seeded corpus before timing; a failed check fails the run
+CHECKS = {
+    'view-ranking': check_view_ranking,
+}
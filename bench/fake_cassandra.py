@@ -0,0 +1,790 @@
+"""
+In-memory stand-in for the Cassandra session behind cqlengine and
+connection.get_session().
+
+It understands the subset of CQL this project emits: partition reads with
+clustering ranges, IN and tuple relations, ORDER BY / LIMIT, COUNT(*),
+ALLOW FILTERING scans, inserts, counter updates, deletes and batches, with
+parameters bound as %s, %(name)s, ? or inlined literals. Table layouts
+(partition keys, clustering order, column types) are taken from the
+cqlengine models, so values are normalised the way the driver returns them.
+"""
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from itertools import product
+from types import SimpleNamespace
+
+from cassandra import InvalidRequest
+from cassandra.cluster import ResultSet, _ConfigMode
+from cassandra.encoder import Encoder
+from cassandra.query import BatchStatement, dict_factory
+
+
+TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<param>%\((?P<key>\w+)\)s|%s|\?)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<uuid>[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}(?![\w-]))
+  | (?P<blob>0[xX][0-9a-fA-F]*)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)
+  | (?P<quoted>"(?:[^"]|"")+")
+  | (?P<word>[A-Za-z_]\w*)
+  | (?P<symbol><=|>=|!=|[=<>(),.*+\-;\[\]{}:])
+""", re.X)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def tokenize(query):
+    tokens = []
+    position = 0
+    index = 0
+    while position < len(query):
+        match = TOKEN_RE.match(query, position)
+        if match is None:
+            raise InvalidRequest(f"Unsupported CQL near: {query[position:position + 30]!r}")
+        position = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'space':
+            continue
+        if kind == 'param':
+            if match.group('key') is not None:
+                text = match.group('key')
+            else:
+                text = index
+                index += 1
+        elif kind == 'string':
+            text = text[1:-1].replace("''", "'")
+        elif kind == 'uuid':
+            text = uuid.UUID(text)
+        elif kind == 'blob':
+            text = bytes.fromhex(text[2:])
+        elif kind == 'number':
+            text = float(text) if ('.' in text or 'e' in text.lower()) else int(text)
+        elif kind == 'quoted':
+            kind, text = 'name', text[1:-1].replace('""', '"')
+        elif kind == 'word':
+            kind = 'word'
+        tokens.append((kind, text))
+    return tokens
+
+
+class Parser:
+    """Recursive-descent parser producing plain dict statements."""
+
+    def __init__(self, query):
+        self.tokens = tokenize(query)
+        self.position = 0
+
+    def peek(self, offset=0):
+        position = self.position + offset
+        return self.tokens[position] if position < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def at_keyword(self, *words):
+        kind, text = self.peek()
+        return kind == 'word' and text.upper() in words
+
+    def accept_keyword(self, *words):
+        for offset, word in enumerate(words):
+            kind, text = self.peek(offset)
+            if kind != 'word' or text.upper() != word:
+                return False
+        self.position += len(words)
+        return True
+
+    def expect_keyword(self, *words):
+        if not self.accept_keyword(*words):
+            raise InvalidRequest(f"Expected {' '.join(words)} at {self.peek()!r}")
+
+    def accept_symbol(self, symbol):
+        if self.peek() == ('symbol', symbol):
+            self.position += 1
+            return True
+        return False
+
+    def expect_symbol(self, symbol):
+        if not self.accept_symbol(symbol):
+            raise InvalidRequest(f"Expected '{symbol}' at {self.peek()!r}")
+
+    def identifier(self):
+        kind, text = self.next()
+        if kind == 'name':
+            return text
+        if kind == 'word':
+            return text.lower()
+        raise InvalidRequest(f"Expected identifier, got {text!r}")
+
+    def table(self):
+        name = self.identifier()
+        if self.accept_symbol('.'):
+            name = self.identifier()
+        return name
+
+    def value(self):
+        kind, text = self.next()
+        if kind in ('param', 'string', 'uuid', 'blob', 'number'):
+            return ('param', text) if kind == 'param' else ('literal', text)
+        if kind == 'symbol' and text == '-':
+            kind, text = self.next()
+            return ('literal', -text)
+        if kind == 'symbol' and text in ('(', '[', '{'):
+            closing = {'(': ')', '[': ']', '{': '}'}[text]
+            items = []
+            while not self.accept_symbol(closing):
+                items.append(self.value())
+                self.accept_symbol(',')
+            return ('tuple', items)
+        if kind == 'word' and text.upper() in ('TRUE', 'FALSE'):
+            return ('literal', text.upper() == 'TRUE')
+        if kind == 'word' and text.upper() == 'NULL':
+            return ('literal', None)
+        raise InvalidRequest(f"Unsupported value {text!r}")
+
+    def parse(self):
+        statement = self.statement()
+        self.accept_symbol(';')
+        if self.peek()[0] is not None:
+            raise InvalidRequest(f"Unexpected trailing CQL at {self.peek()!r}")
+        return statement
+
+    def statement(self):
+        if self.accept_keyword('SELECT'):
+            return self.select()
+        if self.accept_keyword('INSERT', 'INTO'):
+            return self.insert()
+        if self.accept_keyword('UPDATE'):
+            return self.update()
+        if self.accept_keyword('DELETE'):
+            return self.delete()
+        if self.accept_keyword('BEGIN'):
+            return self.batch()
+        if self.accept_keyword('TRUNCATE'):
+            self.accept_keyword('TABLE')
+            return {'type': 'truncate', 'table': self.table()}
+        if self.at_keyword('CREATE', 'ALTER', 'DROP', 'USE'):
+            self.position = len(self.tokens)
+            return {'type': 'noop'}
+        raise InvalidRequest(f"Unsupported statement at {self.peek()!r}")
+
+    def select(self):
+        statement = {'type': 'select', 'columns': [], 'count': None, 'where': [], 'order': [],
+                     'limit': None, 'partition_limit': None, 'allow_filtering': False}
+        self.accept_keyword('DISTINCT')
+        while True:
+            if self.accept_symbol('*'):
+                statement['columns'] = None
+            elif self.at_keyword('COUNT') and self.peek(1) == ('symbol', '('):
+                self.position += 2
+                self.next()
+                self.expect_symbol(')')
+                statement['count'] = 'count'
+                if self.accept_keyword('AS'):
+                    statement['count'] = self.identifier()
+            else:
+                column = self.identifier()
+                alias = self.identifier() if self.accept_keyword('AS') else column
+                statement['columns'].append((column, alias))
+            if not self.accept_symbol(','):
+                break
+        self.expect_keyword('FROM')
+        statement['table'] = self.table()
+        if self.accept_keyword('WHERE'):
+            statement['where'] = self.conditions()
+        if self.accept_keyword('ORDER', 'BY'):
+            while True:
+                column = self.identifier()
+                descending = self.accept_keyword('DESC')
+                if not descending:
+                    self.accept_keyword('ASC')
+                statement['order'].append((column, descending))
+                if not self.accept_symbol(','):
+                    break
+        if self.accept_keyword('PER', 'PARTITION', 'LIMIT'):
+            statement['partition_limit'] = self.value()
+        if self.accept_keyword('LIMIT'):
+            statement['limit'] = self.value()
+        if self.accept_keyword('ALLOW', 'FILTERING'):
+            statement['allow_filtering'] = True
+        return statement
+
+    def conditions(self):
+        conditions = []
+        while True:
+            if self.accept_symbol('('):
+                columns = [self.identifier()]
+                while self.accept_symbol(','):
+                    columns.append(self.identifier())
+                self.expect_symbol(')')
+                columns = tuple(columns)
+            else:
+                columns = self.identifier()
+            if self.accept_keyword('IN'):
+                operator = 'IN'
+            elif self.accept_keyword('CONTAINS'):
+                operator = 'CONTAINS'
+            else:
+                kind, operator = self.next()
+                if kind != 'symbol' or operator not in ('=', '<', '>', '<=', '>=', '!='):
+                    raise InvalidRequest(f"Unsupported operator {operator!r}")
+            conditions.append((columns, operator, self.value()))
+            if not self.accept_keyword('AND'):
+                return conditions
+
+    def using(self):
+        if self.accept_keyword('USING'):
+            while True:
+                self.next()
+                self.value()
+                if not self.accept_keyword('AND'):
+                    break
+
+    def insert(self):
+        table = self.table()
+        self.expect_symbol('(')
+        columns = [self.identifier()]
+        while self.accept_symbol(','):
+            columns.append(self.identifier())
+        self.expect_symbol(')')
+        self.expect_keyword('VALUES')
+        values = self.value()[1]
+        if_not_exists = self.accept_keyword('IF', 'NOT', 'EXISTS')
+        self.using()
+        return {'type': 'insert', 'table': table, 'values': list(zip(columns, values)),
+                'if_not_exists': if_not_exists}
+
+    def update(self):
+        table = self.table()
+        self.using()
+        self.expect_keyword('SET')
+        assignments = []
+        while True:
+            column = self.identifier()
+            self.expect_symbol('=')
+            if self.peek()[0] in ('name', 'word') and self.peek(1) in (('symbol', '+'), ('symbol', '-')) \
+                    and not self.at_keyword('TRUE', 'FALSE', 'NULL'):
+                self.identifier()
+                sign = 1 if self.next()[1] == '+' else -1
+                assignments.append((column, sign, self.value()))
+            else:
+                assignments.append((column, 0, self.value()))
+            if not self.accept_symbol(','):
+                break
+        self.expect_keyword('WHERE')
+        where = self.conditions()
+        if_exists = self.accept_keyword('IF', 'EXISTS')
+        return {'type': 'update', 'table': table, 'assignments': assignments, 'where': where, 'if_exists': if_exists}
+
+    def delete(self):
+        columns = []
+        while not self.at_keyword('FROM'):
+            columns.append(self.identifier())
+            self.accept_symbol(',')
+        self.expect_keyword('FROM')
+        table = self.table()
+        self.using()
+        self.expect_keyword('WHERE')
+        where = self.conditions()
+        if_exists = self.accept_keyword('IF', 'EXISTS')
+        return {'type': 'delete', 'table': table, 'columns': columns, 'where': where, 'if_exists': if_exists}
+
+    def batch(self):
+        while not self.accept_keyword('BATCH'):
+            self.next()
+        self.using()
+        statements = []
+        while not self.accept_keyword('APPLY', 'BATCH'):
+            statements.append(self.statement())
+            self.accept_symbol(';')
+        return {'type': 'batch', 'statements': statements}
+
+
+def to_naive_utc(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def coerce(cql_type, value):
+    """Normalise a bound value the way it would come back from the driver."""
+    if value is None:
+        return None
+    if cql_type in ('uuid', 'timeuuid'):
+        return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+    if cql_type in ('int', 'bigint', 'smallint', 'tinyint', 'varint', 'counter'):
+        return int(value)
+    if cql_type in ('float', 'double', 'decimal'):
+        return float(value)
+    if cql_type in ('text', 'varchar', 'ascii'):
+        return str(value)
+    if cql_type == 'boolean':
+        return value if isinstance(value, bool) else str(value).lower() == 'true'
+    if cql_type == 'timestamp':
+        if isinstance(value, datetime):
+            return to_naive_utc(value)
+        if isinstance(value, (int, float)):
+            return EPOCH + timedelta(milliseconds=value)
+        return to_naive_utc(datetime.fromisoformat(str(value).replace('Z', '+00:00')))
+    if cql_type == 'date':
+        if isinstance(value, datetime):
+            return value.date()
+        return value if isinstance(value, date) else date.fromisoformat(str(value))
+    return value
+
+
+class Partition:
+    __slots__ = ('rows', 'order')
+
+    def __init__(self):
+        self.rows = {}
+        self.order = None
+
+    def ordered_keys(self, clustering):
+        if self.order is None:
+            keys = list(self.rows)
+            for position in reversed(range(len(clustering))):
+                keys.sort(key=lambda key: key[position], reverse=clustering[position][1])
+            self.order = keys
+        return self.order
+
+
+class Table:
+    def __init__(self, model):
+        self.name = model.column_family_name(include_keyspace=False)
+        self.types = {column.db_field_name: column.db_type for column in model._columns.values()}
+        self.partition_keys = [column.db_field_name for column in model._partition_keys.values()]
+        self.clustering = [(column.db_field_name, (column.clustering_order or 'ASC').upper() == 'DESC')
+                           for column in model._clustering_keys.values()]
+        self.clustering_keys = [name for name, _ in self.clustering]
+        self.primary_keys = set(self.partition_keys) | set(self.clustering_keys)
+        self.partitions = {}
+
+    def coerce(self, column, value):
+        if column not in self.types:
+            raise InvalidRequest(f"Undefined column name {column} in table {self.name}")
+        return coerce(self.types[column], value)
+
+    def key_values(self, restrictions, names):
+        """All key tuples allowed by =/IN restrictions, or None if not fully restricted."""
+        if not all(name in restrictions for name in names):
+            return None
+        return list(product(*(restrictions[name] for name in names)))
+
+
+class FakeCluster:
+    _config_mode = _ConfigMode.LEGACY
+    protocol_version = 4
+    schema_metadata_enabled = False
+
+    def __init__(self, session):
+        self.session = session
+        self.metadata = SimpleNamespace(keyspaces={session.keyspace: SimpleNamespace(tables={})})
+
+    def connect(self, keyspace=None):
+        return self.session
+
+    def register_user_type(self, keyspace, user_type, klass):
+        pass
+
+    def refresh_schema_metadata(self, *args, **kwargs):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class FakePreparedStatement:
+    def __init__(self, query_string, keyspace):
+        self.query_string = query_string
+        self.keyspace = keyspace
+        self.query_id = uuid.uuid4().bytes
+
+
+class FakeResponseFuture:
+    """Completed future; callbacks are delivered from the session's callback thread like the driver's."""
+
+    has_more_pages = False
+    _paging_state = None
+    _continuous_paging_session = None
+    _col_types = None
+
+    def __init__(self, session, query, rows=None, error=None):
+        self.session = session
+        self.query = query
+        self.row_factory = session.row_factory
+        self._rows = rows
+        self._error = error
+        self._col_names = list(rows[0]) if rows else None
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return ResultSet(self, self._rows)
+
+    def add_callback(self, fn, *args, **kwargs):
+        if self._error is None:
+            self.session.submit(fn, self._rows, *args, **kwargs)
+        return self
+
+    def add_errback(self, fn, *args, **kwargs):
+        if self._error is not None:
+            self.session.submit(fn, self._error, *args, **kwargs)
+        return self
+
+    def add_callbacks(self, callback, errback, callback_args=(), callback_kwargs=None,
+                      errback_args=(), errback_kwargs=None):
+        self.add_callback(callback, *callback_args, **(callback_kwargs or {}))
+        self.add_errback(errback, *errback_args, **(errback_kwargs or {}))
+
+    def clear_callbacks(self):
+        pass
+
+    def get_query_trace(self, *args, **kwargs):
+        return None
+
+    def get_all_query_traces(self, *args, **kwargs):
+        return []
+
+
+class FakeSession:
+    """
+    Drop-in for cassandra.cluster.Session. latency (seconds) is slept on every
+    request to model the network round trip; statements, rows_read and scans
+    are running counters the benchmark reads per request.
+    """
+
+    default_timeout = 10
+    default_fetch_size = 5000
+    default_consistency_level = None
+    default_serial_consistency_level = None
+
+    def __init__(self, keyspace, latency=0.0):
+        self.keyspace = keyspace
+        self.latency = latency
+        self.hosts = []
+        self.encoder = Encoder()
+        self.row_factory = dict_factory
+        self.cluster = FakeCluster(self)
+        self.statements = 0
+        self.rows_read = 0
+        self.scans = 0
+        self._tables = None
+        self._parsed = {}
+        self._lock = threading.RLock()
+        self._callbacks = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fake-cassandra')
+
+    # Session API
+
+    def execute(self, query, parameters=None, timeout=None, *args, **kwargs):
+        return self.execute_async(query, parameters).result()
+
+    def execute_async(self, query, parameters=None, *args, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            with self._lock:
+                self.statements += 1
+                rows = self.run(query, parameters)
+            return FakeResponseFuture(self, query, rows=rows)
+        except Exception as exc:
+            return FakeResponseFuture(self, query, error=exc)
+
+    def prepare(self, query, custom_payload=None, keyspace=None):
+        return FakePreparedStatement(query, keyspace or self.keyspace)
+
+    def set_keyspace(self, keyspace):
+        self.keyspace = keyspace
+
+    def submit(self, fn, *args, **kwargs):
+        return self._callbacks.submit(fn, *args, **kwargs)
+
+    def shutdown(self):
+        self._callbacks.shutdown(wait=False)
+
+    # Storage
+
+    @property
+    def tables(self):
+        if self._tables is None:
+            from cassandra.cqlengine.models import BaseModel
+            tables = {}
+            pending = list(BaseModel.__subclasses__())
+            while pending:
+                model = pending.pop()
+                pending.extend(model.__subclasses__())
+                if not model.__abstract__ and model._partition_keys:
+                    table = Table(model)
+                    tables[table.name] = table
+            self._tables = tables
+        return self._tables
+
+    def table(self, name):
+        try:
+            return self.tables[name]
+        except KeyError:
+            raise InvalidRequest(f"unconfigured table {name}")
+
+    def reset(self):
+        with self._lock:
+            for table in self.tables.values():
+                table.partitions.clear()
+            self.statements = self.rows_read = self.scans = 0
+
+    # Execution
+
+    def parse(self, query_string):
+        statement = self._parsed.get(query_string)
+        if statement is None:
+            if len(self._parsed) > 2048:
+                self._parsed.clear()
+            statement = self._parsed[query_string] = Parser(query_string).parse()
+        return statement
+
+    def run(self, query, parameters):
+        if isinstance(query, BatchStatement):
+            rows = []
+            for is_prepared, statement, values in query._statements_and_parameters:
+                if is_prepared:
+                    raise InvalidRequest("Prepared statements inside batches are not supported by the fake session")
+                rows = self.run(statement, values)
+            return rows
+        query_string = query if isinstance(query, str) else query.query_string
+        return self.apply(self.parse(query_string), parameters or ())
+
+    def apply(self, statement, parameters):
+        handler = getattr(self, f"apply_{statement['type']}")
+        return handler(statement, parameters)
+
+    def bind(self, value, parameters):
+        kind, content = value
+        if kind == 'literal':
+            return content
+        if kind == 'tuple':
+            return tuple(self.bind(item, parameters) for item in content)
+        try:
+            return parameters[content]
+        except (KeyError, IndexError, TypeError):
+            raise InvalidRequest(f"Missing value for bind marker {content!r}")
+
+    def restrictions(self, table, where, parameters):
+        """Split WHERE into =/IN key restrictions and row filters (column(s), operator, value)."""
+        restrictions, filters = {}, []
+        for columns, operator, value in where:
+            value = self.bind(value, parameters)
+            if isinstance(columns, tuple):
+                value = tuple(table.coerce(column, item) for column, item in zip(columns, value))
+            elif operator == 'IN':
+                value = [table.coerce(columns, item) for item in value]
+            elif operator != 'CONTAINS':
+                value = table.coerce(columns, value)
+            if isinstance(columns, str) and operator in ('=', 'IN') and columns in table.primary_keys:
+                restrictions[columns] = value if operator == 'IN' else [value]
+            filters.append((columns, operator, value))
+        return restrictions, filters
+
+    def matches(self, row, filters):
+        for columns, operator, value in filters:
+            if isinstance(columns, tuple):
+                current = tuple(row.get(column) for column in columns)
+                if None in current:
+                    return False
+            else:
+                current = row.get(columns)
+            if operator == '=':
+                if current != value:
+                    return False
+            elif operator == 'IN':
+                if current not in value:
+                    return False
+            elif operator == 'CONTAINS':
+                if current is None or value not in current:
+                    return False
+            elif current is None:
+                return False
+            elif operator == '<':
+                if not current < value:
+                    return False
+            elif operator == '>':
+                if not current > value:
+                    return False
+            elif operator == '<=':
+                if not current <= value:
+                    return False
+            elif operator == '>=':
+                if not current >= value:
+                    return False
+            elif operator == '!=':
+                if current == value:
+                    return False
+        return True
+
+    def candidate_partitions(self, table, restrictions):
+        keys = table.key_values(restrictions, table.partition_keys)
+        if keys is None:
+            self.scans += 1
+            return list(table.partitions.values())
+        return [table.partitions[key] for key in keys if key in table.partitions]
+
+    def iter_rows(self, table, partitions, filters, partition_limit=None):
+        for partition in partitions:
+            emitted = 0
+            for key in partition.ordered_keys(table.clustering):
+                row = partition.rows[key]
+                self.rows_read += 1
+                if self.matches(row, filters):
+                    yield partition, key, row
+                    emitted += 1
+                    if partition_limit and emitted >= partition_limit:
+                        break
+
+    def apply_select(self, statement, parameters):
+        table = self.table(statement['table'])
+        restrictions, filters = self.restrictions(table, statement['where'], parameters)
+        partitions = self.candidate_partitions(table, restrictions)
+        limit = self.bind(statement['limit'], parameters) if statement['limit'] else None
+        partition_limit = self.bind(statement['partition_limit'], parameters) if statement['partition_limit'] else None
+
+        rows = self.iter_rows(table, partitions, filters, partition_limit)
+        if statement['count']:
+            return [{statement['count']: sum(1 for _ in rows)}]
+
+        reverse = False
+        if statement['order']:
+            column, descending = statement['order'][0]
+            declared = dict(table.clustering)
+            if column not in declared:
+                raise InvalidRequest(f"Order by is currently only supported on the clustered columns, got {column}")
+            reverse = descending != declared[column]
+        if reverse or (statement['order'] and len(partitions) > 1):
+            selected = [row for _, _, row in rows]
+            if len(partitions) > 1:
+                clustering = table.clustering_keys
+                selected.sort(key=lambda row: tuple(row[name] for name in clustering))
+            if reverse:
+                selected.reverse()
+            if limit:
+                selected = selected[:limit]
+        else:
+            selected = []
+            for _, _, row in rows:
+                selected.append(row)
+                if limit and len(selected) >= limit:
+                    break
+
+        if statement['columns'] is None:
+            columns = [(name, name) for name in table.types]
+        else:
+            columns = statement['columns']
+        return [{alias: row.get(column) for column, alias in columns} for row in selected]
+
+    def primary_key_rows(self, table, where, parameters):
+        restrictions, filters = self.restrictions(table, where, parameters)
+        partition_keys = table.key_values(restrictions, table.partition_keys)
+        clustering_keys = table.key_values(restrictions, table.clustering_keys)
+        if partition_keys is None or clustering_keys is None:
+            raise InvalidRequest(f"Missing primary key restrictions for {table.name}")
+        return partition_keys, clustering_keys
+
+    def write_row(self, table, partition_key, clustering_key, create=True):
+        partition = table.partitions.get(partition_key)
+        if partition is None:
+            if not create:
+                return None
+            partition = table.partitions[partition_key] = Partition()
+        row = partition.rows.get(clustering_key)
+        if row is None:
+            if not create:
+                return None
+            row = dict.fromkeys(table.types)
+            row.update(zip(table.partition_keys, partition_key))
+            row.update(zip(table.clustering_keys, clustering_key))
+            partition.rows[clustering_key] = row
+            partition.order = None
+        return row
+
+    def apply_insert(self, statement, parameters):
+        table = self.table(statement['table'])
+        values = {column: table.coerce(column, self.bind(value, parameters))
+                  for column, value in statement['values']}
+        partition_key = tuple(values.get(name) for name in table.partition_keys)
+        clustering_key = tuple(values.get(name) for name in table.clustering_keys)
+        if None in partition_key or None in clustering_key:
+            raise InvalidRequest(f"Missing primary key value for {table.name}")
+        if statement['if_not_exists']:
+            existing = self.write_row(table, partition_key, clustering_key, create=False)
+            if existing is not None:
+                return [dict(existing, **{'[applied]': False})]
+        self.write_row(table, partition_key, clustering_key).update(values)
+        return [{'[applied]': True}] if statement['if_not_exists'] else []
+
+    def apply_update(self, statement, parameters):
+        table = self.table(statement['table'])
+        partition_keys, clustering_keys = self.primary_key_rows(table, statement['where'], parameters)
+        assignments = [(column, sign, table.coerce(column, self.bind(value, parameters)))
+                       for column, sign, value in statement['assignments']]
+        applied = True
+        for partition_key, clustering_key in product(partition_keys, clustering_keys):
+            row = self.write_row(table, partition_key, clustering_key, create=not statement['if_exists'])
+            if row is None:
+                applied = False
+                continue
+            for column, sign, value in assignments:
+                row[column] = (row[column] or 0) + sign * value if sign else value
+        return [{'[applied]': applied}] if statement['if_exists'] else []
+
+    def apply_delete(self, statement, parameters):
+        table = self.table(statement['table'])
+        restrictions, filters = self.restrictions(table, statement['where'], parameters)
+        partition_keys = table.key_values(restrictions, table.partition_keys)
+        if partition_keys is None:
+            raise InvalidRequest(f"Missing partition key restrictions for {table.name}")
+        found = False
+        for partition_key in partition_keys:
+            partition = table.partitions.get(partition_key)
+            if partition is None:
+                continue
+            for key in list(partition.ordered_keys(table.clustering)):
+                row = partition.rows[key]
+                if not self.matches(row, filters):
+                    continue
+                found = True
+                if statement['columns']:
+                    for column in statement['columns']:
+                        row[column] = None
+                else:
+                    del partition.rows[key]
+                    partition.order = None
+            if not partition.rows:
+                del table.partitions[partition_key]
+        return [{'[applied]': found}] if statement['if_exists'] else []
+
+    def apply_batch(self, statement, parameters):
+        for inner in statement['statements']:
+            self.apply(inner, parameters)
+        return []
+
+    def apply_truncate(self, statement, parameters):
+        self.table(statement['table']).partitions.clear()
+        return []
+
+    def apply_noop(self, statement, parameters):
+        return []
+
+
+def register_fake_session(alias, keyspace, latency=0.0):
+    """Register a FakeSession as the cqlengine connection django_cassandra_engine would otherwise open."""
+    from cassandra.cqlengine import connection, models
+
+    session = FakeSession(keyspace, latency=latency)
+    models.DEFAULT_KEYSPACE = keyspace
+    connection.register_connection(alias, session=session, default=True)
+    return session
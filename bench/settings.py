@@ -0,0 +1,98 @@
+"""
+Settings for the offline API benchmark (python -m bench).
+
+Same apps, middleware and API URLconf as production, with local stand-ins:
+SQLite (or PostgreSQL through BENCH_DB_*) for CockroachDB, an in-memory
+Cassandra session and fakeredis behind django_redis.
+"""
+import os
+import tempfile
+
+for name in ('DJ_SECRET_KEY', 'KEYSPACE_NAME', 'TOKEN', 'SECURE_CONNECT_FILE_PATH', 'LOCATION_URL',
+             'CRD_DB_NAME', 'CRD_USER', 'CRD_PASS', 'CRD_HOST', 'CRD_PORT', 'CRD_SSLROOTCERT_FILE',
+             'AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'BUCKET_NAME', 'AWS_S3_ENDPOINT_URL',
+             'AWS_S3_REGION_NAME', 'DEBUG'):
+    os.environ.setdefault(name, '')
+
+from backend.settings import *  # noqa: E402,F401,F403
+from decouple import config  # noqa: E402
+import fakeredis  # noqa: E402
+from bench.fake_cassandra import register_fake_session  # noqa: E402
+
+SECRET_KEY = 'bench-only-secret-key-not-for-production-use'
+SIMPLE_JWT = dict(SIMPLE_JWT, SIGNING_KEY=SECRET_KEY)
+DEBUG = False
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in ('django.contrib.admin', 'storages')]
+ROOT_URLCONF = 'bench.urls'
+
+BENCH_DIR = config('BENCH_DIR', default=os.path.join(tempfile.gettempdir(), 'doctruyen-bench'))
+
+if config('BENCH_DB_ENGINE', default='sqlite') == 'postgresql':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': config('BENCH_DB_NAME', default='doctruyen_bench'),
+        'USER': config('BENCH_DB_USER', default='postgres'),
+        'PASSWORD': config('BENCH_DB_PASSWORD', default=''),
+        'HOST': config('BENCH_DB_HOST', default='localhost'),
+        'PORT': config('BENCH_DB_PORT', default='5432'),
+    }
+else:
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BENCH_DIR, 'bench.sqlite3'),
+    }
+
+KEYSPACE = config('KEYSPACE_NAME') or 'doctruyen'
+DATABASES['cassandra'] = {
+    'ENGINE': 'django_cassandra_engine',
+    'NAME': KEYSPACE,
+    'HOST': '127.0.0.1',
+    'OPTIONS': {
+        'connection': {'lazy_connect': True},
+        'session': {'default_timeout': 30, 'default_fetch_size': 10000},
+    },
+}
+
+# Simulated round trip added to every CQL request, in milliseconds
+BENCH_CQL_LATENCY_MS = config('BENCH_CQL_LATENCY_MS', default=0, cast=float)
+
+# Registered before the apps load, so django_cassandra_engine finds the
+# connection already in place and never dials out.
+CASSANDRA_SESSION = register_fake_session('cassandra', KEYSPACE, latency=BENCH_CQL_LATENCY_MS / 1000)
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHES['default']['BACKEND'],
+        'LOCATION': 'redis://bench:6379/0',
+        'OPTIONS': dict(
+            CACHES['default'].get('OPTIONS', {}),
+            CONNECTION_POOL_KWARGS={'connection_class': fakeredis.FakeConnection},
+        ),
+    }
+}
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+MEDIA_ROOT = os.path.join(BENCH_DIR, 'media')
+MEDIA_URL = '/media/'
+STATIC_URL = '/static/'
+
+NGINX_PURGE_URL = ''
+
+# Every request still runs the throttle script, but the benchmark never runs out of tokens
+THROTTLE_RATES = {scope: {'capacity': 10 ** 9, 'rate': 10 ** 9} for scope in ('user', 'anon')}
+
+# The wildcard CSRF/CORS origins inherited from backend.settings fail the
+# system checks that management commands run against these settings
+SILENCED_SYSTEM_CHECKS = ['4_0.E001', 'corsheaders.E013']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'loggers': {
+        'django.request': {'level': 'CRITICAL'},
+    },
+}
@@ -0,0 +1,6 @@
+from django.urls import path, include
+
+# backend.urls without the admin site, which is not part of the benchmark
+urlpatterns = [
+    path('api/', include('api.urls')),
+]
@@ -1,5 +1,6 @@
 #!/bin/sh
 
-python manage.py collectstatic --no-input
+# Uploads only changed static files; a matching manifest makes this a single read
+[ "$SKIP_STATIC_SYNC" = "1" ] || python manage.py sync_static
 
-gunicorn backend.wsgi:application --bind 0.0.0.0:8000
+gunicorn -c gunicorn.conf.py
@@ -0,0 +1,60 @@
+# Gunicorn settings: `gunicorn -c gunicorn.conf.py` (see entrypoint.sh).
+#
+# GUNICORN_PRELOAD=1 imports the app once in the master and forks workers
+# from it, sharing the imported code copy-on-write. Connections and threads
+# the master holds are closed before the fork and reset in each worker
+# (api.lifecycle), which then opens its own and runs WORKER_WARMUP before
+# taking traffic. Each worker records its boot time and memory at "ready"
+# and at its first request: python manage.py boot_profile --workers
+
+import os
+import time
+
+
+wsgi_app = 'backend.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0') == '1'
+
+
+def when_ready(server):
+    # Only with preload has the master loaded the app; what it warms is inherited by every worker
+    if preload_app:
+        from django.conf import settings
+        from api.lifecycle import run_hooks
+
+        for path, seconds, ok in run_hooks(getattr(settings, 'PRELOAD_WARMUP', ())):
+            server.log.info("Preload warm-up %s: %.3fs%s", path, seconds, '' if ok else ' (failed)')
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        from api.lifecycle import before_fork
+
+        before_fork()
+
+
+def post_fork(server, worker):
+    worker.boot_started = time.time()
+    worker.served_first_request = False
+    if preload_app:
+        from api.lifecycle import after_fork
+
+        after_fork()
+
+
+def post_worker_init(worker):
+    from django.conf import settings
+    from api.lifecycle import report_worker, run_hooks
+
+    steps = run_hooks(getattr(settings, 'WORKER_WARMUP', ()))
+    report_worker('ready', worker.boot_started, preload=preload_app,
+                  warmup={path: round(seconds, 3) for path, seconds, _ in steps})
+
+
+def pre_request(worker, req):
+    if not worker.served_first_request:
+        from api.lifecycle import report_worker
+
+        worker.served_first_request = True
+        report_worker('first_request', worker.boot_started, preload=preload_app)